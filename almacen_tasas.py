@@ -0,0 +1,115 @@
+import os
+import sqlite3
+from contextlib import closing
+from datetime import date, datetime, timedelta
+
+
+# ==========================================
+# 💾 ALMACÉN LOCAL DE TASAS (SQLITE)
+# ==========================================
+class AlmacenTasas:
+    """Copia en disco del histórico de tasas (fecha 'YYYY-MM-DD' -> Bs por USD).
+
+    Cada operación abre su propia conexión, así se puede usar desde hilos
+    distintos sin compartir el objeto sqlite3.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        carpeta = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(carpeta, exist_ok=True)
+        with self._conectar() as con:
+            con.execute("CREATE TABLE IF NOT EXISTS tasas (fecha TEXT PRIMARY KEY, usd REAL NOT NULL)")
+            con.execute("CREATE TABLE IF NOT EXISTS meta (clave TEXT PRIMARY KEY, valor TEXT)")
+
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        return _Transaccion(con)
+
+    def todas(self):
+        with self._conectar() as con:
+            return {fecha: usd for fecha, usd in con.execute("SELECT fecha, usd FROM tasas")}
+
+    def ultima_fecha(self):
+        with self._conectar() as con:
+            fila = con.execute("SELECT MAX(fecha) FROM tasas").fetchone()
+        return fila[0] if fila else None
+
+    def tasa(self, fecha):
+        with self._conectar() as con:
+            fila = con.execute("SELECT usd FROM tasas WHERE fecha = ?", (fecha,)).fetchone()
+        return fila[0] if fila else None
+
+    def guardar(self, tasas):
+        if not tasas: return 0
+        with self._conectar() as con:
+            con.executemany(
+                "INSERT INTO tasas (fecha, usd) VALUES (?, ?) "
+                "ON CONFLICT(fecha) DO UPDATE SET usd = excluded.usd",
+                list(tasas.items()),
+            )
+        return len(tasas)
+
+    def leer_meta(self, clave):
+        with self._conectar() as con:
+            fila = con.execute("SELECT valor FROM meta WHERE clave = ?", (clave,)).fetchone()
+        return fila[0] if fila else None
+
+    def guardar_meta(self, clave, valor):
+        with self._conectar() as con:
+            con.execute(
+                "INSERT INTO meta (clave, valor) VALUES (?, ?) "
+                "ON CONFLICT(clave) DO UPDATE SET valor = excluded.valor",
+                (clave, valor),
+            )
+
+    def reemplazar_meta(self, clave, anterior, valor):
+        """Guarda `valor` solo si la clave sigue valiendo `anterior` (None: si no existe). True si lo guardó."""
+        with self._conectar() as con:
+            if anterior is None:
+                cursor = con.execute("INSERT OR IGNORE INTO meta (clave, valor) VALUES (?, ?)", (clave, valor))
+            else:
+                cursor = con.execute("UPDATE meta SET valor = ? WHERE clave = ? AND valor = ?", (valor, clave, anterior))
+        return cursor.rowcount == 1
+
+    def ultima_actualizacion(self):
+        valor = self.leer_meta("ultima_actualizacion")
+        if not valor: return None
+        try: return datetime.fromisoformat(valor)
+        except ValueError: return None
+
+    def marcar_actualizacion(self, momento=None):
+        momento = momento or datetime.now()
+        self.guardar_meta("ultima_actualizacion", momento.isoformat(timespec="seconds"))
+
+    def guardar_tasa_hoy(self, usd, fecha=None):
+        """Anota la tasa de hoy que dio una API (no va a `tasas`: ese es el histórico oficial)."""
+        self.guardar_meta("tasa_hoy", f"{fecha or date.today().isoformat()}={float(usd)!r}")
+
+    def tasa_hoy(self):
+        """La tasa de hoy anotada con guardar_tasa_hoy, o None si no hay una de hoy."""
+        fecha, _, usd = (self.leer_meta("tasa_hoy") or "").partition("=")
+        if fecha != date.today().isoformat(): return None
+        try: return float(usd)
+        except ValueError: return None
+
+    def vigente(self, ttl_horas):
+        """True si la última descarga está dentro del TTL y no hace falta ir a la API."""
+        ultima = self.ultima_actualizacion()
+        if ultima is None or ttl_horas <= 0: return False
+        return datetime.now() - ultima < timedelta(hours=ttl_horas)
+
+
+class _Transaccion:
+    # Conexión que hace commit/rollback y además se cierra al salir del "with"
+    def __init__(self, con):
+        self.con = con
+
+    def __enter__(self):
+        return self.con
+
+    def __exit__(self, tipo, valor, traza):
+        with closing(self.con):
+            if tipo is None: self.con.commit()
+            else: self.con.rollback()
+        return False
@@ -3,21 +3,96 @@ import streamlit as st
 import io
 import requests
 import openpyxl
-from datetime import datetime, timedelta
+from datetime import date, datetime
+import hashlib
 import os
 import re
-import unicodedata
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from itertools import islice
+import numpy as np
+import pandas as pd
+from almacen_tasas import AlmacenTasas
+from cache_hojas import CacheHojas, clave_archivo, especificacion, guardar_en_cache
+from cache_resultados import CacheResultados, clave_resultado
+from escritor_xlsx import ConjuntoCambios, aplicar_cambios, filas_declaradas, nombres_hojas, vaciar_hoja
+from etapas import Etapa, calentar, ejecutar_etapas, pool_etapas
+from fechas import LectorFechas, nombre_mes_es
+from formulas_excel import EvaluadorFormulas
+from incremental import HOJA_ESTADO, EstadoIncremental
+from instrumentacion import Instrumentacion
+from memo_proveedores import MemoProveedores
+from normalizacion import limpiar_monto, limpiar_montos, normalizar_texto
+from proveedores_tasas import AlmacenLocal, ApiDolarApi, ApiDolarVzla, CadenaTasas, HojaComportamientoTasa
+from trabajos import EN_COLA, TERMINADO, ColaTrabajos, trabajadores_cola
 
 
 
 # ==========================================
-# 🧠 UTILIDADES GENERALES
+# ⚙️ CONFIGURACIÓN
 # ==========================================
-def normalizar_texto(texto):
-    if not texto: return ""
-    texto = str(texto).upper().strip()
-    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+# Motor de la etapa DATA BS: "pandas" (columnar) o "celdas" (recorrido clásico celda a celda)
+MOTOR_DATA_BS = os.environ.get("PLATCO_MOTOR_DATA_BS", "pandas").strip().lower()
+
+# APIs de tasas (se pueden apuntar a un servidor local, p. ej. en benchmarks)
+URL_TASAS_HISTORICAS = os.environ.get("PLATCO_URL_HISTORICO", "https://api.dolarvzla.com/public/exchange-rate/list")
+URL_TASA_OFICIAL = os.environ.get("PLATCO_URL_TASA_HOY", "https://ve.dolarapi.com/v1/dolares/oficial")
+# Clave de api.dolarvzla.com: se configura en el servidor (nunca en el código). Sin ella el histórico
+# sale solo del almacén local y de la hoja COMPORTAMIENTO TASA del libro
+CLAVE_DOLARVZLA = os.environ.get("PLATCO_CLAVE_DOLARVZLA", "").strip()
+# Consultas de tasas: timeout por intento, intentos por proveedor y tiempo total de red por consulta
+TIMEOUT_TASAS = float(os.environ.get("PLATCO_TIMEOUT_TASAS", "5"))
+INTENTOS_TASAS = int(os.environ.get("PLATCO_INTENTOS_TASAS", "2"))
+PRESUPUESTO_TASAS_S = float(os.environ.get("PLATCO_PRESUPUESTO_TASAS_S", "12"))
+# Circuito: tras N consultas fallidas seguidas el proveedor se salta durante M segundos
+CIRCUITO_FALLOS = int(os.environ.get("PLATCO_CIRCUITO_FALLOS", "2"))
+CIRCUITO_ENFRIAMIENTO_S = float(os.environ.get("PLATCO_CIRCUITO_ENFRIAMIENTO_S", "300"))
+
+# Almacén local del histórico de tasas (SQLite)
+RUTA_ALMACEN_TASAS = os.environ.get("PLATCO_ALMACEN_TASAS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tasas.sqlite3"))
+# Horas durante las que el histórico local se usa sin volver a consultar la API (0 = consultar siempre)
+TTL_TASAS_HORAS = float(os.environ.get("PLATCO_TTL_TASAS_HORAS", "6"))
+# Sin conexión: las tasas se sirven solo desde el almacén local
+MODO_SIN_CONEXION = os.environ.get("PLATCO_SIN_CONEXION", "").strip().lower() in ("1", "true", "si", "sí")
+# Días hacia atrás que se arrastra la última tasa conocida (fines de semana y feriados)
+DIAS_ATRAS_TASA = int(os.environ.get("PLATCO_DIAS_ATRAS_TASA", "5"))
+# Guardado del resultado: "parches" (solo reescribe las hojas modificadas) u "openpyxl" (wb.save completo)
+ESCRITOR_SALIDA = os.environ.get("PLATCO_ESCRITOR", "parches").strip().lower()
+# Memo persistente proveedor -> (categoría, área) aprendido entre corridas (vacío = desactivado)
+RUTA_MEMO_PROVEEDORES = os.environ.get("PLATCO_MEMO_PROVEEDORES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "memo_proveedores.sqlite3"))
+# Modo incremental: solo se reprocesan los bloques de DATA BS que cambiaron desde la última corrida
+MODO_INCREMENTAL = os.environ.get("PLATCO_INCREMENTAL", "1").strip().lower() in ("1", "true", "si", "sí")
+# Perfilado opcional: cProfile + tracemalloc por etapa, volcado en CARPETA_PERFILES/<fecha>/
+PERFILAR = os.environ.get("PLATCO_PERFILAR", "").strip().lower() in ("1", "true", "si", "sí")
+CARPETA_PERFILES = os.environ.get("PLATCO_CARPETA_PERFILES", "perfiles")
+# Caché de resultados en memoria: libros idénticos (mismo diccionario y tasas) no se reprocesan (0 = sin caché)
+MAX_RESULTADOS_CACHE = int(os.environ.get("PLATCO_CACHE_RESULTADOS", "16"))
+CACHE_RESULTADOS_MB = float(os.environ.get("PLATCO_CACHE_RESULTADOS_MB", "256"))
+# Procesos del pool de etapas (el resumen semanal corre ahí en paralelo); 0 = todo en orden en el principal.
+# Cada trabajo de la cola tiene su propio pool, así que los núcleos se reparten entre los dos:
+# más procesos de etapas = cada libro termina antes, pero caben menos trabajos a la vez (ver MAX_TRABAJOS)
+NUCLEOS = os.cpu_count() or 1
+PROCESOS_ETAPAS = int(os.environ.get("PLATCO_PROCESOS_ETAPAS", "1" if NUCLEOS > 1 else "0"))
+# Trabajos que caben a la vez dejando a cada uno sus procesos de etapas
+TRABAJOS_CON_ETAPAS = max(1, NUCLEOS // (1 + PROCESOS_ETAPAS))
+# Procesos que ejecutan automatizaciones a la vez (0 = TRABAJOS_CON_ETAPAS). Con más, los núcleos
+# ya están ocupados por los trabajos y las etapas corren en orden (se avisa en el log de cada corrida)
+MAX_TRABAJOS = int(os.environ.get("PLATCO_MAX_TRABAJOS", "0")) or TRABAJOS_CON_ETAPAS
+# Modo flujo para DATA BS muy grandes: se lee por lotes y se escribe sin cargarla en memoria
+# ("auto" = solo si supera UMBRAL_FLUJO_FILAS, "1" = siempre, "0" = nunca)
+MODO_FLUJO = os.environ.get("PLATCO_MODO_FLUJO", "auto").strip().lower()
+UMBRAL_FLUJO_FILAS = int(os.environ.get("PLATCO_UMBRAL_FLUJO", "100000"))
+LOTE_FLUJO_FILAS = int(os.environ.get("PLATCO_LOTE_FLUJO", "4096"))
+# Caché en disco de DATA BS ya parseada (columnas binarias por huella del archivo): si se vuelve a
+# subir el mismo libro no se relee su XML. Solo libros desde CACHE_HOJAS_MIN_FILAS filas (vacío = desactivada)
+CARPETA_CACHE_HOJAS = os.environ.get("PLATCO_CACHE_HOJAS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache_hojas"))
+CACHE_HOJAS_MB = float(os.environ.get("PLATCO_CACHE_HOJAS_MB", "1024"))
+CACHE_HOJAS_MIN_FILAS = int(os.environ.get("PLATCO_CACHE_HOJAS_MIN_FILAS", "20000"))
 
+# ==========================================
+# 🧠 UTILIDADES GENERALES
+# ==========================================
 def obtener_hoja_flexible(wb, nombre_buscado):
     objetivo = normalizar_texto(nombre_buscado)
     for sheet_name in wb.sheetnames:
@@ -25,124 +100,331 @@ def obtener_hoja_flexible(wb, nombre_buscado):
             return wb[sheet_name]
     return None
 
-def cargar_diccionario_cuentas():
+def _leer_reglas(ws):
     reglas = []
-    ruta_diccionario = os.path.join(os.path.dirname(__file__), "diccionario.xlsx")
-    if not os.path.exists(ruta_diccionario): return []
+    for fila in ws.iter_rows(min_row=2, values_only=True):
+        if len(fila) >= 2 and fila[0] and fila[1]: 
+            reglas.append((str(fila[0]).strip().upper(), str(fila[1]).strip()))
+    reglas.sort(key=lambda x: len(x[0]), reverse=True)
+    return reglas
+
+def _leer_diccionario(ruta_diccionario):
+    # Una sola apertura del libro para las dos hojas (CATEGORIA y AREA)
+    if not os.path.exists(ruta_diccionario): return [], []
     try:
         wb = openpyxl.load_workbook(ruta_diccionario, read_only=True, data_only=True)
-        ws = obtener_hoja_flexible(wb, "CATEGORIA") or wb.active
-        for fila in ws.iter_rows(min_row=2, values_only=True):
-            if fila[0] and fila[1]: 
-                reglas.append((str(fila[0]).strip().upper(), str(fila[1]).strip()))
-        wb.close()
-        reglas.sort(key=lambda x: len(x[0]), reverse=True)
-        return reglas
-    except: return []
+        try:
+            ws_cat = obtener_hoja_flexible(wb, "CATEGORIA") or wb.active
+            ws_area = obtener_hoja_flexible(wb, "AREA")
+            return _leer_reglas(ws_cat), (_leer_reglas(ws_area) if ws_area else [])
+        finally:
+            wb.close()
+    except: return [], []
+
+def firma_archivo(ruta):
+    # Cambia cuando el archivo se modifica (fecha de modificación + tamaño)
+    try:
+        info = os.stat(ruta)
+        return (info.st_mtime_ns, info.st_size)
+    except OSError: return None
 
-def cargar_diccionario_areas():
-    reglas = []
+@st.cache_resource(show_spinner=False)
+def estado_cache_diccionario():
+    """Caché del diccionario compartida por todas las sesiones del servidor."""
+    return {"candado": threading.Lock(), "firma": None, "valor": None, "aciertos": 0, "fallos": 0}
+
+def cargar_diccionario(estado=None):
+    """Devuelve (reglas_cuentas, reglas_areas, clasificador) desde la caché compartida.
+
+    Solo se vuelve a leer diccionario.xlsx si cambió su firma en disco.
+    """
+    estado = estado or estado_cache_diccionario()
     ruta_diccionario = os.path.join(os.path.dirname(__file__), "diccionario.xlsx")
-    if not os.path.exists(ruta_diccionario): return []
-    try:
-        wb = openpyxl.load_workbook(ruta_diccionario, read_only=True, data_only=True)
-        ws = obtener_hoja_flexible(wb, "AREA")
-        if ws:
-            for fila in ws.iter_rows(min_row=2, values_only=True):
-                if fila[0] and fila[1]: 
-                    reglas.append((str(fila[0]).strip().upper(), str(fila[1]).strip()))
-        wb.close()
-        reglas.sort(key=lambda x: len(x[0]), reverse=True)
-        return reglas
-    except: return []
+    firma = firma_archivo(ruta_diccionario)
+    with estado["candado"]:
+        if estado["valor"] is not None and estado["firma"] == firma:
+            estado["aciertos"] += 1
+            return estado["valor"]
+        estado["fallos"] += 1
+        reglas_cuentas, reglas_areas = _leer_diccionario(ruta_diccionario)
+        estado["valor"] = (reglas_cuentas, reglas_areas, ClasificadorProveedores(reglas_cuentas, reglas_areas))
+        estado["firma"] = firma
+        return estado["valor"]
+
+def estadisticas_cache_diccionario(estado=None):
+    estado = estado or estado_cache_diccionario()
+    with estado["candado"]:
+        return {"aciertos": estado["aciertos"], "fallos": estado["fallos"]}
+
+def cargar_diccionario_cuentas():
+    return cargar_diccionario()[0]
+
+def cargar_diccionario_areas():
+    return cargar_diccionario()[1]
 
 # ==========================================
-# 🧠 CÁLCULO DE TASAS HISTÓRICAS (CON CLAVE PREMIUM)
+# 🔎 CLASIFICADOR DE PROVEEDORES (AHO-CORASICK)
 # ==========================================
-def cargar_tasas_historicas(callback_log):
-    memoria_tasas = {}
-    URL_HISTORICO = "https://api.dolarvzla.com/public/exchange-rate/list"
-    
-    # TU CLAVE DE ACCESO
-    MI_CLAVE = "c3d43e5237d9f133caf304f77e7097f79d93603e9cb90f789621706efbf1d7e4"
-    
-    # Preparamos el pase de entrada (Header)
-    headers = {
-        'x-dolarvzla-key': MI_CLAVE
-    }
-    
-    callback_log(f"🌍 Conectando al histórico oficial (Con llave)...")
+# Respaldo histórico cuando ninguna regla de CATEGORIA coincide (orden importa).
+RESPALDOS_CATEGORIA = [("COMISION", "GASTOS BANCARIOS"), ("IVA", "IMPUESTOS")]
+
+class ClasificadorProveedores:
+    """Autómata compilado con las reglas de CATEGORIA y AREA.
+
+    Una sola pasada por el texto del proveedor devuelve (categoria, area).
+    La prioridad es la misma de antes: la clave más larga gana y, a igual
+    longitud, la que aparece primero en el diccionario.
+    """
+
+    def __init__(self, reglas_cuentas, reglas_areas):
+        # Cada nodo: transiciones, enlace de fallo y mejor rango (cuenta, area)
+        self._hijos = [{}]
+        self._fallo = [0]
+        self._rango_cta = [None]
+        self._rango_area = [None]
+        self._valores_cta = [v for _, v in reglas_cuentas] + [v for _, v in RESPALDOS_CATEGORIA]
+        self._valores_area = [v for _, v in reglas_areas]
+        self._memo = {}
+        # Huella del contenido de las reglas: cambia si se edita el diccionario
+        self.version = hashlib.blake2b(repr((list(reglas_cuentas), list(reglas_areas))).encode("utf-8"), digest_size=8).hexdigest()
+
+        for rango, (clave, _) in enumerate(list(reglas_cuentas) + RESPALDOS_CATEGORIA):
+            self._insertar(clave, rango, self._rango_cta)
+        for rango, (clave, _) in enumerate(reglas_areas):
+            self._insertar(clave, rango, self._rango_area)
+        self._construir_fallos()
+
+    def _insertar(self, clave, rango, rangos):
+        nodo = 0
+        for letra in clave:
+            sig = self._hijos[nodo].get(letra)
+            if sig is None:
+                sig = len(self._hijos)
+                self._hijos[nodo][letra] = sig
+                self._hijos.append({})
+                self._fallo.append(0)
+                self._rango_cta.append(None)
+                self._rango_area.append(None)
+            nodo = sig
+        if rangos[nodo] is None or rango < rangos[nodo]:
+            rangos[nodo] = rango
+
+    def _construir_fallos(self):
+        # BFS: cada nodo hereda el mejor rango de su cadena de fallos
+        cola = list(self._hijos[0].values())
+        i = 0
+        while i < len(cola):
+            nodo = cola[i]; i += 1
+            for letra, hijo in self._hijos[nodo].items():
+                f = self._fallo[nodo]
+                while f and letra not in self._hijos[f]:
+                    f = self._fallo[f]
+                destino = self._hijos[f].get(letra, 0)
+                self._fallo[hijo] = destino if destino != hijo else 0
+                for rangos in (self._rango_cta, self._rango_area):
+                    heredado = rangos[self._fallo[hijo]]
+                    if heredado is not None and (rangos[hijo] is None or heredado < rangos[hijo]):
+                        rangos[hijo] = heredado
+                cola.append(hijo)
+
+    def clasificar(self, prov):
+        if prov in self._memo: return self._memo[prov]
+        hijos, fallo = self._hijos, self._fallo
+        mejor_cta, mejor_area = self._rango_cta[0], self._rango_area[0]
+        nodo = 0
+        for letra in prov:
+            while nodo and letra not in hijos[nodo]:
+                nodo = fallo[nodo]
+            nodo = hijos[nodo].get(letra, 0)
+            rc, ra = self._rango_cta[nodo], self._rango_area[nodo]
+            if rc is not None and (mejor_cta is None or rc < mejor_cta): mejor_cta = rc
+            if ra is not None and (mejor_area is None or ra < mejor_area): mejor_area = ra
+        resultado = (
+            self._valores_cta[mejor_cta] if mejor_cta is not None else None,
+            self._valores_area[mejor_area] if mejor_area is not None else None,
+        )
+        self._memo[prov] = resultado
+        return resultado
+
+def abrir_memo_proveedores(clasificador, callback_log):
+    """El clasificador envuelto en el memo persistente, o None si está desactivado o no se puede abrir."""
+    if not RUTA_MEMO_PROVEEDORES: return None
+    try: return MemoProveedores(RUTA_MEMO_PROVEEDORES, clasificador)
+    except Exception as e:
+        callback_log(f"⚠️ Memo de proveedores no disponible: {str(e)}")
+        return None
 
-    try:
-        # Enviamos la petición CON la clave
-        response = requests.get(URL_HISTORICO, headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            lista_datos = []
-
-            if isinstance(data, dict) and 'rates' in data:
-                lista_datos = data['rates']
-            elif isinstance(data, list):
-                lista_datos = data
-            
-            count = 0
-            for item in lista_datos:
-                fecha = item.get('date')
-                precio = item.get('usd')
-
-                if fecha and precio:
-                    fecha_limpia = str(fecha)[:10]
-                    memoria_tasas[fecha_limpia] = float(precio)
-                    count += 1
-            
-            callback_log(f"   ✅ Acceso concedido: {count} fechas históricas cargadas.")
-        else:
-            # Si la clave falla o expira, avisamos pero no detenemos el programa
-            callback_log(f"⚠️ Error de acceso al histórico ({response.status_code}). Usando solo tasa de hoy.")
+# ==========================================
+# 🌐 SESIÓN HTTP COMPARTIDA
+# ==========================================
+_sesion_http = None
+_candado_sesion = threading.Lock()
+
+def obtener_sesion_http():
+    # Una sola sesión con pool de conexiones para todas las consultas de tasas
+    global _sesion_http
+    with _candado_sesion:
+        if _sesion_http is None:
+            sesion = requests.Session()
+            adaptador = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            sesion.mount("https://", adaptador)
+            sesion.mount("http://", adaptador)
+            _sesion_http = sesion
+        return _sesion_http
 
+# ==========================================
+# 🔌 CADENA DE PROVEEDORES DE TASAS
+# ==========================================
+def abrir_almacen_tasas(callback_log):
+    try:
+        return AlmacenTasas(RUTA_ALMACEN_TASAS)
     except Exception as e:
-        callback_log(f"⚠️ Sin conexión al histórico: {str(e)}")
+        callback_log(f"⚠️ Almacén local de tasas no disponible: {str(e)}")
+        return None
+
+# Proveedores cuya tasa es la oficial del día (el resto son respaldos: almacén local, hoja del libro)
+PROVEEDORES_API = (ApiDolarApi.nombre, ApiDolarVzla.nombre)
+
+def cadena_tasas(almacen, respaldos=()):
+    """APIs (salvo sin conexión; dolarvzla solo con clave), almacén local y respaldos (p. ej. la hoja del libro), en ese orden."""
+    sesion = obtener_sesion_http()
+    proveedores = [] if MODO_SIN_CONEXION else [ApiDolarApi(URL_TASA_OFICIAL, sesion)]
+    if proveedores and CLAVE_DOLARVZLA: proveedores.append(ApiDolarVzla(URL_TASAS_HISTORICAS, CLAVE_DOLARVZLA, sesion))
+    if almacen: proveedores.append(AlmacenLocal(almacen))
+    proveedores.extend(respaldos)
+    return CadenaTasas(proveedores, timeout=TIMEOUT_TASAS, intentos=INTENTOS_TASAS, fallos_max=CIRCUITO_FALLOS,
+                       enfriamiento_s=CIRCUITO_ENFRIAMIENTO_S, presupuesto_s=PRESUPUESTO_TASAS_S, estado=almacen)
 
+# ==========================================
+# 🧠 CÁLCULO DE TASAS HISTÓRICAS (CON CLAVE PREMIUM)
+# ==========================================
+def cargar_tasas_historicas(callback_log, respaldos=()):
+    # Primero lo que ya tenemos en disco
+    almacen = abrir_almacen_tasas(callback_log)
+    try: memoria_tasas = almacen.todas() if almacen else {}
+    except Exception as e:
+        callback_log(f"⚠️ Almacén local de tasas no disponible: {str(e)}")
+        almacen, memoria_tasas = None, {}
+
+    if memoria_tasas and MODO_SIN_CONEXION:
+        callback_log(f"📴 Modo sin conexión: {len(memoria_tasas)} fechas desde el almacén local.")
+        return memoria_tasas
+
+    if almacen and memoria_tasas and almacen.vigente(TTL_TASAS_HORAS):
+        callback_log(f"💾 Histórico local vigente: {len(memoria_tasas)} fechas (sin consultar la API).")
+        return memoria_tasas
+
+    # Solo pedimos desde la fecha más nueva que ya tenemos (se repite ese día por si cambió)
+    desde = almacen.ultima_fecha() if almacen else None
+    if not MODO_SIN_CONEXION:
+        if CLAVE_DOLARVZLA: callback_log(f"🌍 Conectando al histórico oficial (Con llave)...")
+        else: callback_log("🔑 Sin PLATCO_CLAVE_DOLARVZLA: el histórico oficial no se consulta.")
+
+    nuevas, fuente = cadena_tasas(almacen, respaldos).historico(callback_log, desde)
+    if fuente is None:
+        callback_log(f"⚠️ Ningún proveedor dio el histórico. Usando {len(memoria_tasas)} fechas del almacén local.")
+        return memoria_tasas
+
+    memoria_tasas.update(nuevas)
+    if fuente == ApiDolarVzla.nombre:
+        if almacen:
+            try:
+                almacen.guardar(nuevas)
+                almacen.marcar_actualizacion()
+            except Exception as e:
+                callback_log(f"⚠️ No se pudo guardar el histórico local: {str(e)}")
+        callback_log(f"   ✅ Acceso concedido: {len(nuevas)} fechas nuevas ({len(memoria_tasas)} en total).")
+    else:
+        callback_log(f"   ↩️ Histórico desde {fuente}: {len(memoria_tasas)} fechas.")
     return memoria_tasas
 
+# Lector compartido para fechas sueltas (cada etapa usa uno propio por columna)
+LECTOR_FECHAS = LectorFechas("general")
+
 def formatear_fecha_para_api(valor_celda):
-    if not valor_celda: return None
-    try:
-        if isinstance(valor_celda, datetime): return valor_celda.strftime("%Y-%m-%d")
-        texto = str(valor_celda).strip()
-        formatos = ["%d/%m/%Y", "%Y-%m-%d", "%d-%m-%y", "%d-%m-%Y"]
-        for fmt in formatos:
-            try: return datetime.strptime(texto, fmt).strftime("%Y-%m-%d")
-            except: continue
-    except: return None
-    return None
+    return LECTOR_FECHAS.iso(valor_celda)
+
+def resolver_tasa_hoy(callback_log, respaldos=()):
+    """(tasa de hoy, proveedor que la dio) o (0, None). La que da una API queda anotada en el almacén."""
+    almacen = abrir_almacen_tasas(callback_log)
+    if not MODO_SIN_CONEXION: callback_log(f"🌍 Consultando Dólar Oficial en: {URL_TASA_OFICIAL}")
+    precio_dolar_hoy, fuente = cadena_tasas(almacen, respaldos).hoy(callback_log)
+    if not precio_dolar_hoy:
+        callback_log("❌ Error consultando tasa: ningún proveedor dio la tasa de hoy")
+        return 0, None
+    callback_log(f"💰 ¡TASA OBTENIDA!: {precio_dolar_hoy}" + ("" if fuente == ApiDolarApi.nombre else f" (desde {fuente})"))
+    if almacen and fuente in PROVEEDORES_API:
+        try: almacen.guardar_tasa_hoy(precio_dolar_hoy)
+        except Exception as e: callback_log(f"⚠️ No se pudo anotar la tasa de hoy en el almacén: {str(e)}")
+    return precio_dolar_hoy, fuente
+
+def consultar_tasa_oficial_hoy(callback_log, respaldos=()):
+    return resolver_tasa_hoy(callback_log, respaldos)[0]
 
-def buscar_tasa_inteligente(fecha_str, memoria_tasas):
-    if not fecha_str: return 0
-    if fecha_str in memoria_tasas: return memoria_tasas[fecha_str]
-    try:
-        dt_obj = datetime.strptime(fecha_str, "%Y-%m-%d")
-        for dias_atras in range(1, 6):
-            fecha_b = dt_obj - timedelta(days=dias_atras)
-            f_key = fecha_b.strftime("%Y-%m-%d")
-            if f_key in memoria_tasas: return memoria_tasas[f_key]
-    except: pass
-    return 0
-
-def limpiar_numero(valor):
-    if valor is None: return 0
-    if isinstance(valor, (int, float)): return float(valor)
-    texto = str(valor).strip()
-    if not texto or texto == "-": return 0
-    try:
-        return float(texto.replace(".", "").replace(",", "."))
-    except: return 0
+# ==========================================
+# 📆 CALENDARIO DE TASAS (RELLENO HACIA ADELANTE)
+# ==========================================
+
+class CalendarioTasas:
+    """Tasas precalculadas día a día, de la primera fecha conocida en adelante.
+
+    Los días sin tasa heredan la última publicada, como máximo `dias_atras`
+    días. Buscar una tasa es un índice sobre el arreglo, sin parsear fechas
+    en cada fila.
+    """
+
+    def __init__(self, memoria_tasas, dias_atras=None):
+        self.dias_atras = DIAS_ATRAS_TASA if dias_atras is None else dias_atras
+        conocidas = {}
+        for fecha, precio in memoria_tasas.items():
+            try: conocidas[datetime.strptime(str(fecha)[:10], "%Y-%m-%d").toordinal()] = float(precio)
+            except (TypeError, ValueError): continue
+        self._lector = LectorFechas("DATA BS B")
+        if not conocidas:
+            self.inicio, self.tasas = 0, np.zeros(0)
+            return
+        self.inicio = min(conocidas)
+        fin = max(conocidas) + self.dias_atras
+        self.tasas = np.zeros(fin - self.inicio + 1)
+        ultima, ultima_dia = 0.0, None
+        for i in range(len(self.tasas)):
+            dia = self.inicio + i
+            if dia in conocidas:
+                ultima, ultima_dia = conocidas[dia], dia
+            if ultima_dia is not None and dia - ultima_dia <= self.dias_atras:
+                self.tasas[i] = ultima
+
+    def ordinal(self, valor):
+        """Día ordinal de una celda de fecha: datetime/date, serial de Excel o texto."""
+        if isinstance(valor, (datetime, date)): return valor.toordinal()
+        iso = self._lector.iso(valor)
+        return date.fromisoformat(iso).toordinal() if iso else None
+
+    def tasa(self, valor):
+        dia = self.ordinal(valor)
+        if dia is None: return 0
+        i = dia - self.inicio
+        if 0 <= i < len(self.tasas): return float(self.tasas[i])
+        return 0
+
+    def buscar_lote(self, valores):
+        """Tasas de una columna completa de fechas (arreglo numpy, 0 = sin tasa)."""
+        valores = list(valores)
+        dias = np.full(len(valores), -1, dtype=np.int64)
+        vistos = {}
+        for n, v in enumerate(valores):
+            clave = (type(v), v)
+            if clave not in vistos:
+                vistos[clave] = self.ordinal(v)
+            if vistos[clave] is not None: dias[n] = vistos[clave]
+        indices = dias - self.inicio
+        validos = (dias >= 0) & (indices >= 0) & (indices < len(self.tasas))
+        resultado = np.zeros(len(valores))
+        resultado[validos] = self.tasas[indices[validos]]
+        return resultado
 
 def obtener_nombre_mes_es(mes_num):
-    meses = {1: "ENERO", 2: "FEBRERO", 3: "MARZO", 4: "ABRIL", 5: "MAYO", 6: "JUNIO",
-             7: "JULIO", 8: "AGOSTO", 9: "SEPTIEMBRE", 10: "OCTUBRE", 11: "NOVIEMBRE", 12: "DICIEMBRE"}
-    return meses.get(mes_num, "")
+    return nombre_mes_es(mes_num)
 
 from openpyxl.utils import get_column_letter
 from datetime import datetime
@@ -150,43 +432,151 @@ import re
 
 
 # ==========================================
-# 🛡️ CÓDIGO ORIGINAL (ANOCHE): RESUMEN SEMANAL
+# 📸 INSTANTÁNEA DEL LIBRO (UNA LECTURA POR EJECUCIÓN)
 # ==========================================
-# Solo procesa Ingresos. Solo usa DATA BS. No toca Excedentes.
+# Hojas cuyos valores calculados (data_only) leen las etapas
+HOJAS_INSTANTANEA = ("DATA BS", "MANEJO EXCEDENTE", "FLUJO DE CAJA", "APARTADOS")
+
+def leer_bytes_origen(origen):
+    # Acepta una ruta o un archivo subido (UploadedFile / BytesIO)
+    if hasattr(origen, "read"):
+        if hasattr(origen, "seek"): origen.seek(0)
+        return origen.read()
+    with open(origen, "rb") as f:
+        return f.read()
+
+def hoja_en_flujo(contenido, modo):
+    """Nombre de DATA BS si debe procesarse en modo flujo, si no None."""
+    if modo not in ("1", "auto"): return None
+    objetivo = normalizar_texto("DATA BS")
+    nombre = next((n for n in nombres_hojas(contenido) if normalizar_texto(n) == objetivo), None)
+    if nombre is None or modo == "1": return nombre
+    filas = filas_declaradas(contenido, nombre)
+    return nombre if filas and filas >= UMBRAL_FLUJO_FILAS else None
+
+def abrir_cache_hojas():
+    return CacheHojas(CARPETA_CACHE_HOJAS, CACHE_HOJAS_MB) if CARPETA_CACHE_HOJAS else None
+
+class InstantaneaLibro:
+    """El libro subido, leído una sola vez por ejecución.
+
+    - `wb`: libro editable (fórmulas), el que las etapas modifican y se guarda.
+    - `valores(hoja)`: valores calculados tal como venían en el archivo; cada
+      hoja se parsea como máximo una vez y queda en memoria.
+    - `formulas(hoja)`: filas del libro editable en su estado actual.
+    - `calculados(hoja)`: esas filas con las fórmulas calculadas en memoria
+      (ver formulas_excel); sirve aunque el archivo no traiga valores guardados.
+    - `cambios`: toda escritura de las etapas pasa por aquí (ver escritor_xlsx).
+    - `hoja_flujo`: en modo flujo, nombre de DATA BS; en `wb` esa hoja queda
+      vacía y se procesa por lotes desde `contenido`.
+    - `cache_hojas`: si DATA BS de este mismo archivo ya está en la caché de
+      hojas (ver cache_hojas), va en modo flujo y sus filas salen de ahí.
+    Las etapas piden los datos aquí en vez de abrir el archivo otra vez.
+    """
+
+    def __init__(self, origen, modo_flujo=None):
+        self.contenido = leer_bytes_origen(origen)
+        modo = MODO_FLUJO if modo_flujo is None else modo_flujo
+        cache = abrir_cache_hojas()
+        self.clave_cache = clave_archivo(self.contenido) if cache else None
+        self.cache_hojas = cache.abrir(self.clave_cache) if cache and modo != "0" else None
+        self.hoja_flujo = self.cache_hojas.hoja if self.cache_hojas else hoja_en_flujo(self.contenido, modo)
+        editable = vaciar_hoja(self.contenido, self.hoja_flujo) if self.hoja_flujo else self.contenido
+        self.wb = openpyxl.load_workbook(io.BytesIO(editable))
+        self.cambios = ConjuntoCambios()
+        self._wb_valores = None
+        self._valores = {}
+
+    def nombre_hoja(self, nombre, contiene=False):
+        objetivo = normalizar_texto(nombre)
+        for sheet_name in self.wb.sheetnames:
+            norm = normalizar_texto(sheet_name)
+            if norm == objetivo or (contiene and objetivo in norm):
+                return sheet_name
+        return None
+
+    def hoja(self, nombre, contiene=False):
+        sheet_name = self.nombre_hoja(nombre, contiene)
+        return self.wb[sheet_name] if sheet_name else None
+
+    def valores(self, nombre, min_row=1, max_row=None, contiene=False):
+        sheet_name = self.nombre_hoja(nombre, contiene)
+        if not sheet_name: return []
+        if sheet_name not in self._valores:
+            if self._wb_valores is None:
+                self._wb_valores = openpyxl.load_workbook(io.BytesIO(self.contenido), data_only=True, read_only=True)
+            self._valores[sheet_name] = list(self._wb_valores[sheet_name].iter_rows(values_only=True))
+        return self._valores[sheet_name][min_row - 1:max_row]
+
+    def columnas(self, nombre, indices, min_row=1, contiene=False):
+        """Valores calculados de algunas columnas, fila a fila y sin guardarlos en memoria.
+
+        Solo se devuelven las filas que llegan hasta la última columna pedida.
+        """
+        sheet_name = self.nombre_hoja(nombre, contiene)
+        if not sheet_name: return
+        vista = self.cache_hojas.vista(sheet_name, data_only=True, min_row=min_row, indices=indices) if self.cache_hojas else None
+        if vista is not None:
+            yield from vista.filas()
+            return
+        if self._wb_valores is None:
+            self._wb_valores = openpyxl.load_workbook(io.BytesIO(self.contenido), data_only=True, read_only=True)
+        ultima = max(indices)
+        for fila in self._wb_valores[sheet_name].iter_rows(min_row=min_row, values_only=True):
+            if len(fila) > ultima: yield tuple(fila[i] for i in indices)
+
+    def calculados(self, nombre, min_row=1, max_row=None, contiene=False):
+        """Filas del libro editable con sus fórmulas calculadas; devuelve (filas, evaluador).
+
+        Lo que el evaluador no soporta se toma de los valores guardados en el archivo.
+        """
+        ws = self.hoja(nombre, contiene)
+        evaluador = EvaluadorFormulas(self.wb, respaldo=self._valor_guardado, hojas_ausentes=(self.hoja_flujo,))
+        if ws is None: return [], evaluador
+        return list(evaluador.valores_filas(ws, min_row, max_row)), evaluador
+
+    def _valor_guardado(self, titulo, fila, columna):
+        filas = self.valores(titulo, min_row=fila, max_row=fila)
+        return filas[0][columna - 1] if filas and columna <= len(filas[0]) else None
+
+    def formulas(self, nombre, min_row=1, max_col=None, contiene=False):
+        ws = self.hoja(nombre, contiene)
+        if ws is None: return iter(())
+        return ws.iter_rows(min_row=min_row, max_col=max_col, values_only=True)
+
+    def filas_flujo(self, min_row=1, max_col=None):
+        """Filas de la hoja en flujo tal como vienen en el archivo (con fórmulas), sin cargarla entera."""
+        vista = self.cache_hojas.vista(self.hoja_flujo, min_row=min_row, max_col=max_col) if self.cache_hojas else None
+        if vista is not None:
+            yield from vista.filas()
+            return
+        wb = openpyxl.load_workbook(io.BytesIO(self.contenido), read_only=True)
+        try: yield from wb[self.hoja_flujo].iter_rows(min_row=min_row, max_col=max_col, values_only=True)
+        finally: wb.close()
+
+    def cerrar(self):
+        if self._wb_valores is not None:
+            self._wb_valores.close()
+            self._wb_valores = None
 
-def procesar_resumen_semanal(wb, ruta_excel, callback_log):
-    import re
-    import openpyxl
-    from openpyxl.utils import get_column_letter
-    import unicodedata
-
-    # 1. Utilidades Internas
-    def normalizar_texto_local(texto):
-        if not texto: return ""
-        texto = str(texto).upper().strip()
-        return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
-
-    def limpiar_numero(valor):
-        if valor is None: return 0
-        if isinstance(valor, (int, float)): return float(valor)
-        txt = str(valor).strip().upper().replace("BS", "").replace("USD", "").replace(" ", "")
-        es_neg = False
-        if "(" in txt and ")" in txt:
-            es_neg = True
-            txt = txt.replace("(", "").replace(")", "")
-        if "." in txt and "," in txt: txt = txt.replace(".", "").replace(",", ".")
-        elif "," in txt: txt = txt.replace(",", ".")
-        try: return -float(txt) if es_neg else float(txt)
-        except: return 0
-
-    ws_resumen = None
-    ws_data = None
-    for sheet in wb.sheetnames:
-        norm_sheet = normalizar_texto_local(sheet)
-        if "FLUJO DE CAJA" in norm_sheet:
-            ws_resumen = wb[sheet]
-        if "DATA BS" in norm_sheet:
-            ws_data = wb[sheet]
+# ==========================================
+# 📅 RESUMEN SEMANAL (PIVOTE PRECALCULADO)
+# ==========================================
+# Solo procesa Ingresos. Solo usa DATA BS. No toca Excedentes.
+CUENTAS_INGRESOS = ["CONTINUIDAD OPERATIVA", "SIMCARD", "ALIADOS COMERCIALES", "BANCO MERCANTIL 20% TX", "BANCO PROVINCIAL 20% TX"]
+PATRON_SEMANA = re.compile(r"SEMANA\s*(\d+)")
+
+def procesar_resumen_semanal(instantanea, callback_log):
+    semanas_por_texto = {}
+    def numero_semana(valor):
+        texto = str(valor).upper()
+        if texto not in semanas_por_texto:
+            match = PATRON_SEMANA.search(texto)
+            semanas_por_texto[texto] = int(match.group(1)) if match else None
+        return semanas_por_texto[texto]
+
+    ws_resumen = instantanea.hoja("FLUJO DE CAJA", contiene=True)
+    ws_data = instantanea.hoja("DATA BS", contiene=True)
             
     if not ws_resumen or not ws_data:
         callback_log("⚠️ Error: Faltan hojas (Resumen o Data BS).")
@@ -196,30 +586,22 @@ def procesar_resumen_semanal(wb, ruta_excel, callback_log):
 
     # --- LECTURA SEGURA: VALORES REALES (IGNORANDO FÓRMULAS) ---
     callback_log("⏳ Extrayendo datos de semanas y dólares (modo lectura)...")
-    data_bs_lista = []
-    try:
-        # Abrimos el archivo en modo "solo resultados"
-        wb_lectura = openpyxl.load_workbook(ruta_excel, data_only=True, read_only=True)
-        ws_data_L = None
-        for sheet in wb_lectura.sheetnames:
-            if "DATA BS" in normalizar_texto_local(sheet):
-                ws_data_L = wb_lectura[sheet]
-                break
-        
-        if ws_data_L:
-            # Pasamos todo a la memoria RAM rapidísimo
-            for row in ws_data_L.iter_rows(min_row=4, values_only=True):
-                data_bs_lista.append(row)
-        wb_lectura.close()
-    except Exception as e:
-        callback_log(f"❌ Error leyendo DATA BS: {str(e)}")
-        return 0
+    # Valores "solo resultados" de las columnas Q (semana), M (cuenta) y G (BS), fila a fila:
+    # DATA BS no se guarda entera en memoria
+    data_bs_columnas = instantanea.columnas("DATA BS", (16, 12, 6), min_row=4, contiene=True)
+
+    # Hoja Resumen completa en memoria: una sola pasada en vez de celda a celda
+    filas_resumen = list(instantanea.formulas("FLUJO DE CAJA", contiene=True))
+    def valor_resumen(r, c):
+        if r - 1 < len(filas_resumen) and c - 1 < len(filas_resumen[r - 1]):
+            return filas_resumen[r - 1][c - 1]
+        return None
 
     # 3. DETECTAR SEMANAS EN EL ENCABEZADO DE RESUMEN
     fila_encabezado = 0
     for r in range(1, 15):
         for c in range(1, 20): 
-            val = str(ws_resumen.cell(row=r, column=c).value).upper()
+            val = str(valor_resumen(r, c)).upper()
             if "SEMANA" in val and any(char.isdigit() for char in val):
                 fila_encabezado = r
                 break
@@ -231,11 +613,9 @@ def procesar_resumen_semanal(wb, ruta_excel, callback_log):
 
     semanas_config = [] 
     for col in range(2, ws_resumen.max_column + 1):
-        texto = str(ws_resumen.cell(row=fila_encabezado, column=col).value).upper()
-        match = re.search(r"SEMANA\s*(\d+)", texto)
-        if match:
-            num_semana = int(match.group(1))
-            sub = normalizar_texto_local(ws_resumen.cell(row=fila_encabezado+1, column=col).value)
+        num_semana = numero_semana(valor_resumen(fila_encabezado, col))
+        if num_semana is not None:
+            sub = normalizar_texto(valor_resumen(fila_encabezado + 1, col))
             col_est, col_act = 0, 0
             
             if "ACTUALIZACION" in sub or "DIARIA" in sub:
@@ -253,59 +633,60 @@ def procesar_resumen_semanal(wb, ruta_excel, callback_log):
         callback_log("⚠️ No detecté columnas válidas de Estimado/Actualización.")
         return 0
 
-    # 4. SUMAR REAL (DATA BS - LEYENDO DESDE LA MEMORIA)
+    # 4. PIVOTE (SEMANA, CUENTA) -> TOTAL EN UNA SOLA PASADA POR DATA BS
     acumulados_real = {cfg['semana']: {} for cfg in semanas_config}
+    cuentas_norm = {}
     
-    for row in data_bs_lista:
-        if len(row) < 17: continue # Aseguramos que la fila llega hasta la columna Q
-        
-        # Columna Q (Índice 16 en memoria)
-        val_semana = row[16]
-        if not val_semana: continue
-        
-        texto_semana = str(val_semana).upper()
-        match_sem = re.search(r"SEMANA\s*(\d+)", texto_semana)
-        if not match_sem: continue
-        semana_del_dato = int(match_sem.group(1))
-
-        # Columna M (Índice 12 en memoria)
-        cta = normalizar_texto_local(row[12])
-        if not cta: continue
-        
-        # Columna G (Índice 6 en memoria) - BS
-        monto = limpiar_numero(row[6])
-
-        if monto != 0 and semana_del_dato in acumulados_real:
-            if cta not in acumulados_real[semana_del_dato]: 
-                acumulados_real[semana_del_dato][cta] = 0
-            acumulados_real[semana_del_dato][cta] += monto
+    try:
+        for semana_txt, cuenta, monto_txt in data_bs_columnas:
+            # Columna Q
+            if not semana_txt: continue
+            semana_del_dato = numero_semana(semana_txt)
+            if semana_del_dato not in acumulados_real: continue
+
+            # Columna M
+            if cuenta not in cuentas_norm: cuentas_norm[cuenta] = normalizar_texto(cuenta)
+            cta = cuentas_norm[cuenta]
+            if not cta: continue
+
+            # Columna G - BS
+            monto = limpiar_monto(monto_txt)
+            if monto != 0:
+                acumulados_real[semana_del_dato][cta] = acumulados_real[semana_del_dato].get(cta, 0) + monto
+    except Exception as e:
+        callback_log(f"❌ Error leyendo DATA BS: {str(e)}")
+        return 0
 
-    # 5. ESCRIBIR EN RESUMEN
-    cuentas_ingresos = ["CONTINUIDAD OPERATIVA", "SIMCARD", "ALIADOS COMERCIALES", "BANCO MERCANTIL 20% TX", "BANCO PROVINCIAL 20% TX"]
+    # 5. FILAS DEL RESUMEN -> CUENTA DE INGRESO (escaneamos A, B, C por si el texto está indentado o movido)
     start_row = fila_encabezado + 2 
-    cambios = 0
-    
+    filas_cuenta = []
     for r in range(start_row, ws_resumen.max_row + 1):
-        # Escaneamos las primeras 3 columnas (A, B, C) por si el texto está indentado o movido
-        nombre = ""
         for c in range(1, 4):
-            val_cta = ws_resumen.cell(row=r, column=c).value
+            val_cta = valor_resumen(r, c)
             if val_cta:
-                nombre_temp = normalizar_texto_local(val_cta)
-                if any(cta_valida in nombre_temp for cta_valida in cuentas_ingresos):
-                    nombre = nombre_temp
+                nombre_temp = normalizar_texto(val_cta)
+                if any(cta_valida in nombre_temp for cta_valida in CUENTAS_INGRESOS):
+                    filas_cuenta.append((r, nombre_temp))
                     break
-        
-        if not nombre: continue # Si no encuentra cuenta válida, salta a la siguiente fila
 
+    # Cuenta acumulada -> nombres del resumen que la absorben (coincidencia en ambos sentidos)
+    nombres = {nombre for _, nombre in filas_cuenta}
+    todas_cuentas = {k for cuentas in acumulados_real.values() for k in cuentas}
+    nombres_de_cuenta = {k: [n for n in nombres if n in k or k in n] for k in todas_cuentas}
+
+    # Total real por (semana, nombre), sumando en el mismo orden de acumulación
+    reales = {}
+    for num_sem, cuentas in acumulados_real.items():
+        por_nombre = reales.setdefault(num_sem, {})
+        for k, v in cuentas.items():
+            for n in nombres_de_cuenta[k]:
+                por_nombre[n] = por_nombre.get(n, 0) + v
+
+    # 6. ESCRIBIR EN RESUMEN
+    cambios = 0
+    for r, nombre in filas_cuenta:
         for cfg in semanas_config:
-            num_sem = cfg['semana']
-            monto_real = 0
-            
-            for k, v in acumulados_real[num_sem].items():
-                if nombre in k or k in nombre: 
-                    monto_real += v
-            
+            monto_real = reales[cfg['semana']].get(nombre, 0)
             valor_estimado = ws_resumen.cell(row=r, column=cfg['col_est']).value
             
             # Si hay estimado manual o hubo movimientos reales, reescribimos la fórmula
@@ -314,53 +695,34 @@ def procesar_resumen_semanal(wb, ruta_excel, callback_log):
                 monto_formateado = round(monto_real, 2)
                 
                 # FÓRMULA: =ESTIMADO - REAL
-                ws_resumen.cell(row=r, column=cfg['col_act']).value = f"={letra_est}{r}-{monto_formateado}"
-                ws_resumen.cell(row=r, column=cfg['col_act']).number_format = '#,##0.00'
+                instantanea.cambios.escribir(ws_resumen, r, cfg['col_act'], f"={letra_est}{r}-{monto_formateado}", '#,##0.00')
                 cambios += 1
 
     return cambios
 
 
-def procesar_conciliacion_compleja(wb, ruta_excel, callback_log):
-    from datetime import datetime
-    import openpyxl
-
-    # 1. Limpiador de números
-    def limpiar_venezuela(valor):
-        if not valor: return 0
-        if isinstance(valor, (int, float)): return float(valor)
-        txt = str(valor).strip().upper().replace("BS", "").replace("USD", "").replace(" ", "")
-        es_neg = False
-        if "(" in txt and ")" in txt:
-            es_neg = True
-            txt = txt.replace("(", "").replace(")", "")
-        if "." in txt and "," in txt: txt = txt.replace(".", "").replace(",", ".")
-        elif "," in txt: txt = txt.replace(",", ".")
-        try: return -float(txt) if es_neg else float(txt)
-        except: return 0
-
-    # 2. Extractor de Mes Inteligente
-    def extraer_mes_inteligente(valor_fecha):
-        if not valor_fecha: return ""
-        if isinstance(valor_fecha, datetime): return obtener_nombre_mes_es(valor_fecha.month)
-        
-        txt = str(valor_fecha).strip().upper()
-        
-        for i in range(1, 13):
-            nombre = obtener_nombre_mes_es(i)
-            if nombre in txt: return nombre
-            
-        formatos = ["%d/%m/%Y", "%Y-%m-%d", "%d-%m-%y", "%d-%m-%Y", "%d/%m/%y", "%m/%d/%Y", "%m-%Y", "%m/%Y"]
-        txt_solo_fecha = txt.split(" ")[0]
-        for fmt in formatos:
-            try: return obtener_nombre_mes_es(datetime.strptime(txt_solo_fecha, fmt).month)
-            except: pass
-            
-        abreviaturas = {"ENE": "ENERO", "FEB": "FEBRERO", "MAR": "MARZO", "ABR": "ABRIL", "MAY": "MAYO", "JUN": "JUNIO", "JUL": "JULIO", "AGO": "AGOSTO", "SEP": "SEPTIEMBRE", "OCT": "OCTUBRE", "NOV": "NOVIEMBRE", "DIC": "DICIEMBRE"}
-        for abrv, completo in abreviaturas.items():
-            if abrv in txt: return completo
-
-        return normalizar_texto(txt)
+def aportes_data_bs(filas, lector, desplazamiento=0):
+    """Filas de DATA BS que suman en APARTADOS: [n, banco normalizado, mes, monto].
+
+    Solo cuentas ESPECIALIZAD.; n es la posición de la fila (desde la 4) y
+    sirve para sumar en el mismo orden que el recorrido original.
+    """
+    aportes = []
+    for n, fila_d in enumerate(filas, start=desplazamiento):
+        d_monto = limpiar_monto(fila_d[6])
+        if d_monto == 0: continue
+        if "ESPECIALIZAD" not in normalizar_texto(fila_d[12]): continue
+        mes_fila = lector.mes(fila_d[1])
+        if not mes_fila: continue
+        aportes.append([n, normalizar_texto(fila_d[9]), mes_fila, d_monto])
+    return aportes
+
+def procesar_conciliacion_compleja(instantanea, callback_log, aportes=None):
+    """Calcula APARTADOS!C. aportes: los de aportes_data_bs ya calculados (modo incremental)."""
+    # 2. Extractor de Mes Inteligente (un lector por columna: formato detectado y memoizado)
+    lector_data_bs = LectorFechas("DATA BS B")
+    lector_apartados = LectorFechas("APARTADOS E")
+    lector_excedentes = LectorFechas("MANEJO EXCEDENTE C")
 
     # 3. Matcher de Bancos Flexible
     def bancos_coinciden(b1, b2):
@@ -369,34 +731,84 @@ def procesar_conciliacion_compleja(wb, ruta_excel, callback_log):
         if "MERCANTIL" in b1 and "MERCANTIL" in b2: return True
         return (b1 in b2) or (b2 in b1)
 
-    ws_apartados = obtener_hoja_flexible(wb, "APARTADOS")
-    ws_data = obtener_hoja_flexible(wb, "DATA BS")
+    ws_apartados = instantanea.hoja("APARTADOS")
+    ws_data = instantanea.hoja("DATA BS")
 
     if not ws_apartados or not ws_data:
         callback_log("⚠️ Error: Faltan hojas base.")
         return 0 
 
-    # --- LECTURA SEGURA: FÓRMULAS DIRECTO DEL ARCHIVO ORIGINAL ---
-    callback_log("⏳ Extrayendo fórmulas de Excedentes (sin bloqueos)...")
+    # --- LECTURA SEGURA: FÓRMULAS CALCULADAS SOBRE EL LIBRO YA CARGADO ---
+    callback_log("⏳ Calculando fórmulas de Excedentes (sin bloqueos)...")
     excedentes_lista = []
     try:
-        # Lee el archivo directamente del disco (rápido y a prueba de errores)
-        wb_lectura = openpyxl.load_workbook(ruta_excel, data_only=True, read_only=True)
-        ws_exc_L = obtener_hoja_flexible(wb_lectura, "MANEJO EXCEDENTE")
-        if ws_exc_L:
-            for row in ws_exc_L.iter_rows(min_row=4, max_row=2000, values_only=True):
-                excedentes_lista.append(row)
-        wb_lectura.close() # Cierra inmediatamente
+        # La columna H se calcula aquí: los libros guardados por openpyxl (como nuestra
+        # propia salida) no traen el valor de las fórmulas
+        excedentes_lista, evaluador = instantanea.calculados("MANEJO EXCEDENTE", min_row=4, max_row=2000)
     except Exception as e:
         callback_log(f"❌ Error leyendo fórmulas: {str(e)}")
         return 0
+    if evaluador.calculadas or evaluador.con_respaldo:
+        callback_log(f"🧮 Excedentes: {evaluador.calculadas} fórmulas calculadas, {evaluador.con_respaldo} con el valor guardado")
+
+    # --- PRE-AGREGACIÓN: UNA SOLA PASADA POR DATA BS Y EXCEDENTES ---
+    # (banco normalizado, mes) -> [(fila, monto)] solo con cuentas ESPECIALIZAD.
+    # Se guardan las filas para sumar en el mismo orden que el recorrido original.
+    if aportes is None:
+        aportes = aportes_data_bs(instantanea.formulas("DATA BS", min_row=4, max_col=13), lector_data_bs)
+    indice_data_bs = {}
+    for n, banco, mes_fila, d_monto in aportes:
+        indice_data_bs.setdefault((banco, mes_fila), []).append((n, d_monto))
+
+    # (tiene BP/PROVINCIAL, tiene BM/MERCANTIL, mes) -> [(fila, monto H)]
+    indice_excedentes = {}
+    for n, row_exc in enumerate(excedentes_lista):
+        if len(row_exc) < 8: continue
+        if not row_exc[1]: continue # Columna B (Índice 1)
+        e_desc = normalizar_texto(row_exc[1])
+        if "ESPECIALIZAD" not in e_desc: continue
+        mes_exc = lector_excedentes.mes(row_exc[2]) # Columna C (Índice 2)
+        if not mes_exc: continue
+        monto_h = limpiar_monto(row_exc[7]) # Columna H (Índice 7)
+        if monto_h == 0: continue
+        e_desc_clean = e_desc.replace(" ", "").replace(".", "")
+        es_bp = "BP" in e_desc_clean or "PROVINCIAL" in e_desc_clean
+        es_bm = "BM" in e_desc_clean or "MERCANTIL" in e_desc_clean
+        indice_excedentes.setdefault((es_bp, es_bm, mes_exc), []).append((n, monto_h))
+
+    def meses_coinciden(m1, m2):
+        return bool(m1 and m2 and (m1 in m2 or m2 in m1))
+
+    def sumar_en_orden(grupos):
+        suma = 0
+        for _, monto in sorted(m for grupo in grupos for m in grupo):
+            suma += monto
+        return suma
+
+    sumas_resueltas = {}
+    def resolver_sumas(banco_objetivo, mes_objetivo):
+        clave = (banco_objetivo, mes_objetivo)
+        if clave not in sumas_resueltas:
+            # --- PASO A: Sumar Egresos (DATA BS) ---
+            suma_data_bs = sumar_en_orden(
+                filas for (d_banco, mes_fila), filas in indice_data_bs.items()
+                if bancos_coinciden(banco_objetivo, d_banco) and meses_coinciden(mes_objetivo, mes_fila)
+            )
+            # --- PASO B: Sumar Ingresos (MANEJO EXCEDENTE) ---
+            es_provincial = "PROVINCIAL" in banco_objetivo
+            es_mercantil = "MERCANTIL" in banco_objetivo
+            suma_excedente = sumar_en_orden(
+                filas for (es_bp, es_bm, mes_exc), filas in indice_excedentes.items()
+                if ((es_provincial and es_bp) or (es_mercantil and es_bm)) and meses_coinciden(mes_objetivo, mes_exc)
+            )
+            sumas_resueltas[clave] = (suma_data_bs, suma_excedente)
+        return sumas_resueltas[clave]
 
     cambios = 0
     
     # Recorremos hoja APARTADOS
     for fila in range(4, ws_apartados.max_row + 1):
         celda_banco = ws_apartados.cell(row=fila, column=2)
-        celda_monto = ws_apartados.cell(row=fila, column=3)
         celda_concepto = ws_apartados.cell(row=fila, column=4)
         celda_mes = ws_apartados.cell(row=fila, column=5)
         
@@ -404,58 +816,13 @@ def procesar_conciliacion_compleja(wb, ruta_excel, callback_log):
         
         if "ESPECIALIZAD" in concepto:
             banco_objetivo = normalizar_texto(celda_banco.value) 
-            mes_objetivo = extraer_mes_inteligente(celda_mes.value)
-
-            # --- PASO A: Sumar Egresos (DATA BS) ---
-            suma_data_bs = 0
-            for r in range(4, ws_data.max_row + 1):
-                val_cta = ws_data.cell(row=r, column=13).value
-                val_banco = ws_data.cell(row=r, column=10).value
-                d_fecha = ws_data.cell(row=r, column=2).value
-                
-                d_cuenta = normalizar_texto(val_cta)
-                d_banco = normalizar_texto(val_banco)
-                d_monto = limpiar_venezuela(ws_data.cell(row=r, column=7).value)
-                
-                if d_monto != 0:
-                    mes_fila = extraer_mes_inteligente(d_fecha)
-                    if ("ESPECIALIZAD" in d_cuenta) and bancos_coinciden(banco_objetivo, d_banco) and mes_objetivo and mes_fila and (mes_objetivo in mes_fila or mes_fila in mes_objetivo):
-                        suma_data_bs += d_monto
-
-            # --- PASO B: Sumar Ingresos (MANEJO EXCEDENTE) desde la RAM ---
-            suma_excedente = 0
-            etiqueta_banco = "BP" if "PROVINCIAL" in banco_objetivo else ("BM" if "MERCANTIL" in banco_objetivo else "")
-            
-            if etiqueta_banco != "":
-                for row_exc in excedentes_lista:
-                    if len(row_exc) < 8: continue
-                    
-                    val_desc = row_exc[1] # Columna B (Índice 1)
-                    if not val_desc: continue
-                    e_desc = normalizar_texto(val_desc)
-                    
-                    val_mes = row_exc[2] # Columna C (Índice 2)
-                    mes_exc = extraer_mes_inteligente(val_mes)
-                    
-                    e_desc_clean = e_desc.replace(" ", "").replace(".", "")
-                    banco_match = False
-                    if "PROVINCIAL" in banco_objetivo and ("BP" in e_desc_clean or "PROVINCIAL" in e_desc_clean):
-                        banco_match = True
-                    elif "MERCANTIL" in banco_objetivo and ("BM" in e_desc_clean or "MERCANTIL" in e_desc_clean):
-                        banco_match = True
-
-                    if ("ESPECIALIZAD" in e_desc) and banco_match and mes_objetivo and mes_exc and (mes_objetivo in mes_exc or mes_exc in mes_objetivo):
-                        val_h = row_exc[7] # Columna H (Índice 7)
-                        monto_h = limpiar_venezuela(val_h)
-                        
-                        if monto_h != 0:
-                            suma_excedente += monto_h 
+            mes_objetivo = lector_apartados.mes(celda_mes.value)
+            suma_data_bs, suma_excedente = resolver_sumas(banco_objetivo, mes_objetivo)
 
             # --- PASO C: Cálculo Final ---
             if suma_data_bs != 0 or suma_excedente != 0:
                 resultado_final = (suma_data_bs * -1) + suma_excedente
-                celda_monto.value = resultado_final
-                celda_monto.number_format = '#,##0.00'
+                instantanea.cambios.escribir(ws_apartados, fila, 3, resultado_final, '#,##0.00')
                 cambios += 1
                 if suma_excedente > 0: 
                     callback_log(f"   ✅ {banco_objetivo} {mes_objetivo}: {resultado_final:,.2f} (+{suma_excedente:,.2f} Exced.)")
@@ -464,135 +831,452 @@ def procesar_conciliacion_compleja(wb, ruta_excel, callback_log):
 
     return cambios
 
+# ==========================================
+# 🚀 CLASIFICACIÓN Y CÁLCULO USD (DATA BS)
+# ==========================================
+def clasificar_data_bs_celdas(ws_data, clasificador, calendario, cambios, omitir=frozenset()):
+    c_clasif, c_usd = 0, 0
+    sembrar = getattr(clasificador, "sembrar", None)
+    for r in range(4, ws_data.max_row + 1):
+        if r in omitir: continue
+        prov = str(ws_data.cell(row=r, column=12).value).upper().strip()
+        if prov:
+            falta_cta = not ws_data.cell(row=r, column=13).value
+            falta_area = not ws_data.cell(row=r, column=15).value
+            if sembrar and not (falta_cta and falta_area) and ws_data.cell(row=r, column=12).value:
+                sembrar(prov, ws_data.cell(row=r, column=13).value, ws_data.cell(row=r, column=15).value)
+            if falta_cta or falta_area:
+                match_cta, match_area = clasificador.clasificar(prov)
+                if falta_cta and match_cta: cambios.escribir(ws_data, r, 13, match_cta); c_clasif += 1
+                if falta_area and match_area: cambios.escribir(ws_data, r, 15, match_area)
+        
+        val_fecha = ws_data.cell(row=r, column=2).value
+        bs = limpiar_monto(ws_data.cell(row=r, column=7).value)
+
+        concepto_fila = str(ws_data.cell(row=r, column=6).value).upper()
+        
+        if "SALDO INICIAL" in concepto_fila:
+            cambios.escribir(ws_data, r, 9, 1)
+        else:
+            if bs > 0:
+                cambios.escribir(ws_data, r, 9, 2)
+            elif bs < 0:
+                cambios.escribir(ws_data, r, 9, 3)
+        
+        if val_fecha and bs != 0 and not ws_data.cell(row=r, column=8).value:
+            tasa = calendario.tasa(val_fecha)
+            if tasa and tasa > 0:
+                cambios.escribir(ws_data, r, 8, bs / tasa, '#,##0.00')
+                c_usd += 1
+
+    return c_clasif, c_usd
+
+def _mapear_unicos(serie, funcion):
+    # Aplica la función una sola vez por valor distinto de la columna
+    unicos = {}
+    for v in serie.array:
+        if v not in unicos: unicos[v] = funcion(v)
+    return serie.map(unicos.__getitem__)
+
+def clasificar_data_bs_pandas(ws_data, clasificador, calendario, cambios, omitir=frozenset()):
+    """Misma lógica que clasificar_data_bs_celdas, pero por columnas.
+
+    Carga DATA BS en un DataFrame una vez, calcula todo vectorizado y solo
+    escribe de vuelta las celdas cuyo valor cambia.
+    """
+    filas = list(ws_data.iter_rows(min_row=4, max_col=15, values_only=True))
+    indice = range(4, 4 + len(filas))
+    if omitir:
+        indice = [r for r in indice if r not in omitir]
+        filas = [filas[r - 4] for r in indice]
+    if not filas: return 0, 0
+    df = pd.DataFrame(filas, columns=list("ABCDEFGHIJKLMNO"), dtype=object)
+    df.index = indice
+    nuevas_cta, nuevas_area, nuevos_tipo, usd = _calcular_data_bs(df, clasificador, calendario)
+
+    # --- Escritura solo de celdas modificadas ---
+    for r, v in nuevas_cta.items(): cambios.escribir(ws_data, r, 13, v)
+    for r, v in nuevas_area.items(): cambios.escribir(ws_data, r, 15, v)
+    for r, v in nuevos_tipo.items(): cambios.escribir(ws_data, r, 9, int(v))
+    for r, v in usd.items(): cambios.escribir(ws_data, r, 8, float(v), '#,##0.00')
+
+    return len(nuevas_cta), len(usd)
+
+def _calcular_data_bs(df, clasificador, calendario):
+    """Núcleo columnar de DATA BS: (categorías, áreas, tipos, USD) nuevos, indexados por fila.
+
+    df necesita las columnas B, F, G, H, I, L, M y O.
+    """
+    # --- Clasificación (M = categoría, O = área) ---
+    prov = df["L"].map(lambda v: str(v).upper().strip())
+    falta_cta = ~df["M"].map(bool)
+    falta_area = ~df["O"].map(bool)
+    pendientes = (prov != "") & (falta_cta | falta_area)
+    sembrar = getattr(clasificador, "sembrar", None)
+    if sembrar:
+        # Filas que ya traen M/O (a mano o de corridas anteriores): el memo aprende de ellas
+        ya_clasificadas = df["L"].map(bool) & (prov != "") & ~(falta_cta & falta_area)
+        for p, m, o in zip(prov[ya_clasificadas].array, df.loc[ya_clasificadas, "M"].array, df.loc[ya_clasificadas, "O"].array):
+            sembrar(p, m, o)
+    resultados = _mapear_unicos(prov[pendientes], clasificador.clasificar)
+    # dtype object para que un None no se convierta en NaN (que es "verdadero")
+    match_cta = pd.Series([x[0] for x in resultados], index=resultados.index, dtype=object)
+    match_area = pd.Series([x[1] for x in resultados], index=resultados.index, dtype=object)
+    nuevas_cta = match_cta[falta_cta[pendientes] & match_cta.map(bool)]
+    nuevas_area = match_area[falta_area[pendientes] & match_area.map(bool)]
+
+    # --- Tipo de movimiento (I): 1 saldo inicial, 2 ingreso, 3 egreso ---
+    bs = pd.Series(limpiar_montos(df["G"].array), index=df.index, dtype=float)
+    saldo_inicial = df["F"].map(lambda v: "SALDO INICIAL" in str(v).upper()).astype(bool)
+    tipo = pd.Series(np.select([saldo_inicial, bs > 0, bs < 0], [1, 2, 3], 0), index=df.index)
+    ya_igual = df["I"].map(lambda v: type(v) is int) & (df["I"] == tipo)
+    nuevos_tipo = tipo[(tipo != 0) & ~ya_igual]
+
+    # --- Conversión USD (H = BS / tasa del día) ---
+    candidatas = df["B"].map(bool) & (bs != 0) & ~df["H"].map(bool)
+    fechas = df.loc[candidatas, "B"]
+    tasas = pd.Series(calendario.buscar_lote(fechas.array), index=fechas.index)
+    tasas = tasas[tasas > 0]
+    usd = bs[tasas.index] / tasas
+    return nuevas_cta, nuevas_area, nuevos_tipo, usd
+
+# Columnas que lee el modo flujo (B, F, G, H, I, J, L, M, O) -> índice en la fila
+COLUMNAS_FLUJO = {"B": 1, "F": 5, "G": 6, "H": 7, "I": 8, "J": 9, "L": 11, "M": 12, "O": 14}
+
+def clasificar_data_bs_flujo(instantanea, clasificador, calendario, tam_lote=None):
+    """DATA BS por lotes de filas, sin cargar la hoja (libros muy grandes).
+
+    Lee el archivo original en modo solo lectura (o la caché de hojas), arma
+    un DataFrame chico por lote con las columnas que se usan y manda los
+    cambios al FlujoCambios de la hoja. Devuelve (clasificadas, conversiones
+    USD, aportes a APARTADOS, filas).
+    """
+    flujo = instantanea.cambios.flujo(instantanea.hoja_flujo)
+    lector = LectorFechas("DATA BS B")
+    c_clasif, c_usd, total, aportes = 0, 0, 0, []
+    filas = instantanea.filas_flujo(min_row=4, max_col=15)
+    try:
+        while True:
+            lote = list(islice(filas, tam_lote or LOTE_FLUJO_FILAS))
+            if not lote: break
+            df = pd.DataFrame({letra: [f[i] for f in lote] for letra, i in COLUMNAS_FLUJO.items()}, dtype=object)
+            df.index = range(4 + total, 4 + total + len(lote))
+            nuevas_cta, nuevas_area, nuevos_tipo, usd = _calcular_data_bs(df, clasificador, calendario)
+
+            por_fila = {}
+            for r, v in nuevas_cta.items(): por_fila.setdefault(r, {})[13] = (v, None)
+            for r, v in nuevas_area.items(): por_fila.setdefault(r, {})[15] = (v, None)
+            for r, v in nuevos_tipo.items(): por_fila.setdefault(r, {})[9] = (int(v), None)
+            for r, v in usd.items(): por_fila.setdefault(r, {})[8] = (float(v), '#,##0.00')
+            flujo.agregar(por_fila)
+
+            # Aportes a APARTADOS con la categoría (M) ya clasificada
+            cuentas = df["M"].copy()
+            cuentas[nuevas_cta.index] = nuevas_cta
+            aportes += aportes_data_bs((f[:12] + (m,) for f, m in zip(lote, cuentas.array)), lector, total)
+            c_clasif, c_usd, total = c_clasif + len(nuevas_cta), c_usd + len(usd), total + len(lote)
+    finally:
+        filas.close()
+    return c_clasif, c_usd, aportes, total
+
+# ==========================================
+# ♻️ MODO INCREMENTAL (DATA BS)
+# ==========================================
+def _resumir_bloque_data_bs(lector):
+    def resumir(filas, desplazamiento):
+        # Pendiente: movimiento con fecha y monto que sigue sin USD (aún no había tasa ese día)
+        pendiente = any(f[1] and not f[7] and limpiar_monto(f[6]) != 0 for f in filas)
+        return pendiente, aportes_data_bs(filas, lector, desplazamiento)
+    return resumir
+
+# ==========================================
+# 💽 CACHÉ DE HOJAS (DATA BS YA PARSEADA)
+# ==========================================
+# Lecturas de DATA BS que se guardan: las filas de la clasificación por lotes y
+# las columnas Q/M/G (valores guardados) del resumen semanal
+VISTAS_CACHE_DATA_BS = {
+    "filas": especificacion(min_row=4, max_col=15),
+    "semanas": especificacion(data_only=True, min_row=4, indices=(16, 12, 6)),
+}
+
+def poblar_cache_hojas(instantanea, pool=None):
+    """Guarda DATA BS del libro en la caché de hojas, en segundo plano (pool de etapas o un hilo).
+
+    Solo si no estaba y la hoja es grande; devuelve el futuro o el hilo (o None).
+    """
+    if not instantanea.clave_cache or instantanea.cache_hojas: return None
+    hoja = instantanea.nombre_hoja("DATA BS")
+    if not hoja: return None
+    # En modo flujo la hoja está vacía en wb (y ya se sabe grande)
+    if hoja != instantanea.hoja_flujo and instantanea.wb[hoja].max_row - 3 < CACHE_HOJAS_MIN_FILAS: return None
+    args = (CARPETA_CACHE_HOJAS, CACHE_HOJAS_MB, instantanea.clave_cache, instantanea.contenido, hoja, VISTAS_CACHE_DATA_BS)
+    if pool is not None:
+        try: return pool.submit(guardar_en_cache, *args)
+        except Exception: pass
+    hilo = threading.Thread(target=guardar_en_cache, args=args, name="cache_hojas")
+    hilo.start()
+    return hilo
+
+# ==========================================
+# 💾 GUARDADO DEL RESULTADO
+# ==========================================
+def guardar_resultado(instantanea, destino, callback_log):
+    # Por defecto solo se reescriben las hojas tocadas; si el parche falla, guardado completo.
+    # En modo flujo DATA BS no está en wb: solo sirve el escritor por parches.
+    if ESCRITOR_SALIDA == "parches" or instantanea.hoja_flujo:
+        try:
+            aplicar_cambios(instantanea.contenido, instantanea.cambios, destino)
+            hojas = instantanea.cambios.hojas.keys() | instantanea.cambios.flujos.keys()
+            callback_log(f"   ✍️ {len(instantanea.cambios)} celdas escritas en {len(hojas)} hojas.")
+            return destino
+        except Exception as e:
+            if instantanea.hoja_flujo: raise
+            callback_log(f"⚠️ No se pudo parchear el archivo ({str(e)}). Guardando completo...")
+            if hasattr(destino, "seek"): destino.seek(0); destino.truncate()
+    instantanea.wb.save(destino)
+    return destino
+
 # ==========================================
 # ORQUESTADOR PRINCIPAL
 # ==========================================
-def lógica_negocio(ruta_excel, callback_log, callback_progreso):
+def lógica_negocio(ruta_excel, callback_log, callback_progreso, destino="Resultado_Finanzas.xlsx", recursos=None,
+                   callback_reporte=None, perfilar=None):
+    """Procesa un libro completo y lo guarda en destino.
+
+    recursos (opcional): dict con "clasificador", "calendario" y "tasa_hoy" ya
+    cargados (p. ej. compartidos por todo un lote); si se pasa, no se leen
+    diccionario ni tasas otra vez.
+    callback_reporte (opcional): recibe al final el reporte por etapas
+    (tiempo, filas, memoria pico) como dict serializable a JSON.
+    """
     mensajes = []
-    wb = None
+    nombre_salida = destino
+    instr = Instrumentacion(PERFILAR if perfilar is None else perfilar, CARPETA_PERFILES)
     try:
-        # 1. CARGA INICIAL
-        callback_log("🧠 Iniciando sistemas...")
-        reglas_cuentas = cargar_diccionario_cuentas() 
-        reglas_areas = cargar_diccionario_areas()
-        tasas_historicas = cargar_tasas_historicas(callback_log)
-        
-        # --- AQUÍ ESTÁ EL ARREGLO DE LA API ---
-        try:
-            # Conexión a la nueva API (DolarApi)
-            url_api = "https://ve.dolarapi.com/v1/dolares/oficial"
-            callback_log(f"🌍 Consultando Dólar Oficial en: {url_api}")
-            
-            resp = requests.get(url_api, timeout=10)
-            data = resp.json()
-            
-            # Usamos 'promedio' como vimos en tu captura
-            precio_dolar_hoy = float(data['promedio'])
-            
-            callback_log(f"💰 ¡TASA OBTENIDA!: {precio_dolar_hoy}")
-        except Exception as e: 
-            callback_log(f"❌ Error consultando tasa: {str(e)}")
-            precio_dolar_hoy = 0
-        # --------------------------------------
+        return _ejecutar_etapas(ruta_excel, callback_log, callback_progreso, nombre_salida, recursos, instr, mensajes)
+    except PermissionError:
+        return False, "⚠️ CIERRA EL EXCEL. Está abierto y bloqueado."
+    except Exception as e:
+        if "Bad file descriptor" in str(e):
+            callback_progreso(1.0)
+            return nombre_salida, "\n".join(mensajes)
+        return False, f"❌ Error técnico: {str(e)}"
+    finally:
+        reporte = instr.cerrar()
+        for linea in instr.resumen_texto(): callback_log(linea)
+        if callback_reporte: callback_reporte(reporte)
+
+def _ejecutar_etapas(ruta_excel, callback_log, callback_progreso, nombre_salida, recursos, instr, mensajes):
+    # 1. CARGA INICIAL (EN PARALELO)
+    # Diccionarios, tasas y el Excel no dependen entre sí: corren a la vez y
+    # el arranque tarda lo que la tarea más lenta, no la suma de todas.
+    # Los hilos no tocan la interfaz: sus mensajes se publican desde aquí.
+    callback_log("🧠 Iniciando sistemas...")
+    logs_hilos = []
+    candado_logs = threading.Lock()
+    def log_hilo(msg):
+        with candado_logs: logs_hilos.append(msg)
+    def publicar_logs():
+        with candado_logs:
+            pendientes = logs_hilos[:]
+            del logs_hilos[:]
+        for msg in pendientes: callback_log(msg)
+
+    # Pool de etapas: arranca ya, así importa el módulo mientras se carga el libro.
+    # En lote no (los libros ya se reparten los núcleos), ni si app corre como __main__
+    # (el pool no podría importar sus funciones). En la cola de trabajos, solo si sus
+    # procesos dejan núcleos libres (ver PROCESOS_ETAPAS y MAX_TRABAJOS).
+    pool = None
+    if PROCESOS_ETAPAS > 0 and recursos is None and __name__ != "__main__":
+        if trabajadores_cola() > TRABAJOS_CON_ETAPAS:
+            callback_log(f"ℹ️ Etapas en orden: {trabajadores_cola()} trabajos a la vez ya ocupan los {NUCLEOS} núcleos "
+                         f"(PLATCO_MAX_TRABAJOS={TRABAJOS_CON_ETAPAS} deja lugar al pool de etapas).")
+        else:
+            pool = pool_etapas(PROCESOS_ETAPAS)
+            calentar(pool, __name__)
+
+    with instr.etapa("carga_inicial") as registro, ThreadPoolExecutor(max_workers=5, thread_name_prefix="arranque") as arranque:
+        f_excel = arranque.submit(instr.medir("carga.libro", InstantaneaLibro), ruta_excel)
+        if recursos is None:
+            # Último respaldo de tasas: el historial del propio libro (se lee solo si hace falta)
+            respaldos = [HojaComportamientoTasa(lambda: f_excel.result().valores("COMPORTAMIENTO TASA"))]
+            f_diccionario = arranque.submit(instr.medir("carga.diccionario", cargar_diccionario), estado_cache_diccionario())
+            f_historico = arranque.submit(instr.medir("carga.tasas_historicas", cargar_tasas_historicas), log_hilo, respaldos)
+            f_hoy = arranque.submit(instr.medir("carga.tasa_hoy", resolver_tasa_hoy), log_hilo, respaldos)
+        callback_log("📂 Leyendo archivo Excel...")
 
+        if recursos is None:
+            for _ in as_completed([f_diccionario, f_historico, f_hoy]):
+                publicar_logs()
+            clasificador = f_diccionario.result()[2]
+            stats = estadisticas_cache_diccionario()
+            callback_log(f"📚 Diccionario listo (caché: {stats['aciertos']} aciertos / {stats['fallos']} lecturas)")
+            calendario = CalendarioTasas(f_historico.result())
+            precio_dolar_hoy, fuente_tasa_hoy = f_hoy.result()
+        else:
+            clasificador, calendario = recursos["clasificador"], recursos["calendario"]
+            precio_dolar_hoy, fuente_tasa_hoy = recursos["tasa_hoy"], "lote"
+            callback_log("📚 Diccionario y tasas compartidos del lote")
+        registro["tasa_hoy"], registro["fuente_tasa_hoy"] = precio_dolar_hoy, fuente_tasa_hoy
         callback_progreso(0.1)
 
         # 2. ABRIR EXCEL
-        callback_log("📂 Leyendo archivo Excel...")
-        wb = openpyxl.load_workbook(ruta_excel)
-        callback_progreso(0.3)
-
-        # 3. ACTUALIZAR PORTADA/HISTORICO
+        instantanea = f_excel.result()
+        wb = instantanea.wb
+        publicar_logs()
+        ws_data = obtener_hoja_flexible(wb, "DATA BS")
+        if instantanea.clave_cache: registro["cache_hojas"] = "acierto" if instantanea.cache_hojas else "fallo"
+        if instantanea.cache_hojas: callback_log("⚡ DATA BS ya leída en una corrida anterior: sale de la caché de hojas")
+        elif instantanea.hoja_flujo: callback_log("🌊 DATA BS muy grande: se procesará en modo flujo (por lotes)")
+        else: registro["filas"] = max(0, ws_data.max_row - 3) if ws_data else 0
+    callback_progreso(0.3)
+
+    # 3-6. ETAPAS SOBRE EL LIBRO
+    # Cada etapa declara qué hojas lee y escribe: las que no chocan corren a la
+    # vez (el resumen semanal en el pool de etapas, mientras aquí se clasifica y
+    # concilia) y sus escrituras se integran en el orden declarado.
+    datos = {"aportes": None}
+
+    # 3. ACTUALIZAR PORTADA/HISTORICO
+    def etapa_portada(registro):
         if precio_dolar_hoy > 0:
             ws_portada = obtener_hoja_flexible(wb, "CUENTAS POR COBRAR")
             if ws_portada:
-                ws_portada["D3"] = datetime.now().strftime("%d/%m/%Y")
-                ws_portada["D4"] = precio_dolar_hoy
+                instantanea.cambios.escribir(ws_portada, 3, 4, datetime.now().strftime("%d/%m/%Y"))
+                instantanea.cambios.escribir(ws_portada, 4, 4, precio_dolar_hoy)
             ws_hist = obtener_hoja_flexible(wb, "COMPORTAMIENTO TASA")
             if ws_hist:
                 fila = ws_hist.max_row + 1
                 ult_fecha = ws_hist.cell(row=fila-1, column=1).value
                 if ult_fecha != datetime.now().strftime("%d/%m/%Y"):
-                    ws_hist.cell(row=fila, column=1, value=datetime.now().strftime("%d/%m/%Y"))
-                    ws_hist.cell(row=fila, column=2, value="USD")
-                    ws_hist.cell(row=fila, column=3, value=precio_dolar_hoy)
+                    instantanea.cambios.escribir(ws_hist, fila, 1, datetime.now().strftime("%d/%m/%Y"))
+                    instantanea.cambios.escribir(ws_hist, fila, 2, "USD")
+                    instantanea.cambios.escribir(ws_hist, fila, 3, precio_dolar_hoy)
                     mensajes.append("✅ Tasa Histórica Agregada")
 
-         # 4. CLASIFICACIÓN Y CÁLCULO USD (ESTRICTO V11)
+    # 4. CLASIFICACIÓN Y CÁLCULO USD (ESTRICTO V11)
+    def etapa_clasificacion(registro):
         callback_log("🚀 Clasificando y Calculando Divisas...")
-        ws_data = obtener_hoja_flexible(wb, "DATA BS")
-        if ws_data:
-            c_clasif, c_usd = 0, 0
-            for r in range(4, ws_data.max_row + 1):
-                prov = str(ws_data.cell(row=r, column=12).value).upper().strip()
-                if prov:
-                    if not ws_data.cell(row=r, column=13).value:
-                        match = next((v for k,v in reglas_cuentas if k in prov), None)
-                        if not match:
-                             if "COMISION" in prov: match = "GASTOS BANCARIOS"
-                             elif "IVA" in prov: match = "IMPUESTOS"
-                        if match: ws_data.cell(row=r, column=13).value = match; c_clasif += 1
-                    if not ws_data.cell(row=r, column=15).value:
-                        match = next((v for k,v in reglas_areas if k in prov), None)
-                        if match: ws_data.cell(row=r, column=15).value = match
-                
-                val_fecha = ws_data.cell(row=r, column=2).value
-                bs = limpiar_numero(ws_data.cell(row=r, column=7).value)
-
-                concepto_fila = str(ws_data.cell(row=r, column=6).value).upper()
-                
-                if "SALDO INICIAL" in concepto_fila:
-                    ws_data.cell(row=r, column=9).value = 1
-                else:
-                    if bs > 0:
-                        ws_data.cell(row=r, column=9).value = 2
-                    elif bs < 0:
-                        ws_data.cell(row=r, column=9).value = 3
-                
-                if val_fecha and bs != 0 and not ws_data.cell(row=r, column=8).value:
-                    f_key = formatear_fecha_para_api(val_fecha)
-                    tasa = buscar_tasa_inteligente(f_key, tasas_historicas)
-                    if tasa and tasa > 0:
-                        ws_data.cell(row=r, column=8).value = bs / tasa
-                        ws_data.cell(row=r, column=8).number_format = '#,##0.00'
-                        c_usd += 1
-
+        # Memo de proveedores: lo ya visto (o clasificado a mano) se resuelve sin recorrer el diccionario
+        memo = abrir_memo_proveedores(clasificador, callback_log)
+        clasificador_etapa = memo if memo is not None else clasificador
+        if instantanea.hoja_flujo:
+            # La hoja no está en memoria: sin estado incremental (el que hubiera queda igual y sigue siendo válido)
+            c_clasif, c_usd, datos["aportes"], total_filas = clasificar_data_bs_flujo(instantanea, clasificador_etapa, calendario)
             mensajes.append(f"✅ {c_clasif} Filas Clasificadas")
             mensajes.append(f"✅ {c_usd} Conversiones a USD")
-        
+            mensajes.append(f"🌊 Modo flujo: {total_filas} filas en lotes de {LOTE_FLUJO_FILAS}")
+            registro["filas"] = total_filas
+        elif ws_data:
+            estado, omitir = None, frozenset()
+            if MODO_INCREMENTAL:
+                estado = EstadoIncremental.leer(wb) or EstadoIncremental()
+                omitir = estado.planificar(list(ws_data.iter_rows(min_row=4, max_col=15, values_only=True)), clasificador_etapa.version, 4)
+                if omitir: callback_log(f"♻️ Modo incremental: {len(omitir)} filas sin cambios desde la última corrida")
+            if MOTOR_DATA_BS == "celdas":
+                c_clasif, c_usd = clasificar_data_bs_celdas(ws_data, clasificador_etapa, calendario, instantanea.cambios, omitir)
+            else:
+                c_clasif, c_usd = clasificar_data_bs_pandas(ws_data, clasificador_etapa, calendario, instantanea.cambios, omitir)
+            mensajes.append(f"✅ {c_clasif} Filas Clasificadas")
+            mensajes.append(f"✅ {c_usd} Conversiones a USD")
+            total_filas = max(0, ws_data.max_row - 3)
+            registro["filas"] = total_filas - len(omitir)
+            if estado is not None:
+                # Huellas y aportes a APARTADOS de los bloques reprocesados; el resto se reutiliza
+                estado.actualizar(ws_data, clasificador_etapa.version, 4, 15, _resumir_bloque_data_bs(LectorFechas("DATA BS B")))
+                estado.guardar(wb, instantanea.cambios)
+                datos["aportes"] = estado.aportes()
+                mensajes.append(f"♻️ Incremental: {total_filas - len(omitir)} de {total_filas} filas procesadas")
+        if memo is not None:
+            try: memo.guardar()
+            except Exception as e: callback_log(f"⚠️ No se pudo guardar el memo de proveedores: {str(e)}")
+            registro["memo"] = est = memo.estadisticas()
+            if est["consultas"]:
+                callback_log(f"🧠 Memo de proveedores: {est['aciertos']}/{est['consultas']} resueltos sin el diccionario "
+                             f"({est['tasa_aciertos']:.0%}), {est['aprendidos']} clasificaciones aprendidas del libro")
         callback_progreso(0.6)
 
-       
-        # 5. CONCILIACIÓN
-        cambios_conc = procesar_conciliacion_compleja(wb, ruta_excel, callback_log)
-        
-        
-        # 6. RESUMEN SEMANAL (CORREGIDO)
-        #cambios_sem = procesar_resumen_semanal(wb, ruta_excel, callback_log)
-        #if cambios_sem > 0: mensajes.append(f"✅ Resumen Semanal Actualizado ({cambios_sem} celdas)")
-        #else: mensajes.append("ℹ️ Resumen Semanal: Sin cambios nuevos")
-        
-        callback_progreso(0.9)
-
-      # 7. GUARDAR
-        callback_log("💾 Guardando archivo...")
-        nombre_salida = "Resultado_Finanzas.xlsx"
-        wb.save(nombre_salida)
-        #wb.close()#
-        callback_progreso(1.0)
-        
-        return nombre_salida, "\n".join(mensajes)
+    # 5. CONCILIACIÓN
+    def etapa_conciliacion(registro):
+        registro["filas"] = procesar_conciliacion_compleja(instantanea, callback_log, datos["aportes"])
+
+    # 6. RESUMEN SEMANAL (PIVOTE)
+    def al_terminar_resumen(cambios_sem, registro):
+        registro["filas"] = cambios_sem
+        if cambios_sem > 0: mensajes.append(f"✅ Resumen Semanal Actualizado ({cambios_sem} celdas)")
+        else: mensajes.append("ℹ️ Resumen Semanal: Sin cambios nuevos")
+
+    etapas = [
+        Etapa("portada_historico", etapa_portada, lee=["COMPORTAMIENTO TASA"], escribe=["CUENTAS POR COBRAR", "COMPORTAMIENTO TASA"]),
+        Etapa("clasificacion_data_bs", etapa_clasificacion, lee=["DATA BS", HOJA_ESTADO], escribe=["DATA BS", HOJA_ESTADO]),
+        Etapa("conciliacion", etapa_conciliacion, lee=["DATA BS", "MANEJO EXCEDENTE", "APARTADOS"], escribe=["APARTADOS"]),
+        # Lee DATA BS tal como venía guardada en el archivo: no espera a la clasificación
+        Etapa("resumen_semanal", procesar_resumen_semanal, lee=["FLUJO DE CAJA"], lee_archivo=["DATA BS"],
+              escribe=["FLUJO DE CAJA"], en_proceso=True, al_terminar=al_terminar_resumen),
+    ]
+    ejecutar_etapas(etapas, instantanea, instr, callback_log, pool)
+
+    instantanea.cerrar()
+    callback_progreso(0.9)
+
+    # 7. GUARDAR
+    callback_log("💾 Guardando archivo...")
+    with instr.etapa("guardado") as registro:
+        registro["celdas"] = len(instantanea.cambios)
+        try: guardar_resultado(instantanea, nombre_salida, callback_log)
+        finally: instantanea.cambios.cerrar()
+    # 8. Próxima vez que se suba este mismo archivo: DATA BS sin volver a parsear su XML
+    poblar_cache_hojas(instantanea, pool)
+    callback_progreso(1.0)
+
+    return nombre_salida, "\n".join(mensajes)
 
-    except PermissionError:
-        return False, "⚠️ CIERRA EL EXCEL. Está abierto y bloqueado."
-    except Exception as e:
-        if "Bad file descriptor" in str(e):
-            callback_progreso(1.0)
-            return nombre_salida, "\n".join(mensajes)
-        return False, f"❌ Error técnico: {str(e)}"
 
+# ==========================================
+# 🧵 COLA DE TRABAJOS (COMPARTIDA ENTRE SESIONES)
+# ==========================================
+@st.cache_resource(show_spinner=False)
+def cola_trabajos():
+    """Pool de procesos único del servidor: todas las sesiones encolan aquí."""
+    cache = CacheResultados(MAX_RESULTADOS_CACHE, CACHE_RESULTADOS_MB) if MAX_RESULTADOS_CACHE > 0 else None
+    return ColaTrabajos(max_procesos=MAX_TRABAJOS, cache=cache)
 
-   
+def fecha_instantanea_tasas(tasa_hoy=None):
+    """Tasas con que correría un trabajo ahora: hoy + última fecha del almacén + tasa de hoy.
+
+    Sin `tasa_hoy` se usa la que anotó en el almacén la última corrida que la obtuvo de una API.
+    """
+    try:
+        almacen = AlmacenTasas(RUTA_ALMACEN_TASAS)
+        ultima = almacen.ultima_fecha()
+        if tasa_hoy is None: tasa_hoy = almacen.tasa_hoy()
+    except Exception: ultima = None
+    return f"{date.today().isoformat()}/{ultima or '-'}/{repr(float(tasa_hoy)) if tasa_hoy else '-'}"
+
+def tasas_de_corrida(reporte):
+    """Tasas que usó una corrida (según su reporte), o None si no tuvo la tasa de hoy de una API.
+
+    Un resultado sin tasa de hoy, o con la de un respaldo, no se guarda en la caché de resultados.
+    """
+    carga = next((e for e in (reporte or {}).get("etapas", []) if e.get("etapa") == "carga_inicial"), {})
+    if not carga.get("tasa_hoy") or carga.get("fuente_tasa_hoy") not in PROVEEDORES_API: return None
+    return fecha_instantanea_tasas(carga["tasa_hoy"])
+
+def claves_cache_resultado(contenido):
+    """(clave para buscar en la caché de resultados, fecha de tasas -> clave para guardar).
+
+    Se busca con las tasas del almacén de ahora; el trabajo puede actualizarlas,
+    así que el resultado se guarda con las que usó (ver tasas_de_corrida y
+    ColaTrabajos.enviar).
+    (None, None) si no se pueden calcular: se procesa siempre.
+    """
+    try:
+        clasificador = cargar_diccionario()[2]
+        memo = abrir_memo_proveedores(clasificador, lambda msg: None)
+        version = (memo or clasificador).version
+    except Exception: return None, None
+    con_tasas = partial(clave_resultado, contenido, version)
+    return con_tasas(fecha_instantanea_tasas()), con_tasas
 
 # ==========================================
 # 🎮 INTERFAZ WEB (STREAMLIT)
@@ -614,50 +1298,51 @@ if __name__ == "__main__":
         st.success(f"Archivo cargado: {uploaded_file.name}")
         
         if st.button("🚀 EJECUTAR AUTOMATIZACIÓN", type="primary"):
-            
-            # Área de logs visual
-            log_container = st.empty()
-            logs_historial = []
-
-            def web_log(msg):
-                logs_historial.append(f"> {msg}")
-                # Muestra los últimos 10 mensajes
-                log_container.text("\n".join(logs_historial[-10:]))
-
-            bar = st.progress(0)
-
-            try:
-                web_log("--- INICIANDO PROCESO ---")
-                
-                # LLAMAMOS A TU LÓGICA (MODIFICADA EN EL PASO 2)
-                # Nota: Pasamos 'uploaded_file' directo, no una ruta.
-                archivo_resultado, texto_resultado = lógica_negocio(uploaded_file, web_log, bar.progress)
-                
-                web_log("--- FINALIZADO ---")
-                st.success("¡Proceso Terminado!")
-
-                # MOSTRAR LOGS COMPLETOS
-                with st.expander("Ver Reporte Detallado"):
-                    st.text(texto_resultado)
-
-                # BOTÓN DE DESCARGA (VERSIÓN VPS)
-                if archivo_resultado != False:
-                    now = datetime.now().strftime("%Y%m%d_%H%M")
-                    with open(archivo_resultado, "rb") as f:
-                        st.download_button(
-                            label="📥 DESCARGAR ARCHIVO PROCESADO",
-                            data=f,
-                            file_name=f"Finanzas_Procesado_{now}.xlsx",
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                        )
-
-            except Exception as e:
-                st.error(f"❌ Error Crítico: {str(e)}")
-
-    
-
-
-
-
-
+            # El trabajo corre en otro proceso: el botón solo lo encola
+            contenido = uploaded_file.getvalue()
+            st.session_state["id_trabajo"] = cola_trabajos().enviar(contenido, uploaded_file.name, *claves_cache_resultado(contenido))
+
+    # Mientras el trabajo no termina, el panel se refresca solo cada segundo
+    id_trabajo = st.session_state.get("id_trabajo")
+    trabajo = cola_trabajos().obtener(id_trabajo) if id_trabajo else None
+    sondeando = trabajo is not None and not trabajo.finalizado
+
+    @st.fragment(run_every=1 if sondeando else None)
+    def panel_trabajo():
+        trabajo = cola_trabajos().obtener(id_trabajo) if id_trabajo else None
+        if trabajo is None: return
+        if sondeando and trabajo.finalizado: st.rerun()
+
+        # Área de logs visual (los últimos 10 mensajes)
+        logs_historial = ["> --- INICIANDO PROCESO ---"] + [f"> {msg}" for msg in list(trabajo.logs)]
+        if trabajo.estado == EN_COLA:
+            en_espera = cola_trabajos().resumen()[EN_COLA]
+            logs_historial.append(f"> ⏳ En cola ({en_espera} trabajo(s) esperando)")
+        if trabajo.finalizado: logs_historial.append("> --- FINALIZADO ---")
+        st.text("\n".join(logs_historial[-10:]))
+        st.progress(min(max(trabajo.progreso, 0.0), 1.0))
+
+        if not trabajo.finalizado: return
+        if trabajo.estado == TERMINADO: st.success("¡Proceso Terminado!")
+        else: st.error("❌ El proceso no pudo completarse")
+        if trabajo.desde_cache: st.info("⚡ Este libro ya se había procesado hoy con el mismo diccionario: resultado reutilizado.")
+
+        # MOSTRAR LOGS COMPLETOS (y tiempos por etapa)
+        with st.expander("Ver Reporte Detallado"):
+            st.text(trabajo.texto)
+            if trabajo.reporte: st.json(trabajo.reporte, expanded=False)
+
+        # BOTÓN DE DESCARGA (el resultado ya está en memoria)
+        if trabajo.resultado is not None:
+            now = datetime.now().strftime("%Y%m%d_%H%M")
+            st.download_button(
+                label="📥 DESCARGAR ARCHIVO PROCESADO",
+                data=trabajo.resultado,
+                file_name=f"Finanzas_Procesado_{now}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
 
+    try:
+        panel_trabajo()
+    except Exception as e:
+        st.error(f"❌ Error Crítico: {str(e)}")
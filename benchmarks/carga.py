@@ -0,0 +1,256 @@
+"""Prueba de carga: varios usuarios procesando libros a la vez.
+
+Uso:
+    python -m benchmarks.carga --usuarios 1,2,4,8 --envios 3 --tamano 1k
+    python -m benchmarks.carga --usuarios 4 --procesos 2 --latencia 50 --cache-resultados
+
+Hace lo mismo que el botón "EJECUTAR AUTOMATIZACIÓN", sin navegador: cada
+usuario simulado (un hilo) encola su libro en la ColaTrabajos como la
+interfaz, consulta el trabajo hasta que termina (como el panel que se
+refresca solo) y descarga el resultado. Las tasas salen del servidor falso
+y los libros del generador sintético, uno distinto por usuario (con
+--mismo-libro todos suben el mismo).
+
+Por cada nivel de concurrencia informa rendimiento (trabajos por minuto),
+latencia p50/p95/p99 desde el envío hasta la descarga, espera en cola y la
+memoria residente máxima de cada proceso (servidor y trabajadores; se lee
+de /proc, solo Linux). El resultado se guarda en
+benchmarks/resultados/carga_<fecha>_<commit>.json.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+from benchmarks.generar_libro import RAIZ
+from benchmarks.medir import CARPETA_RESULTADOS, commit_actual, libro_sintetico
+from benchmarks.servidor_falso import ServidorFalso
+
+# ==========================================
+# 🧠 MEMORIA POR PROCESO
+# ==========================================
+def _rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"): return int(linea.split()[1]) / 1024
+    except (OSError, ValueError): return None
+    return None
+
+def _descendientes(pid):
+    """[(pid, profundidad)] de los procesos hijos, nietos... de `pid`."""
+    hijos = {}
+    for entrada in os.listdir("/proc"):
+        if not entrada.isdigit(): continue
+        try:
+            with open(f"/proc/{entrada}/stat") as f: ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError): continue
+        hijos.setdefault(ppid, []).append(int(entrada))
+    resultado, pendientes = [], [(pid, 0)]
+    while pendientes:
+        padre, nivel = pendientes.pop()
+        for hijo in hijos.get(padre, []):
+            resultado.append((hijo, nivel + 1))
+            pendientes.append((hijo, nivel + 1))
+    return resultado
+
+def _rol(pid, profundidad):
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f: comando = f.read().decode("utf-8", "replace")
+    except OSError: comando = ""
+    if "resource_tracker" in comando: return "resource_tracker"
+    return "trabajador" if profundidad == 1 else "pool de etapas"
+
+class MonitorMemoria:
+    """Muestrea la memoria residente de este proceso y sus descendientes mientras dura el bloque."""
+
+    def __init__(self, intervalo=0.25):
+        self.intervalo = intervalo
+        self.disponible = os.path.isdir("/proc")
+        self.picos = {}  # pid -> (MB, rol)
+        self._parar = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name="monitor-memoria", daemon=True)
+
+    def __enter__(self):
+        if self.disponible: self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        if self.disponible: self._hilo.join()
+        return False
+
+    def _muestrear(self):
+        while True:
+            for pid, profundidad in [(os.getpid(), 0)] + _descendientes(os.getpid()):
+                rss = _rss_mb(pid)
+                if rss is None: continue
+                anterior = self.picos.get(pid)
+                if anterior is None or rss > anterior[0]:
+                    self.picos[pid] = (rss, anterior[1] if anterior else ("servidor" if profundidad == 0 else _rol(pid, profundidad)))
+            if self._parar.wait(self.intervalo): return
+
+    def resumen(self):
+        return [{"pid": pid, "proceso": rol, "rss_pico_mb": round(mb, 1)}
+                for pid, (mb, rol) in sorted(self.picos.items(), key=lambda x: (x[1][1] != "servidor", x[0]))]
+
+# ==========================================
+# 👥 USUARIOS SIMULADOS
+# ==========================================
+def percentil(valores, p):
+    """Percentil por rango más cercano (None si no hay valores)."""
+    if not valores: return None
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+def usuario(cola, envios, sondeo, claves, resultados, candado, salida):
+    """Sube cada libro, espera a que termine y descarga el resultado, uno tras otro."""
+    salida.wait()
+    for nombre, contenido in envios:
+        inicio = time.perf_counter()
+        id_trabajo = cola.enviar(contenido, nombre, *claves(contenido))
+        while True:
+            trabajo = cola.obtener(id_trabajo)
+            if trabajo is None or trabajo.finalizado: break
+            time.sleep(sondeo)
+        descarga = trabajo.resultado if trabajo is not None else None
+        latencia = time.perf_counter() - inicio
+        ok = bool(descarga) and zipfile.is_zipfile(io.BytesIO(descarga))
+        reporte = trabajo.reporte if trabajo is not None else None
+        servicio = reporte.get("segundos_total") if isinstance(reporte, dict) else None
+        with candado:
+            resultados.append({"libro": nombre, "latencia_s": latencia, "ok": ok, "servicio_s": servicio,
+                               "desde_cache": bool(trabajo and trabajo.desde_cache),
+                               "texto": None if ok else (trabajo.texto if trabajo else "trabajo perdido")})
+
+def medir_nivel(cola, usuarios, libros, envios, sondeo, claves):
+    resultados, candado = [], threading.Lock()
+    salida = threading.Barrier(usuarios)
+    hilos = [threading.Thread(target=usuario, name=f"usuario-{u}",
+                              args=(cola, [libros[u % len(libros)]] * envios, sondeo, claves, resultados, candado, salida))
+             for u in range(usuarios)]
+    with MonitorMemoria() as monitor:
+        inicio = time.perf_counter()
+        for h in hilos: h.start()
+        for h in hilos: h.join()
+        duracion = time.perf_counter() - inicio
+
+    latencias = [r["latencia_s"] for r in resultados if r["ok"]]
+    # Espera en cola = latencia - lo que tardó el trabajo; los de la caché (o que se sumaron a un
+    # trabajo igual ya en curso) traen el tiempo de la corrida original
+    esperas = [max(0.0, r["latencia_s"] - r["servicio_s"]) for r in resultados
+               if r["ok"] and r["servicio_s"] is not None and not r["desde_cache"]]
+    redondear = lambda v: None if v is None else round(v, 3)
+    return {
+        "usuarios": usuarios,
+        "trabajos": len(resultados),
+        "fallidos": sum(1 for r in resultados if not r["ok"]),
+        "desde_cache": sum(1 for r in resultados if r["desde_cache"]),
+        "duracion_s": round(duracion, 3),
+        "trabajos_por_min": round(len(latencias) / duracion * 60, 2) if duracion > 0 else None,
+        "latencia_p50_s": redondear(percentil(latencias, 50)),
+        "latencia_p95_s": redondear(percentil(latencias, 95)),
+        "latencia_p99_s": redondear(percentil(latencias, 99)),
+        "latencia_max_s": redondear(max(latencias, default=None)),
+        "espera_cola_p50_s": redondear(percentil(esperas, 50)),
+        "espera_cola_p95_s": redondear(percentil(esperas, 95)),
+        "memoria": monitor.resumen(),
+        "errores": sorted({r["texto"] for r in resultados if r["texto"]}),
+    }
+
+def imprimir_nivel(nivel):
+    segundos = lambda v: "-" if v is None else f"{v:.2f}s"
+    print(f"   {nivel['trabajos']} trabajos en {nivel['duracion_s']:.1f}s -> {nivel['trabajos_por_min'] or 0:.1f} trabajos/min"
+          f" | p50 {segundos(nivel['latencia_p50_s'])} p95 {segundos(nivel['latencia_p95_s'])} p99 {segundos(nivel['latencia_p99_s'])}"
+          f" | cola p50 {segundos(nivel['espera_cola_p50_s'])} | {nivel['fallidos']} fallidos")
+    for p in nivel["memoria"]:
+        print(f"   🧠 {p['proceso']:<16} pid {p['pid']:<7} {p['rss_pico_mb']:>8.1f} MB")
+    for error in nivel["errores"]: print(f"   ❌ {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prueba de carga de la cola de automatizaciones.")
+    parser.add_argument("--usuarios", default="1,2,4", help="niveles de concurrencia separados por coma")
+    parser.add_argument("--envios", type=int, default=3, help="libros que sube cada usuario, uno tras otro")
+    parser.add_argument("--tamano", default="1k", help="filas de DATA BS de cada libro (1k,10k,100k,500k o número)")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--mismo-libro", action="store_true", help="todos los usuarios suben el mismo libro")
+    parser.add_argument("--procesos", type=int, default=0, help="procesos de la cola (0 = como la app)")
+    parser.add_argument("--cache-resultados", action="store_true", help="con la caché de resultados de la app")
+    parser.add_argument("--latencia", type=float, default=0, help="ms de latencia del servidor falso")
+    parser.add_argument("--sondeo", type=float, default=0.1, help="segundos entre consultas del estado del trabajo")
+    parser.add_argument("--salida", help="ruta del JSON de resultados")
+    args = parser.parse_args(argv)
+    niveles = [int(n) for n in args.usuarios.split(",") if n.strip()]
+
+    carpeta = tempfile.mkdtemp(prefix="platco_carga_")
+    try:
+        with ServidorFalso(latencia_ms=args.latencia) as servidor:
+            # Los trabajadores heredan el entorno: tasas del servidor falso y nada fuera de la carpeta temporal
+            os.environ["PLATCO_URL_HISTORICO"] = servidor.url_historico
+            os.environ["PLATCO_URL_TASA_HOY"] = servidor.url_oficial
+            os.environ["PLATCO_CLAVE_DOLARVZLA"] = "clave-de-prueba"  # el servidor falso no la valida
+            os.environ["PLATCO_ALMACEN_TASAS"] = os.path.join(carpeta, "tasas.sqlite3")
+            os.environ["PLATCO_MEMO_PROVEEDORES"] = os.path.join(carpeta, "memo_proveedores.sqlite3")
+            os.environ.setdefault("PLATCO_CACHE_HOJAS", os.path.join(carpeta, "cache_hojas"))
+            sys.path.insert(0, RAIZ)
+            import app
+            from cache_resultados import CacheResultados
+            from trabajos import ColaTrabajos
+
+            semillas = [args.semilla] if args.mismo_libro else [args.semilla + u for u in range(max(niveles))]
+            libros = []
+            for semilla in semillas:
+                ruta, filas = libro_sintetico(args.tamano, semilla)
+                with open(ruta, "rb") as f: libros.append((os.path.basename(ruta), f.read()))
+
+            cache = CacheResultados(app.MAX_RESULTADOS_CACHE, app.CACHE_RESULTADOS_MB) if args.cache_resultados else None
+            claves = app.claves_cache_resultado if args.cache_resultados else (lambda contenido: (None, None))
+            cola = ColaTrabajos(max_procesos=args.procesos or app.MAX_TRABAJOS, cache=cache)
+            resultado = {
+                "commit": commit_actual(),
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "nucleos": os.cpu_count(),
+                "procesos": cola.max_procesos,
+                "tamano": args.tamano,
+                "filas": filas,
+                "envios_por_usuario": args.envios,
+                "cache_resultados": args.cache_resultados,
+                "niveles": [],
+            }
+            try:
+                # Calentamiento: arranca los trabajadores (importar app) fuera de la medición
+                print(f"🔥 Arrancando {cola.max_procesos} procesos de la cola...")
+                medir_nivel(cola, cola.max_procesos, libros, 1, args.sondeo, lambda contenido: None)
+                for usuarios in niveles:
+                    print(f"👥 {usuarios} usuarios x {args.envios} libros de {filas} filas...")
+                    nivel = medir_nivel(cola, usuarios, libros, args.envios, args.sondeo, claves)
+                    imprimir_nivel(nivel)
+                    resultado["niveles"].append(nivel)
+            finally:
+                cola.cerrar()
+            resultado["consultas_api"] = dict(servidor.consultas)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    print(f"\n{'usuarios':>8} {'trab/min':>9} {'p50':>8} {'p95':>8} {'p99':>8} {'fallidos':>9}")
+    for n in resultado["niveles"]:
+        celdas = [f"{n[k]:.2f}" if n[k] is not None else "-" for k in ("trabajos_por_min", "latencia_p50_s", "latencia_p95_s", "latencia_p99_s")]
+        print(f"{n['usuarios']:>8} {celdas[0]:>9} {celdas[1]:>8} {celdas[2]:>8} {celdas[3]:>8} {n['fallidos']:>9}")
+
+    salida = args.salida or os.path.join(CARPETA_RESULTADOS, f"carga_{datetime.now():%Y%m%d_%H%M%S}_{resultado['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Resultados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Generador de libros sintéticos para benchmarks.
+
+Uso:
+    python -m benchmarks.generar_libro 10000 benchmarks/libros/libro_10k.xlsx
+
+Crea DATA BS, APARTADOS, MANEJO EXCEDENTE, FLUJO DE CAJA, CUENTAS POR
+COBRAR y COMPORTAMIENTO TASA con la forma de los libros reales: fechas en
+varios formatos, montos venezolanos, proveedores tomados del diccionario
+(más algunos desconocidos) y cuentas ESPECIALIZAD. para la conciliación.
+Con la misma semilla el libro sale idéntico.
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+import openpyxl
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TAMANOS = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "500k": 500_000}
+
+BANCOS = ["BANCO PROVINCIAL", "Banco Mercantil", "BANESCO", "Bco Provincial", "MERCANTIL", None]
+CONCEPTOS = ["Transferencia", "PAGO", "PAGO MOVIL", "COBRO", "SALDO INICIAL", None]
+CUENTAS = [None, None, None, "SERVICIOS ESPECIALIZADOS", "CONTINUIDAD OPERATIVA", "SIMCARD",
+           "ALIADOS COMERCIALES", "BANCO MERCANTIL 20% TX", "BANCO PROVINCIAL 20% TX"]
+DESCONOCIDOS = ["PROVEEDOR SIN REGLA", "PAGO VARIOS", "REF 000123", "TRASPASO ENTRE CUENTAS"]
+MESES = ["ENERO", "FEBRERO", "MARZO", "ABRIL", "MAYO", "JUNIO", "JULIO", "AGOSTO",
+         "SEPTIEMBRE", "OCTUBRE", "NOVIEMBRE", "DICIEMBRE"]
+
+def palabras_diccionario():
+    ruta = os.path.join(RAIZ, "diccionario.xlsx")
+    if not os.path.exists(ruta): return []
+    wb = openpyxl.load_workbook(ruta, read_only=True)
+    try:
+        return [str(f[0]).strip() for ws in wb.worksheets for f in ws.iter_rows(min_row=2, values_only=True) if f and f[0]]
+    finally:
+        wb.close()
+
+def _fecha(rnd, f):
+    formato = rnd.random()
+    if formato < 0.45: return f
+    if formato < 0.75: return f.strftime("%d/%m/%Y")
+    if formato < 0.85: return f.strftime("%Y-%m-%d")
+    if formato < 0.95: return (f - datetime(1899, 12, 30)).days
+    return f.strftime("%d-%m-%y")
+
+def _monto(rnd):
+    valor = round(rnd.uniform(-25_000, 25_000), 2)
+    formato = rnd.random()
+    if formato < 0.6: return valor
+    texto = f"{abs(valor):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    if formato < 0.75: return texto if valor >= 0 else f"-{texto}"
+    if formato < 0.85: return f"({texto})" if valor < 0 else texto
+    if formato < 0.95: return f"{texto} BS"
+    return rnd.choice([None, "-", 0])
+
+def generar(ruta, filas, semilla=1, inicio=datetime(2025, 1, 1), dias=180):
+    rnd = random.Random(semilla)
+    claves = palabras_diccionario() or ["COMISION", "IVA"]
+    wb = openpyxl.Workbook(write_only=True)
+
+    # --- DATA BS (encabezados en filas 1-3, datos desde la 4) ---
+    ws = wb.create_sheet("DATA BS")
+    ws.append(["DATA BS"])
+    ws.append([])
+    ws.append(["", "FECHA", "", "", "", "CONCEPTO", "MONTO BS", "MONTO USD", "TIPO", "BANCO", "", "PROVEEDOR",
+               "CUENTA", "", "AREA", "", "SEMANA"])
+    for _ in range(filas):
+        f = inicio + timedelta(days=rnd.randrange(dias))
+        if rnd.random() < 0.85:
+            proveedor = f"{rnd.choice(claves)} {rnd.randint(1, 999)}".upper() if rnd.random() < 0.5 else rnd.choice(claves)
+        else:
+            proveedor = rnd.choice(DESCONOCIDOS)
+        ws.append([
+            None, _fecha(rnd, f), None, None, None, rnd.choice(CONCEPTOS), _monto(rnd),
+            round(rnd.uniform(1, 500), 2) if rnd.random() < 0.15 else None,
+            None, rnd.choice(BANCOS), None, proveedor, rnd.choice(CUENTAS), None,
+            "MANUAL" if rnd.random() < 0.1 else None, None,
+            f"SEMANA {min(5, (f.day - 1) // 7 + 1)}",
+        ])
+
+    # --- APARTADOS (banco x mes de las cuentas especializadas) ---
+    ws = wb.create_sheet("APARTADOS")
+    ws.append(["APARTADOS"]); ws.append([]); ws.append(["", "BANCO", "MONTO", "CONCEPTO", "MES"])
+    for banco in ("BANCO PROVINCIAL", "BANCO MERCANTIL"):
+        for m in range(inicio.month - 1, min(12, inicio.month - 1 + dias // 30 + 1)):
+            ws.append([None, banco, None, "SERVICIOS ESPECIALIZADOS", MESES[m]])
+
+    # --- MANEJO EXCEDENTE (H: fórmulas y valores) ---
+    ws = wb.create_sheet("MANEJO EXCEDENTE")
+    ws.append(["MANEJO EXCEDENTE"]); ws.append([]); ws.append(["", "DESCRIPCION", "MES", "", "INGRESO", "EGRESO", "", "NETO"])
+    for r in range(4, 4 + min(1996, max(50, filas // 50))):
+        ingreso, egreso = round(rnd.uniform(0, 5000), 2), round(rnd.uniform(0, 2000), 2)
+        neto = f"=E{r}-F{r}" if rnd.random() < 0.5 else round(ingreso - egreso, 2)
+        ws.append([None, rnd.choice(["ESPECIALIZADOS B.P.", "ESPECIALIZADOS BM", "ESPECIALIZADOS MERCANTIL", "OTROS BP"]),
+                   MESES[(inicio + timedelta(days=rnd.randrange(dias))).month - 1], None, ingreso, egreso, None, neto])
+
+    # --- FLUJO DE CAJA (SEMANA n: ESTIMADO / ACTUALIZACIÓN DIARIA) ---
+    ws = wb.create_sheet("FLUJO DE CAJA")
+    ws.append(["FLUJO DE CAJA"])
+    encabezado, sub = ["CUENTA"], [""]
+    for s in range(1, 6):
+        encabezado += [f"SEMANA {s}", ""]
+        sub += ["ESTIMADO", "ACTUALIZACION DIARIA"]
+    ws.append(encabezado); ws.append(sub)
+    for cuenta in ("CONTINUIDAD OPERATIVA", "SIMCARD", "ALIADOS COMERCIALES", "BANCO MERCANTIL 20% TX",
+                   "BANCO PROVINCIAL 20% TX", "OTROS INGRESOS"):
+        fila = [cuenta]
+        for _ in range(5): fila += [round(rnd.uniform(1000, 50000), 2) if rnd.random() < 0.7 else None, None]
+        ws.append(fila)
+
+    # --- CUENTAS POR COBRAR / COMPORTAMIENTO TASA ---
+    ws = wb.create_sheet("CUENTAS POR COBRAR")
+    ws.append(["CUENTAS POR COBRAR"]); ws.append([]); ws.append(["", "", "FECHA", None]); ws.append(["", "", "TASA", None])
+    ws = wb.create_sheet("COMPORTAMIENTO TASA")
+    ws.append(["FECHA", "MONEDA", "TASA"])
+    for d in range(0, dias, 7):
+        ws.append([(inicio + timedelta(days=d)).strftime("%d/%m/%Y"), "USD", round(50 + d * 0.4, 2)])
+
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+    wb.save(ruta)
+    return ruta
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera un libro sintético para benchmarks.")
+    parser.add_argument("filas", help="cantidad de filas de DATA BS (número o 1k/10k/100k/500k)")
+    parser.add_argument("destino", nargs="?", help="ruta del .xlsx (por defecto benchmarks/libros/libro_<filas>.xlsx)")
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args(argv)
+    filas = TAMANOS.get(args.filas) or int(args.filas)
+    destino = args.destino or os.path.join(RAIZ, "benchmarks", "libros", f"libro_{args.filas}.xlsx")
+    print(f"📄 {generar(destino, filas, args.semilla)} ({filas} filas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Benchmark por etapas de lógica_negocio.
+
+Uso:
+    python -m benchmarks.medir --tamanos 1k,10k,100k,500k
+    python -m benchmarks.medir --tamanos 10k --comparar benchmarks/resultados/<anterior>.json
+
+Levanta el servidor falso de tasas, genera (o reutiliza) los libros
+sintéticos y mide cada etapa por separado: diccionario (lectura y caché),
+tasas (API y almacén), lectura del libro, clasificación, conciliación,
+resumen semanal, guardado y la corrida completa. El resultado se guarda
+en benchmarks/resultados/<fecha>_<commit>.json para comparar entre commits.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generar_libro import RAIZ, TAMANOS, generar
+from benchmarks.servidor_falso import ServidorFalso
+
+CARPETA_LIBROS = os.path.join(RAIZ, "benchmarks", "libros")
+CARPETA_RESULTADOS = os.path.join(RAIZ, "benchmarks", "resultados")
+
+def _silencio(*args):
+    pass
+
+def commit_actual():
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, timeout=10)
+        return salida.stdout.strip() or "desconocido"
+    except Exception:
+        return "desconocido"
+
+def cronometrar(funcion, repeticiones=1):
+    """(mejor tiempo en segundos, resultado de la última ejecución)."""
+    mejor, resultado = None, None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        duracion = time.perf_counter() - inicio
+        mejor = duracion if mejor is None else min(mejor, duracion)
+    return mejor, resultado
+
+def medir_diccionario(app, repeticiones):
+    ruta = os.path.join(RAIZ, "diccionario.xlsx")
+    etapas = {}
+    def leer():
+        reglas_cuentas, reglas_areas = app._leer_diccionario(ruta)
+        return app.ClasificadorProveedores(reglas_cuentas, reglas_areas)
+    etapas["diccionario_lectura"], _ = cronometrar(leer, repeticiones)
+    estado = {"candado": app.threading.Lock(), "firma": None, "valor": None, "aciertos": 0, "fallos": 0}
+    app.cargar_diccionario(estado)
+    etapas["diccionario_cache"], _ = cronometrar(lambda: app.cargar_diccionario(estado), max(repeticiones, 100))
+    etapas["diccionario_cuentas"], _ = cronometrar(app.cargar_diccionario_cuentas, repeticiones)
+    etapas["diccionario_areas"], _ = cronometrar(app.cargar_diccionario_areas, repeticiones)
+    return etapas
+
+def medir_tasas(app, carpeta):
+    etapas = {}
+    app.RUTA_ALMACEN_TASAS = os.path.join(carpeta, "tasas_benchmark.sqlite3")
+    etapas["tasas_api"], memoria = cronometrar(lambda: app.cargar_tasas_historicas(_silencio))
+    etapas["tasas_almacen"], memoria = cronometrar(lambda: app.cargar_tasas_historicas(_silencio))
+    etapas["tasa_hoy"], tasa_hoy = cronometrar(lambda: app.consultar_tasa_oficial_hoy(_silencio))
+    etapas["calendario"], calendario = cronometrar(lambda: app.CalendarioTasas(memoria))
+    return etapas, calendario, tasa_hoy
+
+def medir_libro(app, ruta, clasificador, calendario, carpeta, repeticiones):
+    """Etapas sobre un libro, en el mismo orden que lógica_negocio."""
+    etapas = {}
+    for _ in range(repeticiones):
+        t = {}
+        t["lectura_libro"], inst = cronometrar(lambda: app.InstantaneaLibro(ruta))
+        ws_data = app.obtener_hoja_flexible(inst.wb, "DATA BS")
+        aportes = None
+        if inst.hoja_flujo:
+            t["clasificacion"], resultado = cronometrar(lambda: app.clasificar_data_bs_flujo(inst, clasificador, calendario))
+            aportes = resultado[2]
+        else:
+            motor = app.clasificar_data_bs_celdas if app.MOTOR_DATA_BS == "celdas" else app.clasificar_data_bs_pandas
+            t["clasificacion"], _ = cronometrar(lambda: motor(ws_data, clasificador, calendario, inst.cambios))
+        t["conciliacion"], _ = cronometrar(lambda: app.procesar_conciliacion_compleja(inst, _silencio, aportes))
+        t["resumen_semanal"], _ = cronometrar(lambda: app.procesar_resumen_semanal(inst, _silencio))
+        inst.cerrar()
+        destino = os.path.join(carpeta, "salida_benchmark.xlsx")
+        t["guardado"], _ = cronometrar(lambda: app.guardar_resultado(inst, destino, _silencio))
+        t["celdas_escritas"] = len(inst.cambios)
+        inst.cambios.cerrar()
+        for k, v in t.items(): etapas[k] = v if k not in etapas else min(etapas[k], v)
+
+    destino = os.path.join(carpeta, "Resultado_Finanzas.xlsx")
+    etapas["total_logica_negocio"], (archivo, _) = cronometrar(
+        lambda: app.lógica_negocio(ruta, _silencio, _silencio, destino=destino), repeticiones)
+    etapas["total_ok"] = bool(archivo)
+    return etapas
+
+def libro_sintetico(tamano, semilla):
+    filas = TAMANOS.get(tamano) or int(tamano)
+    ruta = os.path.join(CARPETA_LIBROS, f"libro_{tamano}_s{semilla}.xlsx")
+    if not os.path.exists(ruta):
+        print(f"📄 Generando libro de {filas} filas...")
+        generar(ruta, filas, semilla)
+    return ruta, filas
+
+def comparar(actual, anterior):
+    print(f"\n📊 Comparación con {anterior.get('commit')} ({anterior.get('fecha')})")
+    grupos = [("general", actual.get("etapas", {}), anterior.get("etapas"))]
+    grupos += [(tamano, etapas, anterior.get("libros", {}).get(tamano)) for tamano, etapas in actual["libros"].items()]
+    for tamano, etapas, previas in grupos:
+        if not previas: continue
+        print(f"\n  {tamano}:")
+        for etapa, valor in etapas.items():
+            antes = previas.get(etapa)
+            if not isinstance(valor, float) or not isinstance(antes, float) or antes <= 0: continue
+            cambio = valor / antes
+            marca = "🔴" if cambio > 1.10 else ("🟢" if cambio < 0.90 else "  ")
+            print(f"   {marca} {etapa:<22} {antes:>9.3f}s -> {valor:>9.3f}s  (x{cambio:.2f})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark por etapas de lógica_negocio.")
+    parser.add_argument("--tamanos", default="1k,10k", help="tamaños separados por coma (1k,10k,100k,500k o números)")
+    parser.add_argument("--repeticiones", type=int, default=1, help="se guarda el mejor tiempo")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--latencia", type=float, default=0, help="ms de latencia del servidor falso")
+    parser.add_argument("--comparar", help="JSON de una corrida anterior")
+    parser.add_argument("--salida", help="ruta del JSON de resultados")
+    args = parser.parse_args(argv)
+
+    carpeta = tempfile.mkdtemp(prefix="platco_bench_")
+    try:
+        with ServidorFalso(latencia_ms=args.latencia) as servidor:
+            os.environ["PLATCO_URL_HISTORICO"] = servidor.url_historico
+            os.environ["PLATCO_URL_TASA_HOY"] = servidor.url_oficial
+            os.environ["PLATCO_CLAVE_DOLARVZLA"] = "clave-de-prueba"  # el servidor falso no la valida
+            os.environ["PLATCO_ALMACEN_TASAS"] = os.path.join(carpeta, "tasas.sqlite3")
+            os.environ.setdefault("PLATCO_INCREMENTAL", "0")
+            # Sin caché de hojas: las repeticiones medirían la caché y no el parseo del libro
+            os.environ.setdefault("PLATCO_CACHE_HOJAS", "")
+            sys.path.insert(0, RAIZ)
+            inicio_import = time.perf_counter()
+            import app
+            resultado = {
+                "commit": commit_actual(),
+                "fecha": datetime.now().isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "nucleos": os.cpu_count(),
+                "motor": app.MOTOR_DATA_BS,
+                "escritor": app.ESCRITOR_SALIDA,
+                "modo_flujo": app.MODO_FLUJO,
+                "importar_app": time.perf_counter() - inicio_import,
+                "etapas": {},
+                "libros": {},
+            }
+
+            print("📚 Diccionario...")
+            resultado["etapas"].update(medir_diccionario(app, args.repeticiones))
+            print("🌍 Tasas (servidor falso)...")
+            etapas_tasas, calendario, _ = medir_tasas(app, carpeta)
+            resultado["etapas"].update(etapas_tasas)
+            for etapa, valor in resultado["etapas"].items(): print(f"   {etapa:<22} {valor:>9.4f}s")
+            clasificador = app.cargar_diccionario()[2]
+
+            for tamano in [t.strip() for t in args.tamanos.split(",") if t.strip()]:
+                ruta, filas = libro_sintetico(tamano, args.semilla)
+                print(f"⏱️ Libro {tamano} ({filas} filas)...")
+                etapas = medir_libro(app, ruta, clasificador, calendario, carpeta, args.repeticiones)
+                etapas["filas"] = filas
+                resultado["libros"][tamano] = etapas
+                for etapa, valor in etapas.items():
+                    if isinstance(valor, float): print(f"   {etapa:<22} {valor:>9.3f}s")
+            resultado["consultas_api"] = dict(servidor.consultas)
+    finally:
+        shutil.rmtree(carpeta, ignore_errors=True)
+
+    salida = args.salida or os.path.join(CARPETA_RESULTADOS, f"{datetime.now():%Y%m%d_%H%M%S}_{resultado['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Resultados en {salida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(resultado, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
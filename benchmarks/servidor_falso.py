@@ -0,0 +1,115 @@
+"""Servidor local que imita las APIs de tasas (dolarvzla y dolarapi).
+
+Uso:
+    python -m benchmarks.servidor_falso --puerto 8765 --latencia 50
+
+Rutas:
+    /public/exchange-rate/list?from=YYYY-MM-DD -> {"rates": [{"date", "usd"}]}
+    /v1/dolares/oficial                        -> {"promedio": ...}
+Las tasas son deterministas (días hábiles desde INICIO_TASAS hasta hoy).
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+INICIO_TASAS = date(2024, 1, 2)
+RUTA_HISTORICO = "/public/exchange-rate/list"
+RUTA_OFICIAL = "/v1/dolares/oficial"
+
+def tasa_del_dia(d):
+    return round(36.0 + (d - INICIO_TASAS).days * 0.12, 4)
+
+def historico(desde=None, hasta=None):
+    d, fin = INICIO_TASAS, hasta or date.today()
+    if desde:
+        try: d = max(d, date.fromisoformat(desde[:10]))
+        except ValueError: pass
+    tasas = []
+    while d <= fin:
+        if d.weekday() < 5: tasas.append({"date": d.isoformat(), "usd": tasa_del_dia(d)})
+        d += timedelta(days=1)
+    return tasas
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    latencia = 0.0
+    consultas = None
+
+    def do_GET(self):
+        if self.latencia: time.sleep(self.latencia)
+        url = urlparse(self.path)
+        if url.path == RUTA_HISTORICO:
+            desde = parse_qs(url.query).get("from", [None])[0]
+            cuerpo = {"rates": historico(desde)}
+        elif url.path == RUTA_OFICIAL:
+            cuerpo = {"promedio": tasa_del_dia(date.today())}
+        else:
+            self.send_error(404)
+            return
+        self.consultas[url.path] = self.consultas.get(url.path, 0) + 1
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorFalso:
+    """Servidor en un hilo; sirve de context manager.
+
+    `url_historico` y `url_oficial` se pasan a la app con
+    PLATCO_URL_HISTORICO / PLATCO_URL_TASA_HOY.
+    """
+
+    def __init__(self, puerto=0, latencia_ms=0):
+        manejador = type("Manejador", (_Manejador,), {"latencia": latencia_ms / 1000, "consultas": {}})
+        self.consultas = manejador.consultas
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", puerto), manejador)
+        self._hilo = threading.Thread(target=self._servidor.serve_forever, name="servidor-falso", daemon=True)
+
+    @property
+    def base(self):
+        host, puerto = self._servidor.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    @property
+    def url_historico(self):
+        return self.base + RUTA_HISTORICO
+
+    @property
+    def url_oficial(self):
+        return self.base + RUTA_OFICIAL
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._servidor.shutdown()
+        self._servidor.server_close()
+        return False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="APIs de tasas falsas para pruebas locales.")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0, help="milisegundos de espera por consulta")
+    args = parser.parse_args(argv)
+    with ServidorFalso(args.puerto, args.latencia) as servidor:
+        print(f"PLATCO_URL_HISTORICO={servidor.url_historico}")
+        print(f"PLATCO_URL_TASA_HOY={servidor.url_oficial}")
+        try:
+            while True: time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
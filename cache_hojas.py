@@ -0,0 +1,277 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import time as reloj
+import uuid
+from datetime import date, datetime, time, timedelta
+from itertools import islice
+
+import numpy as np
+import openpyxl
+
+# Cambia si cambia la forma de guardar: las entradas viejas se ignoran (y se van por LRU)
+FORMATO = 1
+
+# Tipo de cada celda guardada; el dato va en un int64 (los float, con sus mismos bits)
+VACIO, FLOTANTE, ENTERO, LOGICO, TEXTO, FECHAHORA, FECHA, HORA, DURACION = range(9)
+
+_EPOCA = datetime(1970, 1, 1)
+_EPOCA_ORDINAL = _EPOCA.toordinal()
+_UN_US = timedelta(microseconds=1)
+_LOTE = 4096
+
+
+class NoCacheable(Exception):
+    """La hoja tiene algo que no se puede guardar tal cual (se sigue leyendo del archivo)."""
+
+
+def clave_archivo(contenido):
+    """Huella del libro subido: misma huella = mismas hojas."""
+    return hashlib.blake2b(contenido, digest_size=16).hexdigest()
+
+
+def especificacion(data_only=False, min_row=1, max_col=None, indices=None):
+    """Qué lectura de la hoja guarda una vista (los mismos parámetros que al leerla con openpyxl).
+
+    Con `indices` solo se guardan esas columnas de las filas que llegan hasta la
+    última (como InstantaneaLibro.columnas); si no, las filas hasta `max_col`.
+    """
+    return {"data_only": bool(data_only), "min_row": min_row, "max_col": max_col,
+            "indices": list(indices) if indices else None}
+
+
+# ==========================================
+# 🧱 COLUMNAS EN BINARIO
+# ==========================================
+class _Codificador:
+    """Arma las columnas de una vista por lotes de filas (todas del mismo ancho)."""
+
+    def __init__(self, ancho):
+        self.ancho = ancho
+        self.textos = {}  # texto -> código (en orden de aparición)
+        self.tipos = []
+        self.datos = []
+
+    def agregar(self, lote):
+        n = len(lote)
+        tipos = np.zeros((self.ancho, n), dtype=np.uint8)
+        datos = np.zeros((self.ancho, n), dtype=np.int64)
+        flotantes = np.zeros((self.ancho, n), dtype=np.float64)
+        for i, fila in enumerate(lote):
+            if len(fila) != self.ancho: raise NoCacheable(f"fila de {len(fila)} columnas (se esperaban {self.ancho})")
+            for c, v in enumerate(fila):
+                if v is None: continue
+                t = type(v)
+                if t is float:
+                    tipos[c, i] = FLOTANTE
+                    flotantes[c, i] = v
+                elif t is str:
+                    tipos[c, i] = TEXTO
+                    datos[c, i] = self.textos.setdefault(v, len(self.textos))
+                elif t is int:
+                    if not -2 ** 63 <= v < 2 ** 63: raise NoCacheable("entero demasiado grande")
+                    tipos[c, i], datos[c, i] = ENTERO, v
+                elif t is bool:
+                    tipos[c, i], datos[c, i] = LOGICO, int(v)
+                elif t is datetime and v.tzinfo is None:
+                    tipos[c, i], datos[c, i] = FECHAHORA, (v - _EPOCA) // _UN_US
+                elif t is date:
+                    tipos[c, i], datos[c, i] = FECHA, v.toordinal() - _EPOCA_ORDINAL
+                elif t is time and v.tzinfo is None:
+                    tipos[c, i] = HORA
+                    datos[c, i] = ((v.hour * 60 + v.minute) * 60 + v.second) * 1_000_000 + v.microsecond
+                elif t is timedelta:
+                    tipos[c, i], datos[c, i] = DURACION, v // _UN_US
+                else:
+                    raise NoCacheable(f"valor de tipo {t.__name__}")
+        es_flotante = tipos == FLOTANTE
+        datos[es_flotante] = flotantes[es_flotante].view(np.int64)
+        self.tipos.append(tipos)
+        self.datos.append(datos)
+
+    def guardar(self, carpeta):
+        os.makedirs(carpeta)
+        tipos = np.concatenate(self.tipos, axis=1) if self.tipos else np.zeros((self.ancho, 0), dtype=np.uint8)
+        datos = np.concatenate(self.datos, axis=1) if self.datos else np.zeros((self.ancho, 0), dtype=np.int64)
+        np.save(os.path.join(carpeta, "tipos.npy"), tipos)
+        np.save(os.path.join(carpeta, "datos.npy"), datos)
+        crudos = [t.encode("utf-8", "surrogatepass") for t in self.textos]
+        limites = np.zeros(len(crudos) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in crudos], out=limites[1:])
+        np.save(os.path.join(carpeta, "textos.npy"), np.frombuffer(b"".join(crudos), dtype=np.uint8))
+        np.save(os.path.join(carpeta, "limites.npy"), limites)
+
+
+def _horas(datos):
+    horas = []
+    for us in datos.tolist():
+        segundos, micro = divmod(us, 1_000_000)
+        horas.append(time(segundos // 3600, segundos // 60 % 60, segundos % 60, micro))
+    return np.array(horas, dtype=object)
+
+_DECODIFICAR = {
+    FLOTANTE: lambda datos, vista: datos.view(np.float64),
+    ENTERO: lambda datos, vista: datos,
+    LOGICO: lambda datos, vista: datos != 0,
+    TEXTO: lambda datos, vista: vista.textos()[datos],
+    FECHAHORA: lambda datos, vista: datos.astype("datetime64[us]").astype(object),
+    FECHA: lambda datos, vista: datos.astype("datetime64[D]").astype(object),
+    HORA: lambda datos, vista: _horas(datos),
+    DURACION: lambda datos, vista: datos.astype("timedelta64[us]").astype(object),
+}
+
+
+class VistaColumnar:
+    """Una vista guardada: arreglos (columna x fila) mapeados en memoria desde disco.
+
+    Abrirla no lee nada; `filas` decodifica por lotes, una columna a la vez con
+    numpy, y devuelve las mismas tuplas (y tipos de Python) que openpyxl.
+    """
+
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self.tipos = np.load(os.path.join(carpeta, "tipos.npy"), mmap_mode="r")
+        self.datos = np.load(os.path.join(carpeta, "datos.npy"), mmap_mode="r")
+        self._textos = None
+
+    def __len__(self):
+        return self.tipos.shape[1]
+
+    def textos(self):
+        if self._textos is None:
+            crudos = np.load(os.path.join(self.carpeta, "textos.npy")).tobytes()
+            limites = np.load(os.path.join(self.carpeta, "limites.npy")).tolist()
+            textos = [crudos[a:b].decode("utf-8", "surrogatepass") for a, b in zip(limites, limites[1:])]
+            self._textos = np.array(textos, dtype=object)
+        return self._textos
+
+    def _columna(self, c, inicio, fin):
+        tipos = np.asarray(self.tipos[c, inicio:fin])
+        datos = np.asarray(self.datos[c, inicio:fin])
+        columna = np.full(fin - inicio, None, dtype=object)
+        for tipo in np.unique(tipos).tolist():
+            if tipo == VACIO: continue
+            donde = tipos == tipo
+            columna[donde] = _DECODIFICAR[tipo](datos[donde], self)
+        return columna.tolist()
+
+    def filas(self, tam_lote=_LOTE):
+        for inicio in range(0, len(self), tam_lote):
+            fin = min(inicio + tam_lote, len(self))
+            yield from zip(*(self._columna(c, inicio, fin) for c in range(self.tipos.shape[0])))
+
+
+def _codificar_vista(contenido, hoja, spec):
+    wb = openpyxl.load_workbook(io.BytesIO(contenido), read_only=True, data_only=spec["data_only"])
+    try:
+        filas = wb[hoja].iter_rows(min_row=spec["min_row"], max_col=spec["max_col"], values_only=True)
+        indices = spec["indices"]
+        if indices:
+            ultima = max(indices)
+            filas = (tuple(f[i] for i in indices) for f in filas if len(f) > ultima)
+        codificador = _Codificador(len(indices) if indices else spec["max_col"])
+        while True:
+            lote = list(islice(filas, _LOTE))
+            if not lote: break
+            codificador.agregar(lote)
+        return codificador
+    finally:
+        wb.close()
+
+
+# ==========================================
+# 💽 CACHÉ DE HOJAS EN DISCO (LRU POR TAMAÑO)
+# ==========================================
+class EntradaCache:
+    """Las vistas guardadas de una hoja de un libro (ver CacheHojas.abrir)."""
+
+    def __init__(self, carpeta, meta):
+        self.carpeta = carpeta
+        self.hoja = meta["hoja"]
+        self.vistas = meta["vistas"]
+
+    def vista(self, hoja, data_only=False, min_row=1, max_col=None, indices=None):
+        """La VistaColumnar con esa lectura de `hoja`, o None si no está guardada."""
+        if hoja != self.hoja: return None
+        buscada = especificacion(data_only, min_row, max_col, indices)
+        for nombre, spec in self.vistas.items():
+            if spec != buscada: continue
+            try: return VistaColumnar(os.path.join(self.carpeta, nombre))
+            except (OSError, ValueError): return None
+        return None
+
+
+class CacheHojas:
+    """Hojas ya parseadas, guardadas como columnas binarias por huella del archivo.
+
+    Cada entrada es una carpeta `v<FORMATO>-<clave>` con una subcarpeta por
+    vista (arreglos .npy) y un meta.json. Se escriben en una carpeta temporal
+    que se renombra al final, así varios procesos pueden compartir la caché.
+    La fecha de meta.json marca el último uso: al pasarse de `max_mb` se borran
+    primero las entradas usadas hace más tiempo.
+    """
+
+    def __init__(self, carpeta, max_mb=1024):
+        self.carpeta = carpeta
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def _ruta(self, clave):
+        return os.path.join(self.carpeta, f"v{FORMATO}-{clave}")
+
+    def abrir(self, clave):
+        """EntradaCache del libro, o None si no está."""
+        meta = os.path.join(self._ruta(clave), "meta.json")
+        try:
+            with open(meta, encoding="utf-8") as f: datos = json.load(f)
+            os.utime(meta)
+        except (OSError, ValueError): return None
+        if datos.get("formato") != FORMATO: return None
+        return EntradaCache(self._ruta(clave), datos)
+
+    def guardar(self, clave, contenido, hoja, vistas):
+        """Lee `hoja` de `contenido` una vez por vista ({nombre: especificacion}) y la guarda.
+
+        Devuelve True si la entrada quedó en la caché.
+        """
+        destino = self._ruta(clave)
+        if os.path.exists(destino): return True
+        os.makedirs(self.carpeta, exist_ok=True)
+        temporal = os.path.join(self.carpeta, f".tmp-{clave}-{uuid.uuid4().hex}")
+        try:
+            for nombre, spec in vistas.items():
+                _codificar_vista(contenido, hoja, spec).guardar(os.path.join(temporal, nombre))
+            with open(os.path.join(temporal, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump({"formato": FORMATO, "hoja": hoja, "vistas": vistas}, f)
+            try: os.rename(temporal, destino)
+            except OSError: pass  # otro proceso la guardó primero
+        finally:
+            shutil.rmtree(temporal, ignore_errors=True)
+        self.recortar()
+        return os.path.exists(destino)
+
+    def recortar(self):
+        """Borra las entradas menos usadas hasta quedar dentro de max_bytes."""
+        entradas = []
+        for nombre in os.listdir(self.carpeta):
+            ruta = os.path.join(self.carpeta, nombre)
+            try:
+                if nombre.startswith(".tmp-"):
+                    # Restos de un guardado interrumpido
+                    if reloj.time() - os.path.getmtime(ruta) > 3600: shutil.rmtree(ruta, ignore_errors=True)
+                    continue
+                uso = os.path.getmtime(os.path.join(ruta, "meta.json"))
+                tamano = sum(os.path.getsize(os.path.join(raiz, a)) for raiz, _, archivos in os.walk(ruta) for a in archivos)
+            except OSError: continue
+            entradas.append((uso, tamano, ruta))
+        total = 0
+        for uso, tamano, ruta in sorted(entradas, reverse=True):
+            total += tamano
+            if total > self.max_bytes: shutil.rmtree(ruta, ignore_errors=True)
+
+
+def guardar_en_cache(carpeta, max_mb, clave, contenido, hoja, vistas):
+    """CacheHojas(...).guardar para correr en segundo plano (hilo o pool): nunca lanza."""
+    try: return CacheHojas(carpeta, max_mb).guardar(clave, contenido, hoja, vistas)
+    except Exception: return False
@@ -0,0 +1,61 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# ==========================================
+# 🗃️ CACHÉ DE RESULTADOS (LRU POR CONTENIDO)
+# ==========================================
+def clave_resultado(contenido, version_diccionario, fecha_tasas):
+    """Huella del libro subido + versión del diccionario + fecha de las tasas usadas."""
+    h = hashlib.blake2b(contenido, digest_size=16)
+    h.update(f"|{version_diccionario}|{fecha_tasas}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class CacheResultados:
+    """Resultados ya procesados, acotados por cantidad y por tamaño total.
+
+    Cada entrada guarda los bytes del .xlsx de salida, el texto final, el
+    reporte por etapas y los logs; al llenarse se descarta la menos usada.
+    """
+
+    def __init__(self, max_entradas=16, max_mb=256):
+        self.max_entradas = max_entradas
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._candado = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        with self._candado:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada
+
+    def guardar(self, clave, resultado, texto, reporte=None, logs=()):
+        tamano = len(resultado)
+        if self.max_entradas <= 0 or tamano > self.max_bytes: return False
+        with self._candado:
+            anterior = self._entradas.pop(clave, None)
+            if anterior: self._bytes -= len(anterior["resultado"])
+            self._entradas[clave] = {"resultado": resultado, "texto": texto, "reporte": reporte, "logs": list(logs)}
+            self._bytes += tamano
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                _, descartada = self._entradas.popitem(last=False)
+                self._bytes -= len(descartada["resultado"])
+        return True
+
+    def estadisticas(self):
+        with self._candado:
+            return {"entradas": len(self._entradas), "mb": round(self._bytes / 1048576, 1),
+                    "aciertos": self.aciertos, "fallos": self.fallos}
+
+    def __len__(self):
+        return len(self._entradas)
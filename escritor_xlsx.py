@@ -0,0 +1,639 @@
+import io
+import math
+import numbers
+import pickle
+import posixpath
+import re
+import shutil
+import tempfile
+import zipfile
+from html import unescape
+from xml.sax.saxutils import escape
+
+from openpyxl.formula.translate import Translator
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, get_column_letter
+
+
+# ==========================================
+# ✍️ CONJUNTO DE CAMBIOS
+# ==========================================
+class ConjuntoCambios:
+    """Registro de todas las celdas que escriben las etapas.
+
+    `escribir` modifica la celda en el libro de openpyxl (para que las etapas
+    siguientes vean el valor nuevo) y además la anota por hoja, para que al
+    final solo se reescriban esas hojas dentro del .xlsx.
+    """
+
+    def __init__(self):
+        self.hojas = {}
+        self.hojas_nuevas = {}  # título -> oculta (hojas que no existen en el original)
+        self.flujos = {}  # título -> FlujoCambios (hojas grandes escritas en flujo)
+
+    def flujo(self, titulo):
+        """Cambios de una hoja que no se carga en el libro: se guardan en disco por filas."""
+        if titulo not in self.flujos: self.flujos[titulo] = FlujoCambios()
+        return self.flujos[titulo]
+
+    def crear_hoja(self, wb, titulo, oculta=False):
+        """Agrega una hoja al libro; el escritor por parches la crea en el .xlsx."""
+        ws = wb.create_sheet(titulo)
+        if oculta: ws.sheet_state = "hidden"
+        self.hojas_nuevas[ws.title] = oculta
+        self.hojas.setdefault(ws.title, {})
+        return ws
+
+    def escribir(self, ws, fila, columna, valor, formato=None):
+        celda = ws.cell(row=fila, column=columna)
+        celda.value = valor
+        if formato: celda.number_format = formato
+        anterior = self.hojas.setdefault(ws.title, {}).get((fila, columna))
+        if formato is None and anterior: formato = anterior[1]
+        self.hojas[ws.title][(fila, columna)] = (valor, formato)
+
+    def __len__(self):
+        return sum(len(celdas) for celdas in self.hojas.values()) + sum(len(f) for f in self.flujos.values())
+
+    def cerrar(self):
+        for flujo in self.flujos.values(): flujo.cerrar()
+
+
+class FlujoCambios:
+    """Cambios de una hoja grande, en orden de fila, volcados a un temporal.
+
+    `agregar` recibe un lote {fila: {columna: (valor, formato)}} cuyas filas
+    son todas posteriores a las del lote anterior; así el escritor puede
+    recorrer la hoja y los cambios a la vez sin tenerlos en memoria.
+    """
+
+    def __init__(self):
+        self._archivo = tempfile.TemporaryFile()
+        self._total = 0
+        self._ultima_fila = 0
+        self.extremos = None  # (min_fila, min_col, max_fila, max_col)
+
+    def agregar(self, por_fila):
+        if not por_fila: return
+        lote = sorted(por_fila.items())
+        if lote[0][0] <= self._ultima_fila:
+            raise ValueError("Los cambios en flujo deben llegar en orden de fila")
+        pickle.dump(lote, self._archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        self._ultima_fila = lote[-1][0]
+        columnas = [c for _, cambios in lote for c in cambios]
+        self._total += len(columnas)
+        min_col, max_col = min(columnas), max(columnas)
+        if self.extremos:
+            min_col, max_col = min(min_col, self.extremos[1]), max(max_col, self.extremos[3])
+        self.extremos = (self.extremos[0] if self.extremos else lote[0][0], min_col, self._ultima_fila, max_col)
+
+    def filas(self):
+        """(fila, {columna: (valor, formato)}) en orden."""
+        self._archivo.seek(0)
+        while True:
+            try: lote = pickle.load(self._archivo)
+            except EOFError: return
+            yield from lote
+
+    def __len__(self):
+        return self._total
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+# ==========================================
+# 🩹 ESCRITOR POR PARCHES (.XLSX)
+# ==========================================
+def aplicar_cambios(contenido_original, cambios, destino):
+    """Copia el .xlsx original reescribiendo solo las partes afectadas.
+
+    Se tocan las hojas con cambios y, si hace falta, styles.xml (formatos
+    nuevos), workbook.xml (recalcular al abrir) y la cadena de cálculo, que
+    se elimina para que Excel la reconstruya. Todo lo demás (otras hojas,
+    gráficos, imágenes, estilos) pasa sin modificar. Las hojas con cambios
+    en flujo se parchean por trozos a un temporal, sin cargarlas enteras.
+    """
+    with zipfile.ZipFile(io.BytesIO(contenido_original)) as zin:
+        partes = {info.filename: info for info in zin.infolist()}
+        rutas_hojas = _rutas_hojas(zin)
+        estilos = _Estilos(zin.read("xl/styles.xml").decode("utf-8")) if "xl/styles.xml" in partes else None
+
+        nuevas = {}
+        if cambios.hojas_nuevas:
+            rutas_hojas.update(_agregar_hojas(zin, partes, cambios.hojas_nuevas, nuevas))
+        for hoja, celdas in cambios.hojas.items():
+            if not celdas: continue
+            ruta = rutas_hojas.get(hoja)
+            if ruta is None or (ruta not in partes and ruta not in nuevas):
+                raise KeyError(f"Hoja '{hoja}' no encontrada en el archivo")
+            xml = nuevas[ruta].decode("utf-8") if ruta in nuevas else zin.read(ruta).decode("utf-8")
+            nuevas[ruta] = _parchear_hoja(xml, celdas, estilos).encode("utf-8")
+
+        # Hojas en flujo: se parchean antes de escribir para conocer los estilos nuevos
+        temporales = {}
+        for hoja, flujo in cambios.flujos.items():
+            if not len(flujo): continue
+            ruta = rutas_hojas.get(hoja)
+            if ruta is None or ruta not in partes:
+                raise KeyError(f"Hoja '{hoja}' no encontrada en el archivo")
+            temporales[ruta] = tempfile.TemporaryFile()
+            with zin.open(ruta) as entrada:
+                _parchear_hoja_flujo(entrada, temporales[ruta], flujo, estilos)
+
+        eliminar = set()
+        if nuevas or temporales:
+            ruta_cadena = next((p for p in partes if p.lower() == "xl/calcchain.xml"), None)
+            if ruta_cadena:
+                eliminar.add(ruta_cadena)
+                nuevas["[Content_Types].xml"] = re.sub(
+                    r'<Override\b[^>]*PartName="/xl/calcChain\.xml"[^>]*/>', "",
+                    _leer_parte(zin, nuevas, "[Content_Types].xml"), flags=re.I).encode("utf-8")
+                ruta_rels = "xl/_rels/workbook.xml.rels"
+                if ruta_rels in partes:
+                    nuevas[ruta_rels] = re.sub(
+                        r'<Relationship\b[^>]*Target="[^"]*calcChain\.xml"[^>]*/>', "",
+                        _leer_parte(zin, nuevas, ruta_rels), flags=re.I).encode("utf-8")
+            libro = nuevas["xl/workbook.xml"].decode("utf-8") if "xl/workbook.xml" in nuevas else zin.read("xl/workbook.xml").decode("utf-8")
+            nuevas["xl/workbook.xml"] = _forzar_recalculo(libro).encode("utf-8")
+            if estilos and estilos.modificado:
+                nuevas["xl/styles.xml"] = estilos.xml.encode("utf-8")
+
+        propio = not hasattr(destino, "write")
+        salida = open(destino, "wb") if propio else destino
+        try:
+            with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zout:
+                for nombre, info in partes.items():
+                    if nombre in eliminar: continue
+                    if nombre in temporales:
+                        temporales[nombre].seek(0)
+                        info_parte = zipfile.ZipInfo(nombre, info.date_time)
+                        info_parte.compress_type = zipfile.ZIP_DEFLATED
+                        with zout.open(info_parte, "w", force_zip64=True) as destino_parte:
+                            shutil.copyfileobj(temporales[nombre], destino_parte, 1 << 20)
+                        continue
+                    datos = nuevas[nombre] if nombre in nuevas else zin.read(info)
+                    zout.writestr(info, datos)
+                for nombre in nuevas.keys() - partes.keys():
+                    zout.writestr(nombre, nuevas[nombre])
+        finally:
+            if propio: salida.close()
+            for temporal in temporales.values(): temporal.close()
+    return destino
+
+
+# ==========================================
+# 🗜️ CONSULTAS LIVIANAS SOBRE EL .XLSX
+# ==========================================
+def nombres_hojas(contenido):
+    """Nombres de las hojas en orden, sin cargar el libro."""
+    with zipfile.ZipFile(io.BytesIO(contenido)) as zin:
+        return list(_rutas_hojas(zin))
+
+
+def filas_declaradas(contenido, hoja):
+    """Última fila según <dimension> de la hoja (solo lee el inicio de su XML); None si no la declara."""
+    with zipfile.ZipFile(io.BytesIO(contenido)) as zin:
+        ruta = _rutas_hojas(zin).get(hoja)
+        if ruta is None: return None
+        with zin.open(ruta) as parte:
+            inicio = parte.read(4096).decode("utf-8", errors="ignore")
+    dim = re.search(r'<(?:\w+:)?dimension\b[^>]*ref="([^"]*)"', inicio)
+    if not dim: return None
+    fila = re.search(r"(\d+)$", dim.group(1))
+    return int(fila.group(1)) if fila else None
+
+
+def vaciar_hoja(contenido, hoja):
+    """Copia del .xlsx con la hoja sin filas (para abrir el resto del libro sin ella)."""
+    salida = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(contenido)) as zin:
+        ruta = _rutas_hojas(zin).get(hoja)
+        if ruta is None: raise KeyError(f"Hoja '{hoja}' no encontrada en el archivo")
+        with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename != ruta:
+                    zout.writestr(info, zin.read(info))
+                    continue
+                # Se conservan el encabezado de la hoja y lo que va después de sheetData
+                with zin.open(info) as parte:
+                    lector = io.TextIOWrapper(parte, encoding="utf-8")
+                    texto = ""
+                    ini = None
+                    while ini is None:
+                        trozo = lector.read(65536)
+                        if not trozo: raise ValueError("Hoja sin sheetData")
+                        texto += trozo
+                        ini = re.search(r"<((?:\w+:)?)sheetData\b[^>]*?(/?)>", texto)
+                    resto = texto[ini.end():]
+                    if not ini.group(2):
+                        # Lo posterior a </sheetData> (márgenes, etc.) es corto: basta la cola
+                        while True:
+                            trozo = lector.read(1 << 20)
+                            if not trozo: break
+                            resto = (resto + trozo)[-(1 << 20):]
+                        cierre = f"</{ini.group(1)}sheetData>"
+                        fin = resto.rfind(cierre)
+                        if fin < 0: raise ValueError("Hoja sin cierre de sheetData")
+                        resto = resto[fin + len(cierre):]
+                    zout.writestr(info, texto[:ini.start()] + f"<{ini.group(1)}sheetData/>" + resto)
+    return salida.getvalue()
+
+
+def _leer_parte(zin, nuevas, nombre):
+    # Versión ya modificada de una parte si existe, si no la original
+    return nuevas[nombre].decode("utf-8") if nombre in nuevas else zin.read(nombre).decode("utf-8")
+
+
+_NS_HOJA = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_TIPO_HOJA = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+_CONTENIDO_HOJA = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+
+def _agregar_hojas(zin, partes, hojas_nuevas, nuevas):
+    """Crea las partes de hojas nuevas (vacías) y las registra en workbook, rels y Content_Types."""
+    libro = _leer_parte(zin, nuevas, "xl/workbook.xml")
+    rels = _leer_parte(zin, nuevas, "xl/_rels/workbook.xml.rels")
+    tipos = _leer_parte(zin, nuevas, "[Content_Types].xml")
+    p = re.search(r"<((?:\w+:)?)workbook\b", libro).group(1)
+    p_rel = re.search(r"<((?:\w+:)?)Relationships\b", rels).group(1)
+    # Prefijo del espacio de nombres de relaciones usado en <sheet r:id=...>
+    ns_r = re.search(r'xmlns:(\w+)="http://schemas\.openxmlformats\.org/officeDocument/2006/relationships"', libro)
+    if ns_r: pr = ns_r.group(1)
+    else:
+        pr = "r"
+        libro = re.sub(r"(<(?:\w+:)?workbook\b)", r'\1 xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"', libro, count=1)
+
+    ids_hoja = [int(v) for v in re.findall(r"<(?:\w+:)?sheet\b[^>]*\ssheetId=[\"'](\d+)", libro)]
+    ids_rel = {v for v in re.findall(r"\sId=[\"']([^\"']+)", rels)}
+    rutas = {}
+    siguiente_hoja, siguiente_parte, siguiente_rel = max(ids_hoja, default=0) + 1, 1, 1
+    for titulo, oculta in hojas_nuevas.items():
+        while f"xl/worksheets/sheet{siguiente_parte}.xml" in partes or f"xl/worksheets/sheet{siguiente_parte}.xml" in nuevas:
+            siguiente_parte += 1
+        while f"rId{siguiente_rel}" in ids_rel: siguiente_rel += 1
+        ruta, rid = f"xl/worksheets/sheet{siguiente_parte}.xml", f"rId{siguiente_rel}"
+        ids_rel.add(rid)
+        nuevas[ruta] = f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet xmlns="{_NS_HOJA}"><sheetData/></worksheet>'.encode("utf-8")
+        estado = ' state="hidden"' if oculta else ""
+        libro = libro.replace(f"</{p}sheets>", f'<{p}sheet name="{escape(titulo, {chr(34): "&quot;"})}" sheetId="{siguiente_hoja}"{estado} {pr}:id="{rid}"/></{p}sheets>', 1)
+        rels = rels.replace(f"</{p_rel}Relationships>", f'<{p_rel}Relationship Id="{rid}" Type="{_TIPO_HOJA}" Target="worksheets/sheet{siguiente_parte}.xml"/></{p_rel}Relationships>', 1)
+        tipos = tipos.replace("</Types>", f'<Override PartName="/{ruta}" ContentType="{_CONTENIDO_HOJA}"/></Types>', 1)
+        rutas[titulo] = ruta
+        siguiente_hoja += 1
+    nuevas["xl/workbook.xml"] = libro.encode("utf-8")
+    nuevas["xl/_rels/workbook.xml.rels"] = rels.encode("utf-8")
+    nuevas["[Content_Types].xml"] = tipos.encode("utf-8")
+    return rutas
+
+
+def _rutas_hojas(zin):
+    # nombre de hoja -> ruta de su XML dentro del zip
+    libro = zin.read("xl/workbook.xml").decode("utf-8")
+    rels = zin.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+    destinos = {}
+    for rel in re.finditer(r"<(?:\w+:)?Relationship\b([^>]*)/?>", rels):
+        attrs = _atributos(rel.group(1))
+        if "Id" in attrs and "Target" in attrs:
+            destino = attrs["Target"]
+            destino = destino.lstrip("/") if destino.startswith("/") else posixpath.normpath(posixpath.join("xl", destino))
+            destinos[attrs["Id"]] = destino
+    rutas = {}
+    for hoja in re.finditer(r"<(?:\w+:)?sheet\b([^>]*)/?>", libro):
+        attrs = _atributos(hoja.group(1))
+        rid = next((v for k, v in attrs.items() if k == "id" or k.endswith(":id")), None)
+        if "name" in attrs and rid in destinos:
+            rutas[attrs["name"]] = destinos[rid]
+    return rutas
+
+
+_RE_FILA_R = re.compile(r'(?:^|\s)r="(\d+)"')
+_RE_CELDA_R = re.compile(r'(?:^|\s)r="([A-Za-z]+)\d+"')
+_RE_CELDA_S = re.compile(r'(?:^|\s)s="(\d+)"')
+_COLUMNAS = {}
+
+def _indice_columna(letras):
+    if letras not in _COLUMNAS: _COLUMNAS[letras] = column_index_from_string(letras.upper())
+    return _COLUMNAS[letras]
+
+
+def _atributos(texto):
+    return {k: unescape(d or s) for k, d, s in re.findall(r"""([\w:]+)\s*=\s*(?:"([^"]*)"|'([^']*)')""", texto)}
+
+
+def _forzar_recalculo(xml):
+    calc = re.search(r"<((?:\w+:)?)calcPr\b([^>]*?)(/?)>", xml)
+    if calc:
+        if "fullCalcOnLoad" in calc.group(2): return xml
+        nuevo = f'<{calc.group(1)}calcPr{calc.group(2)} fullCalcOnLoad="1"{calc.group(3)}>'
+        return xml[:calc.start()] + nuevo + xml[calc.end():]
+    prefijo = re.search(r"<((?:\w+:)?)workbook\b", xml).group(1)
+    # calcPr va después de sheets / functionGroups / externalReferences / definedNames
+    posicion = -1
+    for etiqueta in ("sheets", "functionGroups", "externalReferences", "definedNames"):
+        for m in re.finditer(rf"</{prefijo}{etiqueta}>|<{prefijo}{etiqueta}\b[^>]*/>", xml):
+            posicion = max(posicion, m.end())
+    if posicion < 0: return xml
+    return xml[:posicion] + f'<{prefijo}calcPr fullCalcOnLoad="1"/>' + xml[posicion:]
+
+
+# ------------------------------------------
+# Hojas
+# ------------------------------------------
+def _parchear_hoja(xml, celdas, estilos):
+    ini = re.search(r"<((?:\w+:)?)sheetData\b[^>]*?(/?)>", xml)
+    if ini is None: raise ValueError("Hoja sin sheetData")
+    p = ini.group(1)
+    if ini.group(2):
+        contenido, fin_datos = "", ini.end()
+        apertura = f"<{p}sheetData>"
+    else:
+        fin = xml.index(f"</{p}sheetData>", ini.end())
+        contenido, fin_datos = xml[ini.end():fin], fin + len(f"</{p}sheetData>")
+        apertura = ini.group(0)
+
+    por_fila = {}
+    for (fila, col), cambio in celdas.items():
+        por_fila.setdefault(fila, {})[col] = cambio
+
+    maestros = {}  # si -> (celda maestra, fórmula) de fórmulas compartidas que se sobrescriben
+    patron_fila = re.compile(rf"<{p}row\b([^>]*?)(?:/>|>(.*?)</{p}row>)", re.S)
+    pendientes = sorted(por_fila)  # filas con cambios, en orden
+    siguiente = 0
+    partes, cursor, implicita = [], 0, 0
+    for m in patron_fila.finditer(contenido):
+        if siguiente >= len(pendientes): break
+        r = _RE_FILA_R.search(m.group(1))
+        num = int(r.group(1)) if r else implicita + 1
+        implicita = num
+        # Filas nuevas que van antes de esta
+        while siguiente < len(pendientes) and pendientes[siguiente] < num:
+            partes.append(contenido[cursor:m.start()]); cursor = m.start()
+            partes.append(_fila_nueva(p, pendientes[siguiente], por_fila[pendientes[siguiente]], estilos))
+            siguiente += 1
+        if siguiente < len(pendientes) and pendientes[siguiente] == num:
+            partes.append(contenido[cursor:m.start()])
+            partes.append(_fila_modificada(p, num, m.group(1), m.group(2) or "", por_fila[num], estilos, maestros))
+            cursor = m.end()
+            siguiente += 1
+    partes.append(contenido[cursor:])
+    for nueva in pendientes[siguiente:]:
+        partes.append(_fila_nueva(p, nueva, por_fila[nueva], estilos))
+    contenido = "".join(partes)
+
+    if maestros:
+        contenido = _expandir_compartidas(p, contenido, maestros)
+
+    xml = xml[:ini.start()] + apertura + contenido + f"</{p}sheetData>" + xml[fin_datos:]
+    return _ampliar_dimension(xml, p, celdas)
+
+
+_TAM_TROZO = 1 << 20  # caracteres leídos por vez en las hojas en flujo
+
+def _parchear_hoja_flujo(entrada, salida, flujo, estilos):
+    """Como _parchear_hoja, pero leyendo y escribiendo la hoja por trozos.
+
+    Solo se mantiene en memoria el trozo actual de filas; los cambios
+    llegan ordenados desde el FlujoCambios.
+    """
+    lector = io.TextIOWrapper(entrada, encoding="utf-8")
+    escritor = io.TextIOWrapper(salida, encoding="utf-8")
+    texto = ""
+    while True:
+        ini = re.search(r"<((?:\w+:)?)sheetData\b[^>]*?(/?)>", texto)
+        if ini: break
+        trozo = lector.read(_TAM_TROZO)
+        if not trozo: raise ValueError("Hoja sin sheetData")
+        texto += trozo
+    p = ini.group(1)
+    min_fila, min_col, max_fila, max_col = flujo.extremos
+    escritor.write(_ampliar_dimension(texto[:ini.start()], p, {(min_fila, min_col): None, (max_fila, max_col): None}))
+    escritor.write(f"<{p}sheetData>")
+
+    pendientes = flujo.filas()
+    siguiente = next(pendientes, None)
+    maestros = {}
+    patron_fila = re.compile(rf"<{p}row\b([^>]*?)(?:/>|>(.*?)</{p}row>)", re.S)
+    cierre_fila, cierre_datos = f"</{p}row>", f"</{p}sheetData>"
+    implicita = 0
+    texto = texto[ini.end():]
+    fin_datos = 0 if ini.group(2) else -1  # <sheetData/>: todas las filas son nuevas
+    while True:
+        if fin_datos < 0:
+            fin_datos = texto.find(cierre_datos)
+            if fin_datos < 0:
+                # Solo se procesan filas completas; el resto espera al siguiente trozo
+                corte = texto.rfind(cierre_fila)
+                trozo = lector.read(_TAM_TROZO)
+                if trozo and corte < 0:
+                    texto += trozo
+                    continue
+                if not trozo: raise ValueError("Hoja sin cierre de sheetData")
+                corte += len(cierre_fila)
+                bloque, texto = texto[:corte], texto[corte:] + trozo
+            else:
+                bloque, texto = texto[:fin_datos], texto[fin_datos + len(cierre_datos):]
+        else:
+            bloque = ""
+
+        partes, cursor = [], 0
+        for m in patron_fila.finditer(bloque):
+            r = _RE_FILA_R.search(m.group(1))
+            num = int(r.group(1)) if r else implicita + 1
+            implicita = num
+            while siguiente is not None and siguiente[0] < num:
+                partes.append(bloque[cursor:m.start()]); cursor = m.start()
+                partes.append(_fila_nueva(p, siguiente[0], siguiente[1], estilos))
+                siguiente = next(pendientes, None)
+            if siguiente is not None and siguiente[0] == num:
+                partes.append(bloque[cursor:m.start()])
+                partes.append(_fila_modificada(p, num, m.group(1), m.group(2) or "", siguiente[1], estilos, maestros))
+                cursor = m.end()
+                siguiente = next(pendientes, None)
+        partes.append(bloque[cursor:])
+        bloque = "".join(partes)
+        if maestros: bloque = _expandir_compartidas(p, bloque, maestros)
+        escritor.write(bloque)
+        if fin_datos >= 0: break
+
+    while siguiente is not None:
+        escritor.write(_fila_nueva(p, siguiente[0], siguiente[1], estilos))
+        siguiente = next(pendientes, None)
+    escritor.write(cierre_datos)
+    escritor.write(texto)
+    while True:
+        trozo = lector.read(_TAM_TROZO)
+        if not trozo: break
+        escritor.write(trozo)
+    escritor.flush()
+    escritor.detach()
+    lector.detach()
+
+
+def _fila_nueva(p, num, cambios, estilos):
+    celdas = "".join(_celda(p, col, num, valor, formato, None, estilos) for col, (valor, formato) in sorted(cambios.items()))
+    return f'<{p}row r="{num}">{celdas}</{p}row>'
+
+
+def _fila_modificada(p, num, attrs_fila, interior, cambios, estilos, maestros):
+    cambios = dict(cambios)
+    # spans es solo una pista de optimización; se quita porque puede quedar corta
+    attrs_fila = re.sub(r'\s+spans="[^"]*"', "", attrs_fila)
+    patron_celda = re.compile(rf"<{p}c\b([^>]*?)(?:/>|>(.*?)</{p}c>)", re.S)
+    partes, cursor, implicita = [], 0, 0
+    for m in patron_celda.finditer(interior):
+        r = _RE_CELDA_R.search(m.group(1))
+        col = _indice_columna(r.group(1)) if r else implicita + 1
+        implicita = col
+        for nueva in sorted(c for c in cambios if c < col):
+            partes.append(interior[cursor:m.start()]); cursor = m.start()
+            valor, formato = cambios.pop(nueva)
+            partes.append(_celda(p, nueva, num, valor, formato, None, estilos))
+        if col in cambios:
+            _registrar_maestro(m.group(2) or "", f"{get_column_letter(col)}{num}", maestros)
+            partes.append(interior[cursor:m.start()])
+            valor, formato = cambios.pop(col)
+            s = _RE_CELDA_S.search(m.group(1))
+            partes.append(_celda(p, col, num, valor, formato, s.group(1) if s else None, estilos))
+            cursor = m.end()
+    partes.append(interior[cursor:])
+    for col in sorted(cambios):
+        valor, formato = cambios[col]
+        partes.append(_celda(p, col, num, valor, formato, None, estilos))
+    return f"<{p}row{attrs_fila}>{''.join(partes)}</{p}row>"
+
+
+def _celda(p, col, fila, valor, formato, estilo, estilos):
+    ref = f"{get_column_letter(col)}{fila}"
+    if formato and estilos is not None:
+        estilo = str(estilos.indice_con_formato(int(estilo or 0), formato))
+    s = f' s="{estilo}"' if estilo and estilo != "0" else ""
+    if valor is None or (isinstance(valor, float) and not math.isfinite(valor)):
+        return f'<{p}c r="{ref}"{s}/>'
+    if isinstance(valor, bool):
+        return f'<{p}c r="{ref}"{s} t="b"><{p}v>{int(valor)}</{p}v></{p}c>'
+    if isinstance(valor, numbers.Integral):
+        return f'<{p}c r="{ref}"{s}><{p}v>{int(valor)}</{p}v></{p}c>'
+    if isinstance(valor, numbers.Real):
+        numero = repr(float(valor))
+        if numero.endswith(".0"): numero = numero[:-2]
+        return f'<{p}c r="{ref}"{s}><{p}v>{numero}</{p}v></{p}c>'
+    texto = str(valor)
+    if texto.startswith("=") and len(texto) > 1:
+        return f'<{p}c r="{ref}"{s}><{p}f>{escape(texto[1:])}</{p}f></{p}c>'
+    return f'<{p}c r="{ref}"{s} t="inlineStr"><{p}is><{p}t xml:space="preserve">{escape(texto)}</{p}t></{p}is></{p}c>'
+
+
+def _registrar_maestro(interior, ref, maestros):
+    f = re.search(r"<(?:\w+:)?f\b([^>]*)>(.*?)</(?:\w+:)?f>", interior, re.S)
+    if not f: return
+    attrs = _atributos(f.group(1))
+    if attrs.get("t") == "shared" and "ref" in attrs and "si" in attrs:
+        maestros[attrs["si"]] = (ref, unescape(f.group(2)))
+
+
+def _expandir_compartidas(p, contenido, maestros):
+    # Las celdas que dependían de un maestro sobrescrito reciben su fórmula explícita
+    patron_celda = re.compile(rf"<{p}c\b([^>]*?)(?<!/)>(.*?)</{p}c>", re.S)
+    patron_f = re.compile(rf"<{p}f\b([^>]*?)(?:/>|>(.*?)</{p}f>)", re.S)
+
+    def reemplazar_celda(m):
+        interior = m.group(2)
+        f = patron_f.search(interior)
+        if not f: return m.group(0)
+        attrs = _atributos(f.group(1))
+        if attrs.get("t") != "shared" or attrs.get("si") not in maestros or "ref" in attrs:
+            return m.group(0)
+        origen, formula = maestros[attrs["si"]]
+        destino = _atributos(m.group(1)).get("r")
+        if not destino: return m.group(0)
+        traducida = Translator("=" + formula, origin=origen).translate_formula(destino)[1:]
+        nuevo_f = f"<{p}f>{escape(traducida)}</{p}f>"
+        return m.group(0)[:m.start(2) - m.start()] + interior[:f.start()] + nuevo_f + interior[f.end():] + f"</{p}c>"
+
+    return patron_celda.sub(reemplazar_celda, contenido)
+
+
+def _ampliar_dimension(xml, p, celdas):
+    dim = re.search(rf'<{p}dimension\b[^>]*ref="([^"]*)"[^>]*/>', xml)
+    if not dim or not celdas: return xml
+    max_fila = max(f for f, _ in celdas)
+    max_col = max(c for _, c in celdas)
+    min_fila = min(f for f, _ in celdas)
+    min_col = min(c for _, c in celdas)
+    try:
+        extremos = dim.group(1).split(":")
+        c1, f1 = coordinate_from_string(extremos[0])
+        c2, f2 = coordinate_from_string(extremos[-1])
+        min_fila, min_col = min(min_fila, f1), min(min_col, column_index_from_string(c1))
+        max_fila, max_col = max(max_fila, f2), max(max_col, column_index_from_string(c2))
+    except ValueError:
+        pass
+    ref = f"{get_column_letter(min_col)}{min_fila}:{get_column_letter(max_col)}{max_fila}"
+    return xml[:dim.start(1)] + ref + xml[dim.end(1):]
+
+
+# ------------------------------------------
+# Estilos
+# ------------------------------------------
+class _Estilos:
+    """styles.xml con altas mínimas: formatos numéricos y cellXfs derivados."""
+
+    def __init__(self, xml):
+        self.xml = xml
+        self.modificado = False
+        self._cache = {}
+
+    def indice_con_formato(self, base, formato):
+        clave = (base, formato)
+        if clave not in self._cache:
+            self._cache[clave] = self._derivar(base, self._id_formato(formato))
+        return self._cache[clave]
+
+    def _id_formato(self, formato):
+        if formato in BUILTIN_FORMATS_REVERSE: return BUILTIN_FORMATS_REVERSE[formato]
+        existentes = {}
+        for m in re.finditer(r"<(?:\w+:)?numFmt\b([^>]*)/?>", self.xml):
+            attrs = _atributos(m.group(1))
+            if "numFmtId" in attrs: existentes[attrs.get("formatCode")] = int(attrs["numFmtId"])
+        if formato in existentes: return existentes[formato]
+        nuevo_id = max([163] + list(existentes.values())) + 1
+        elemento = f'<numFmt numFmtId="{nuevo_id}" formatCode="{escape(formato, {chr(34): "&quot;"})}"/>'
+        grupo = re.search(r"<numFmts\b([^>]*?)(/?)>", self.xml)
+        if grupo and grupo.group(2):
+            self.xml = self.xml[:grupo.start()] + f'<numFmts count="1">{elemento}</numFmts>' + self.xml[grupo.end():]
+        elif grupo:
+            cierre = self.xml.index("</numFmts>", grupo.end())
+            self.xml = self.xml[:cierre] + elemento + self.xml[cierre:]
+            self.xml = _actualizar_conteo(self.xml, "numFmts", len(existentes) + 1)
+        else:
+            raiz = re.search(r"<styleSheet\b[^>]*>", self.xml)
+            self.xml = self.xml[:raiz.end()] + f'<numFmts count="1">{elemento}</numFmts>' + self.xml[raiz.end():]
+        self.modificado = True
+        return nuevo_id
+
+    def _derivar(self, base, id_formato):
+        grupo = re.search(r"<cellXfs\b[^>]*(?<!/)>(.*?)</cellXfs>", self.xml, re.S)
+        if not grupo: return base
+        xfs = re.findall(r"<xf\b[^>]*?/>|<xf\b[^>]*?>.*?</xf>", grupo.group(1), re.S)
+        if not xfs: return base
+        original = xfs[base] if base < len(xfs) else xfs[0]
+        apertura = re.match(r"<xf\b[^>]*?(?=/?>)", original).group(0)
+        if _atributos(apertura).get("numFmtId") == str(id_formato): return base
+        nueva = re.sub(r'\s+(numFmtId|applyNumberFormat)="[^"]*"', "", apertura).rstrip()
+        nueva = nueva + f' numFmtId="{id_formato}" applyNumberFormat="1"'
+        derivado = nueva + original[len(apertura):]
+        if derivado in xfs: return xfs.index(derivado)
+        fin = grupo.end(1)
+        self.xml = self.xml[:fin] + derivado + self.xml[fin:]
+        self.xml = _actualizar_conteo(self.xml, "cellXfs", len(xfs) + 1)
+        self.modificado = True
+        return len(xfs)
+
+
+def _actualizar_conteo(xml, etiqueta, conteo):
+    m = re.search(rf"<{etiqueta}\b([^>]*)>", xml)
+    if not m: return xml
+    attrs = m.group(1)
+    if 'count="' in attrs: attrs = re.sub(r'count="\d+"', f'count="{conteo}"', attrs)
+    else: attrs = f' count="{conteo}"' + attrs
+    return xml[:m.start()] + f"<{etiqueta}{attrs}>" + xml[m.end():]
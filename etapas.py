@@ -0,0 +1,272 @@
+import importlib
+import io
+import multiprocessing
+import multiprocessing.util
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import openpyxl
+
+from instrumentacion import PicoMemoria
+from normalizacion import normalizar_texto
+
+
+# ==========================================
+# 🧩 ETAPAS CON LECTURAS Y ESCRITURAS DECLARADAS
+# ==========================================
+class Etapa:
+    """Una etapa del procesamiento y las hojas que toca.
+
+    - `lee` / `escribe`: hojas del libro editable (nombre o parte del nombre).
+    - `lee_archivo`: hojas de las que solo usa los valores guardados en el
+      archivo original; nadie los modifica, así que no generan conflictos.
+    - Local: `funcion(registro)` corre en el proceso principal sobre el libro.
+    - `en_proceso=True`: `funcion(instantanea, callback_log)` (de nivel de
+      módulo) corre en el pool de etapas sobre una InstantaneaColumnas con
+      solo las hojas de `lee`, y `al_terminar(resultado, registro)` corre
+      después en el proceso principal.
+    """
+
+    def __init__(self, nombre, funcion, lee=(), escribe=(), lee_archivo=(), en_proceso=False, al_terminar=None):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.lee = {normalizar_texto(h) for h in lee}
+        self.escribe = {normalizar_texto(h) for h in escribe}
+        self.lee_archivo = {normalizar_texto(h) for h in lee_archivo}
+        self.en_proceso = en_proceso
+        self.al_terminar = al_terminar
+
+    def choca_con(self, otra):
+        """True si no pueden correr a la vez (una escribe lo que la otra lee o escribe)."""
+        return bool(self.escribe & (otra.lee | otra.escribe) or otra.escribe & self.lee)
+
+
+def dependencias(etapas):
+    """Para cada etapa, las anteriores (en el orden declarado) con las que choca."""
+    return {e.nombre: [o for o in etapas[:i] if e.choca_con(o)] for i, e in enumerate(etapas)}
+
+
+# ==========================================
+# 📸 INSTANTÁNEA COMPACTA PARA OTRO PROCESO
+# ==========================================
+class _Celda:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class HojaInstantanea:
+    """Copia de los valores de una hoja con lo que usan las etapas de un Worksheet."""
+
+    def __init__(self, title, filas):
+        self.title = title
+        self.filas = [list(f) for f in filas]
+
+    @property
+    def max_row(self):
+        return len(self.filas)
+
+    @property
+    def max_column(self):
+        return max((len(f) for f in self.filas), default=0)
+
+    def cell(self, row, column):
+        if row <= len(self.filas) and column <= len(self.filas[row - 1]):
+            return _Celda(self.filas[row - 1][column - 1])
+        return _Celda(None)
+
+    def poner(self, fila, columna, valor):
+        while len(self.filas) < fila: self.filas.append([])
+        celdas = self.filas[fila - 1]
+        if len(celdas) < columna: celdas.extend([None] * (columna - len(celdas)))
+        celdas[columna - 1] = valor
+
+    def iter_rows(self, min_row=1, max_col=None, values_only=True):
+        for fila in self.filas[min_row - 1:]:
+            yield tuple(fila[:max_col]) if max_col else tuple(fila)
+
+
+class RegistroCambios:
+    """Como ConjuntoCambios, pero solo anota: las escrituras se aplican después en el proceso principal."""
+
+    def __init__(self):
+        self.escrituras = []
+
+    def escribir(self, ws, fila, columna, valor, formato=None):
+        ws.poner(fila, columna, valor)
+        self.escrituras.append((ws.title, fila, columna, valor, formato))
+
+    def __len__(self):
+        return len(self.escrituras)
+
+
+class InstantaneaColumnas:
+    """Lo mínimo de una InstantaneaLibro para correr una etapa en otro proceso.
+
+    Trae copiadas solo las hojas que la etapa declara en `lee` (estado
+    actual del libro editable) y los bytes del archivo original para leer
+    valores guardados con `columnas` (o la entrada de la caché de hojas, si
+    la hay). Las demás hojas existen solo de nombre.
+    """
+
+    def __init__(self, contenido, nombres, hojas, cache_hojas=None):
+        self.contenido = contenido
+        self.nombres = list(nombres)
+        self.hojas = hojas
+        self.cache_hojas = cache_hojas
+        self.cambios = RegistroCambios()
+        self._wb_valores = None
+
+    @classmethod
+    def desde(cls, instantanea, lee):
+        hojas = {}
+        for nombre in lee:
+            titulo = instantanea.nombre_hoja(nombre, contiene=True)
+            if titulo and titulo not in hojas:
+                hojas[titulo] = HojaInstantanea(titulo, instantanea.wb[titulo].iter_rows(values_only=True))
+        return cls(instantanea.contenido, instantanea.wb.sheetnames, hojas, instantanea.cache_hojas)
+
+    def nombre_hoja(self, nombre, contiene=False):
+        objetivo = normalizar_texto(nombre)
+        for sheet_name in self.nombres:
+            norm = normalizar_texto(sheet_name)
+            if norm == objetivo or (contiene and objetivo in norm):
+                return sheet_name
+        return None
+
+    def hoja(self, nombre, contiene=False):
+        sheet_name = self.nombre_hoja(nombre, contiene)
+        if not sheet_name: return None
+        return self.hojas.get(sheet_name) or HojaInstantanea(sheet_name, ())
+
+    def formulas(self, nombre, min_row=1, max_col=None, contiene=False):
+        ws = self.hoja(nombre, contiene)
+        if ws is None: return iter(())
+        return ws.iter_rows(min_row=min_row, max_col=max_col)
+
+    def columnas(self, nombre, indices, min_row=1, contiene=False):
+        """Valores guardados de algunas columnas, fila a fila (como InstantaneaLibro.columnas)."""
+        sheet_name = self.nombre_hoja(nombre, contiene)
+        if not sheet_name: return
+        vista = self.cache_hojas.vista(sheet_name, data_only=True, min_row=min_row, indices=indices) if self.cache_hojas else None
+        if vista is not None:
+            yield from vista.filas()
+            return
+        if self._wb_valores is None:
+            self._wb_valores = openpyxl.load_workbook(io.BytesIO(self.contenido), data_only=True, read_only=True)
+        ultima = max(indices)
+        for fila in self._wb_valores[sheet_name].iter_rows(min_row=min_row, values_only=True):
+            if len(fila) > ultima: yield tuple(fila[i] for i in indices)
+
+    def cerrar(self):
+        if self._wb_valores is not None:
+            self._wb_valores.close()
+            self._wb_valores = None
+
+
+# ==========================================
+# 🏭 POOL DE ETAPAS Y PLANIFICADOR
+# ==========================================
+# Un solo pool por proceso, reutilizado entre corridas (arrancar procesos cuesta)
+_POOL = None
+_candado_pool = threading.Lock()
+
+def pool_etapas(procesos):
+    global _POOL
+    with _candado_pool:
+        if _POOL is None:
+            contexto = multiprocessing.get_context("spawn")
+            _POOL = ProcessPoolExecutor(max_workers=procesos, mp_context=contexto)
+            # Si este proceso es a su vez un trabajador (cola de trabajos), al salir
+            # multiprocessing espera a sus hijos: el pool tiene que cerrarse antes (y antes
+            # de que se cierren las colas internas, que usan prioridad 10)
+            multiprocessing.util.Finalize(None, descartar_pool, kwargs={"esperar": True}, exitpriority=100)
+        return _POOL
+
+def descartar_pool(esperar=False):
+    global _POOL
+    with _candado_pool:
+        pool, _POOL = _POOL, None
+    if pool is not None: pool.shutdown(wait=esperar, cancel_futures=True)
+
+def _importar(modulo):
+    importlib.import_module(modulo)
+
+def calentar(pool, modulo):
+    """Hace que el pool arranque e importe `modulo` mientras el principal sigue con lo suyo."""
+    try: pool.submit(_importar, modulo)
+    except Exception: pass
+
+def _correr_en_proceso(funcion, instantanea):
+    logs = []
+    inicio = time.perf_counter()
+    try:
+        with PicoMemoria() as pico: resultado = funcion(instantanea, logs.append)
+    finally: instantanea.cerrar()
+    return resultado, instantanea.cambios.escrituras, logs, round(time.perf_counter() - inicio, 4), pico.mb
+
+
+def ejecutar_etapas(etapas, instantanea, instr, callback_log, pool=None):
+    """Corre las etapas respetando sus conflictos.
+
+    Las locales corren en el orden declarado. Las `en_proceso` se mandan al
+    pool apenas terminan las etapas con las que chocan y corren mientras
+    tanto; sus escrituras y mensajes se integran siguiendo el orden
+    declarado (antes de la primera etapa que dependa de ellas, o al final),
+    así el resultado no depende de cuál termina primero. Sin pool, o si el
+    pool falla, todo corre aquí en orden.
+    """
+    deps = dependencias(etapas)
+    futuros, hechas = {}, set()
+
+    def correr_local(etapa):
+        with instr.etapa(etapa.nombre) as registro:
+            if not etapa.en_proceso:
+                etapa.funcion(registro)
+            else:
+                resultado = etapa.funcion(instantanea, callback_log)
+                if etapa.al_terminar: etapa.al_terminar(resultado, registro)
+        hechas.add(etapa.nombre)
+
+    def lanzar_listas():
+        if pool is None: return
+        for etapa in etapas:
+            if not etapa.en_proceso or etapa.nombre in futuros or etapa.nombre in hechas: continue
+            if all(d.nombre in hechas for d in deps[etapa.nombre]):
+                try: futuros[etapa.nombre] = pool.submit(_correr_en_proceso, etapa.funcion,
+                                                         InstantaneaColumnas.desde(instantanea, etapa.lee))
+                except Exception as e:
+                    callback_log(f"⚠️ No se pudo usar el pool de etapas ({str(e)}); {etapa.nombre} corre aquí.")
+
+    def esperar(etapa):
+        if etapa.nombre in hechas: return
+        futuro = futuros.get(etapa.nombre)
+        if futuro is None:
+            correr_local(etapa)
+            return
+        try:
+            resultado, escrituras, logs, segundos, rss = futuro.result()
+        except Exception as e:
+            callback_log(f"⚠️ {etapa.nombre}: falló en el pool de etapas ({str(e)}); se corre aquí.")
+            descartar_pool()
+            correr_local(etapa)
+            return
+        for msg in logs: callback_log(msg)
+        for titulo, fila, columna, valor, formato in escrituras:
+            instantanea.cambios.escribir(instantanea.wb[titulo], fila, columna, valor, formato)
+        registro = {"etapa": etapa.nombre, "segundos": segundos, "filas": None, "rss_pico_mb": rss, "proceso": "pool"}
+        if etapa.al_terminar: etapa.al_terminar(resultado, registro)
+        instr.registrar_externa(registro)
+        hechas.add(etapa.nombre)
+
+    lanzar_listas()
+    for etapa in etapas:
+        for dep in deps[etapa.nombre]: esperar(dep)
+        if etapa.en_proceso and pool is not None:
+            lanzar_listas()
+            if etapa.nombre in futuros: continue
+        correr_local(etapa)
+        lanzar_listas()
+    for etapa in etapas: esperar(etapa)
@@ -0,0 +1,117 @@
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+from normalizacion import normalizar_texto
+
+
+# ==========================================
+# 📆 LECTURA DE FECHAS (COMPARTIDA)
+# ==========================================
+MESES_ES = {1: "ENERO", 2: "FEBRERO", 3: "MARZO", 4: "ABRIL", 5: "MAYO", 6: "JUNIO",
+            7: "JULIO", 8: "AGOSTO", 9: "SEPTIEMBRE", 10: "OCTUBRE", 11: "NOVIEMBRE", 12: "DICIEMBRE"}
+ABREVIATURAS_MES = {"ENE": "ENERO", "FEB": "FEBRERO", "MAR": "MARZO", "ABR": "ABRIL", "MAY": "MAYO", "JUN": "JUNIO",
+                    "JUL": "JULIO", "AGO": "AGOSTO", "SEP": "SEPTIEMBRE", "OCT": "OCTUBRE", "NOV": "NOVIEMBRE", "DIC": "DICIEMBRE"}
+
+# Formatos en orden de prioridad (el primero que sirve gana, igual que antes)
+FORMATOS_API = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%y", "%d-%m-%Y")
+FORMATOS_MES = ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%y", "%d-%m-%Y", "%d/%m/%y", "%m/%d/%Y", "%m-%Y", "%m/%Y")
+
+# Seriales de Excel: números por debajo de 367 (antes de 1901) no se tratan como fechas
+EPOCA_EXCEL = date(1899, 12, 30)
+SERIAL_EXCEL_MINIMO = 367
+SERIAL_EXCEL_MAXIMO = 2958465
+
+# Dígitos que acepta strptime en cada directiva usada
+_LONGITUDES = {"%d": (1, 2), "%m": (1, 2), "%Y": (4,), "%y": (2,)}
+_RE_TOKENS = re.compile(r"\d+|\D+")
+_RE_DIRECTIVAS = re.compile(r"%[dmYy]|[^%]+")
+
+def nombre_mes_es(mes_num):
+    return MESES_ES.get(mes_num, "")
+
+def desde_serial_excel(valor):
+    """Fecha de un serial de Excel, o None si el número no parece una fecha."""
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)): return None
+    if not SERIAL_EXCEL_MINIMO <= valor <= SERIAL_EXCEL_MAXIMO: return None
+    return EPOCA_EXCEL + timedelta(days=int(valor))
+
+def _forma(texto):
+    # "03/04/2025" -> (2, "/", 2, "/", 4)
+    return tuple(len(t) if t[0].isdigit() else t for t in _RE_TOKENS.findall(texto))
+
+def _formato_compatible(fmt, forma):
+    partes = _RE_DIRECTIVAS.findall(fmt)
+    if len(partes) != len(forma): return False
+    for parte, token in zip(partes, forma):
+        if parte in _LONGITUDES:
+            if token not in _LONGITUDES[parte]: return False
+        elif parte != token: return False
+    return True
+
+
+class LectorFechas:
+    """Lector de fechas de una columna.
+
+    La forma de cada texto (longitud de los grupos de dígitos y separadores)
+    decide una sola vez qué formatos pueden servir, en el mismo orden de
+    prioridad de siempre, así no se prueban formatos que van a fallar.
+    Cada valor distinto se resuelve una vez (LRU). Las celdas datetime/date
+    y los seriales de Excel se leen directo, sin pasar por texto.
+    """
+
+    def __init__(self, nombre="", tam_cache=8192):
+        self.nombre = nombre
+        self._candidatos = {}
+        self.iso = lru_cache(maxsize=tam_cache, typed=True)(self._iso)
+        self.mes = lru_cache(maxsize=tam_cache, typed=True)(self._mes)
+
+    def _parsear(self, texto, formatos):
+        forma = _forma(texto)
+        clave = (formatos, forma)
+        candidatos = self._candidatos.get(clave)
+        if candidatos is None:
+            candidatos = [fmt for fmt in formatos if _formato_compatible(fmt, forma)]
+            self._candidatos[clave] = candidatos
+        for fmt in candidatos:
+            try: return datetime.strptime(texto, fmt)
+            except ValueError: continue
+        # Casos raros que la forma no anticipa (p. ej. espacios dentro del día)
+        for fmt in formatos:
+            if fmt in candidatos: continue
+            try: return datetime.strptime(texto, fmt)
+            except ValueError: continue
+        return None
+
+    def _iso(self, valor):
+        """Fecha 'YYYY-MM-DD' de una celda, o None."""
+        if not valor: return None
+        if isinstance(valor, datetime): return valor.strftime("%Y-%m-%d")
+        if isinstance(valor, date): return valor.isoformat()
+        serial = desde_serial_excel(valor)
+        if serial: return serial.isoformat()
+        try:
+            resultado = self._parsear(str(valor).strip(), FORMATOS_API)
+            return resultado.strftime("%Y-%m-%d") if resultado else None
+        except Exception: return None
+
+    def _mes(self, valor):
+        """Nombre del mes en español de una celda (o el texto normalizado si no hay fecha)."""
+        if not valor: return ""
+        if isinstance(valor, (datetime, date)): return nombre_mes_es(valor.month)
+        serial = desde_serial_excel(valor)
+        if serial: return nombre_mes_es(serial.month)
+
+        txt = str(valor).strip().upper()
+
+        for i in range(1, 13):
+            nombre = nombre_mes_es(i)
+            if nombre in txt: return nombre
+
+        resultado = self._parsear(txt.split(" ")[0], FORMATOS_MES)
+        if resultado: return nombre_mes_es(resultado.month)
+
+        for abrv, completo in ABREVIATURAS_MES.items():
+            if abrv in txt: return completo
+
+        return normalizar_texto(txt)
@@ -0,0 +1,280 @@
+import re
+from datetime import date, datetime, time
+
+from openpyxl.utils.cell import column_index_from_string
+from openpyxl.utils.datetime import to_excel
+
+
+# ==========================================
+# 🧮 EVALUADOR MÍNIMO DE FÓRMULAS
+# ==========================================
+class FormulaNoSoportada(Exception):
+    """La fórmula usa algo fuera del subconjunto soportado (o no se puede calcular aquí)."""
+
+
+class ErrorExcel(Exception):
+    """Error de Excel (#DIV/0!, #VALUE!...). Se propaga como en Excel y el resultado es su texto."""
+
+
+_TOKENS = re.compile(r"""
+    \s+
+  | (?P<numero>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<texto>"(?:[^"]|"")*")
+  | (?P<ref>(?:(?P<hoja>'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)?
+        \$?(?P<col1>[A-Za-z]{1,3})\$?(?P<fila1>\d+)
+        (?::\$?(?P<col2>[A-Za-z]{1,3})\$?(?P<fila2>\d+))?)(?![\w(])
+  | (?P<funcion>[A-Za-z][A-Za-z0-9.]*)\s*\(
+  | (?P<logico>TRUE|FALSE)\b
+  | (?P<op>[-+*/^%(),;])
+""", re.VERBOSE | re.IGNORECASE)
+
+_MAX_CELDAS_RANGO = 1_000_000
+
+
+def _tokenizar(formula):
+    tokens, pos = [], 0
+    while pos < len(formula):
+        m = _TOKENS.match(formula, pos)
+        if m is None: raise FormulaNoSoportada(f"no se entiende '{formula[pos:pos + 10]}'")
+        pos = m.end()
+        tipo = m.lastgroup
+        if tipo is None: continue
+        if tipo in ("hoja", "col1", "fila1", "col2", "fila2"): tipo = "ref"
+        tokens.append((tipo, m))
+    return tokens
+
+
+def _numero(valor):
+    """Conversión de Excel para aritmética: vacío = 0, lógicos 1/0, texto numérico."""
+    if isinstance(valor, ErrorExcel): raise valor
+    if valor is None: return 0
+    if isinstance(valor, bool): return int(valor)
+    if isinstance(valor, (int, float)): return valor
+    if isinstance(valor, (datetime, date, time)): return to_excel(valor)
+    try: return float(str(valor).strip())
+    except ValueError: raise ErrorExcel("#VALUE!")
+
+
+def _aplanar_numeros(argumento):
+    # En rangos Excel ignora texto, lógicos y vacíos; los valores sueltos se convierten
+    if isinstance(argumento, _Rango):
+        for valor in argumento.valores:
+            if isinstance(valor, ErrorExcel): raise valor
+            if isinstance(valor, (int, float)) and not isinstance(valor, bool): yield valor
+            elif isinstance(valor, (datetime, date, time)): yield to_excel(valor)
+    else:
+        yield _numero(argumento)
+
+
+def _sum(args):
+    return sum(n for a in args for n in _aplanar_numeros(a))
+
+def _round(args):
+    if len(args) != 2: raise FormulaNoSoportada("ROUND con cantidad de argumentos inválida")
+    numero, decimales = _numero(args[0]), int(_numero(args[1]))
+    # Excel redondea lejos del cero (no al par como round())
+    factor = 10 ** decimales
+    return (1 if numero >= 0 else -1) * int(abs(numero) * factor + 0.5 + 1e-9) / factor
+
+def _abs(args):
+    if len(args) != 1: raise FormulaNoSoportada("ABS con cantidad de argumentos inválida")
+    return abs(_numero(args[0]))
+
+FUNCIONES = {"SUM": _sum, "ROUND": _round, "ABS": _abs}
+
+
+class _Rango:
+    def __init__(self, valores):
+        self.valores = valores
+
+
+class EvaluadorFormulas:
+    """Calcula fórmulas sencillas sobre un libro openpyxl ya cargado (con fórmulas).
+
+    Soporta números, texto entre comillas, TRUE/FALSE, referencias (A1, $A$1,
+    'Otra hoja'!A1), rangos dentro de funciones, + - * / ^ %, paréntesis y las
+    funciones de FUNCIONES. Cada celda se calcula una sola vez (memo), y sus
+    dependencias también.
+
+    Lo que no se soporta lanza FormulaNoSoportada; si hay `respaldo`
+    (titulo, fila, columna) -> valor guardado en el archivo, se usa ese valor.
+    Las hojas de `hojas_ausentes` no están completas en el libro (modo flujo):
+    referirlas también cae al respaldo.
+    """
+
+    def __init__(self, wb, respaldo=None, hojas_ausentes=()):
+        self.wb = wb
+        self.respaldo = respaldo
+        self.hojas_ausentes = {h for h in hojas_ausentes if h}
+        self._hojas = {ws.title.upper(): ws for ws in wb.worksheets}
+        self._limites = {}
+        self._memo = {}
+        self._en_curso = set()
+        self.calculadas = 0
+        self.con_respaldo = 0
+
+    def valor(self, ws, fila, columna):
+        """Valor de la celda: su contenido, o el resultado si es fórmula (None si no se pudo)."""
+        try: resultado = self._celda(ws, fila, columna)
+        except FormulaNoSoportada: return None
+        return str(resultado) if isinstance(resultado, ErrorExcel) else resultado
+
+    def valor_celda(self, celda):
+        if not _es_formula(celda.value): return celda.value
+        return self.valor(celda.parent, celda.row, celda.column)
+
+    def valores_filas(self, ws, min_row=1, max_row=None):
+        """Filas de la hoja con las fórmulas ya calculadas (como iter_rows(values_only=True))."""
+        max_fila = self._limites_hoja(ws)[0]
+        max_row = max_fila if max_row is None else min(max_row, max_fila)
+        for fila in ws.iter_rows(min_row=min_row, max_row=max_row):
+            yield tuple(self.valor_celda(c) for c in fila)
+
+    def _limites_hoja(self, ws):
+        limites = self._limites.get(ws.title)
+        if limites is None: limites = self._limites[ws.title] = (ws.max_row, ws.max_column)
+        return limites
+
+    def _contenido(self, ws, fila, columna):
+        # Sin crear celdas fuera de la hoja (ws.cell las agregaría)
+        max_fila, max_col = self._limites_hoja(ws)
+        if fila > max_fila or columna > max_col: return None
+        return ws.cell(row=fila, column=columna).value
+
+    def _celda(self, ws, fila, columna):
+        # Los errores de Excel vuelven como ErrorExcel para que se propaguen
+        clave = (ws.title, fila, columna)
+        if clave in self._memo:
+            resultado = self._memo[clave]
+            if isinstance(resultado, FormulaNoSoportada): raise resultado
+            return resultado
+        contenido = self._contenido(ws, fila, columna)
+        if not _es_formula(contenido): return contenido
+        if clave in self._en_curso: raise FormulaNoSoportada("referencia circular")
+
+        self._en_curso.add(clave)
+        try:
+            resultado = self._evaluar(contenido[1:], ws)
+            self.calculadas += 1
+        except ErrorExcel as e:
+            resultado = e
+            self.calculadas += 1
+        except (FormulaNoSoportada, RecursionError, ZeroDivisionError, OverflowError, ValueError) as e:
+            guardado = self.respaldo(ws.title, fila, columna) if self.respaldo else None
+            if guardado is None:
+                resultado = e if isinstance(e, FormulaNoSoportada) else FormulaNoSoportada(str(e))
+            else:
+                resultado = guardado
+                self.con_respaldo += 1
+        finally:
+            self._en_curso.discard(clave)
+        self._memo[clave] = resultado
+        if isinstance(resultado, FormulaNoSoportada): raise resultado
+        return resultado
+
+    # --- Análisis descendente: expresión -> término -> potencia -> unario -> primario ---
+    def _evaluar(self, formula, ws):
+        self._tokens = _tokenizar(formula)
+        self._pos = 0
+        self._ws = ws
+        valor = self._expresion()
+        if self._pos != len(self._tokens): raise FormulaNoSoportada(f"sobra texto en '={formula}'")
+        if isinstance(valor, _Rango): raise FormulaNoSoportada("rango fuera de una función")
+        # "=A1" con A1 vacía vale 0 en Excel
+        return 0 if valor is None else valor
+
+    def _siguiente(self, *ops):
+        if self._pos < len(self._tokens):
+            tipo, m = self._tokens[self._pos]
+            if tipo == "op" and m.group(0) in ops:
+                self._pos += 1
+                return m.group(0)
+        return None
+
+    def _expresion(self):
+        valor = self._termino()
+        while (op := self._siguiente("+", "-")):
+            derecho = self._termino()
+            valor = _numero(valor) + _numero(derecho) if op == "+" else _numero(valor) - _numero(derecho)
+        return valor
+
+    def _termino(self):
+        valor = self._potencia()
+        while (op := self._siguiente("*", "/")):
+            derecho = _numero(self._potencia())
+            if op == "*": valor = _numero(valor) * derecho
+            elif derecho == 0: raise ErrorExcel("#DIV/0!")
+            else: valor = _numero(valor) / derecho
+        return valor
+
+    def _potencia(self):
+        valor = self._unario()
+        while self._siguiente("^"):
+            valor = _numero(valor) ** _numero(self._unario())
+        return valor
+
+    def _unario(self):
+        op = self._siguiente("+", "-")
+        if op: return _numero(self._unario()) * (-1 if op == "-" else 1)
+        valor = self._primario()
+        while self._siguiente("%"): valor = _numero(valor) / 100
+        return valor
+
+    def _primario(self):
+        if self._pos >= len(self._tokens): raise FormulaNoSoportada("fórmula incompleta")
+        tipo, m = self._tokens[self._pos]
+        self._pos += 1
+        if tipo == "numero":
+            texto = m.group("numero")
+            return float(texto) if any(c in texto for c in ".eE") else int(texto)
+        if tipo == "texto": return m.group("texto")[1:-1].replace('""', '"')
+        if tipo == "logico": return m.group("logico").upper() == "TRUE"
+        if tipo == "ref": return self._referencia(m)
+        if tipo == "funcion": return self._funcion(m.group("funcion").upper())
+        if tipo == "op" and m.group(0) == "(":
+            valor = self._expresion()
+            if not self._siguiente(")"): raise FormulaNoSoportada("falta ')'")
+            return valor
+        raise FormulaNoSoportada(f"no se esperaba '{m.group(0)}'")
+
+    def _funcion(self, nombre):
+        funcion = FUNCIONES.get(nombre)
+        if funcion is None: raise FormulaNoSoportada(f"función {nombre} no soportada")
+        args = []
+        if not self._siguiente(")"):
+            while True:
+                args.append(self._expresion())
+                if self._siguiente(")"): break
+                if not self._siguiente(",", ";"): raise FormulaNoSoportada(f"argumentos de {nombre}")
+        return funcion(args)
+
+    def _referencia(self, m):
+        ws = self._ws
+        if m.group("hoja"):
+            titulo = m.group("hoja")
+            if titulo.startswith("'"): titulo = titulo[1:-1].replace("''", "'")
+            ws = self._hojas.get(titulo.upper())
+            if ws is None: raise ErrorExcel("#REF!")
+        if ws.title in self.hojas_ausentes: raise FormulaNoSoportada(f"la hoja {ws.title} no está en memoria")
+
+        col1, fila1 = column_index_from_string(m.group("col1").upper()), int(m.group("fila1"))
+        if not m.group("col2"):
+            # El estado de la fórmula actual se guarda: la celda referida puede evaluar la suya
+            estado = self._tokens, self._pos, self._ws
+            try: return self._celda(ws, fila1, col1)
+            finally: self._tokens, self._pos, self._ws = estado
+
+        col2, fila2 = column_index_from_string(m.group("col2").upper()), int(m.group("fila2"))
+        (f_ini, f_fin), (c_ini, c_fin) = sorted((fila1, fila2)), sorted((col1, col2))
+        max_fila, max_col = self._limites_hoja(ws)
+        f_fin, c_fin = min(f_fin, max_fila), min(c_fin, max_col)
+        if (f_fin - f_ini + 1) * (c_fin - c_ini + 1) > _MAX_CELDAS_RANGO: raise FormulaNoSoportada("rango demasiado grande")
+        estado = self._tokens, self._pos, self._ws
+        try:
+            valores = [self._celda(ws, f, c) for f in range(f_ini, f_fin + 1) for c in range(c_ini, c_fin + 1)]
+        finally: self._tokens, self._pos, self._ws = estado
+        return _Rango(valores)
+
+
+def _es_formula(valor):
+    return isinstance(valor, str) and valor.startswith("=") and len(valor) > 1
@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import json
+import zlib
+from datetime import date, datetime, time
+
+
+# ==========================================
+# ♻️ ESTADO INCREMENTAL (HOJA OCULTA)
+# ==========================================
+HOJA_ESTADO = "_PLATCO_ESTADO"
+VERSION_ESTADO = 1
+TAM_BLOQUE = 512
+# Una celda de Excel admite 32767 caracteres; múltiplo de 4 para no partir grupos base64
+_TAM_TROZO = 32000
+
+def _valor_huella(v):
+    # Mismo texto para el valor escrito por el bot y el que se lee del archivo guardado.
+    # Excel/openpyxl reescriben los decimales con menos dígitos: se comparan 12 significativos.
+    if v is None or v == "": return ""
+    if isinstance(v, bool): return repr(v)
+    if isinstance(v, (int, float)): return format(float(v), ".12g")
+    if isinstance(v, (datetime, date, time)): return v.isoformat()
+    return str(v)
+
+def huella_filas(filas):
+    h = hashlib.blake2b(digest_size=8)
+    for fila in filas:
+        h.update("\x1f".join(map(_valor_huella, fila)).encode("utf-8", "surrogatepass"))
+        h.update(b"\x1e")
+    return h.hexdigest()
+
+
+class EstadoIncremental:
+    """Huellas por bloque de filas de una hoja, guardadas dentro del propio libro.
+
+    Cada bloque de TAM_BLOQUE filas guarda [huella, pendiente, aportes]:
+    la huella de sus valores tal como quedaron tras la última corrida, si
+    quedó algo por resolver (p. ej. una tasa que aún no existía) y lo que
+    aportó a etapas posteriores. En la siguiente corrida, los bloques con la
+    misma huella, sin pendientes y con la misma versión de reglas se saltan.
+    """
+
+    def __init__(self, version="", tam_bloque=TAM_BLOQUE, bloques=None):
+        self.version = version
+        self.tam_bloque = tam_bloque
+        self.bloques = bloques or []
+        self.reutilizados = {}
+
+    # --- Lectura / escritura en la hoja oculta ---
+    @classmethod
+    def leer(cls, wb):
+        """Estado guardado en el libro, o None si no hay (o no se puede leer)."""
+        if HOJA_ESTADO not in wb.sheetnames: return None
+        try:
+            trozos = [fila[0] for fila in wb[HOJA_ESTADO].iter_rows(min_col=1, max_col=1, values_only=True) if fila[0]]
+            datos = json.loads(zlib.decompress(base64.b64decode("".join(trozos))))
+            if datos.get("formato") != VERSION_ESTADO: return None
+            return cls(datos["version"], datos["tam_bloque"], datos["bloques"])
+        except Exception:
+            return None
+
+    def guardar(self, wb, cambios):
+        datos = {"formato": VERSION_ESTADO, "version": self.version, "tam_bloque": self.tam_bloque, "bloques": self.bloques}
+        texto = base64.b64encode(zlib.compress(json.dumps(datos, separators=(",", ":")).encode("utf-8"), 6)).decode("ascii")
+        trozos = [texto[i:i + _TAM_TROZO] for i in range(0, len(texto), _TAM_TROZO)]
+        if HOJA_ESTADO in wb.sheetnames:
+            ws = wb[HOJA_ESTADO]
+            sobrantes = ws.max_row
+        else:
+            ws = cambios.crear_hoja(wb, HOJA_ESTADO, oculta=True)
+            sobrantes = 0
+        for r, trozo in enumerate(trozos, start=1):
+            cambios.escribir(ws, r, 1, trozo)
+        for r in range(len(trozos) + 1, sobrantes + 1):
+            if ws.cell(row=r, column=1).value is not None: cambios.escribir(ws, r, 1, None)
+
+    # --- Plan de la corrida ---
+    def planificar(self, filas, version, fila_inicial):
+        """Filas (números de fila) que se pueden omitir porque no cambiaron."""
+        self.reutilizados = {}
+        if version != self.version: return set()
+        omitir = set()
+        t = self.tam_bloque
+        for i in range(min(len(self.bloques), (len(filas) + t - 1) // t)):
+            huella, pendiente, _ = self.bloques[i]
+            if pendiente: continue
+            if huella_filas(filas[i * t:(i + 1) * t]) != huella: continue
+            self.reutilizados[i] = self.bloques[i]
+            omitir.update(range(fila_inicial + i * t, fila_inicial + min((i + 1) * t, len(filas))))
+        return omitir
+
+    def actualizar(self, ws, version, fila_inicial, max_col, resumir_bloque):
+        """Recalcula los bloques no reutilizados con los valores ya procesados.
+
+        resumir_bloque(filas, desplazamiento) -> (pendiente, aportes)
+        """
+        t = self.tam_bloque
+        total = max(0, ws.max_row - fila_inicial + 1)
+        bloques = []
+        for i in range((total + t - 1) // t):
+            if i in self.reutilizados:
+                bloques.append(self.reutilizados[i])
+                continue
+            desde = fila_inicial + i * t
+            filas = list(ws.iter_rows(min_row=desde, max_row=min(desde + t - 1, fila_inicial + total - 1),
+                                      max_col=max_col, values_only=True))
+            pendiente, aportes = resumir_bloque(filas, i * t)
+            bloques.append([huella_filas(filas), bool(pendiente), aportes])
+        self.version = version
+        self.bloques = bloques
+        self.reutilizados = {}
+
+    def aportes(self):
+        return [a for _, _, aportes in self.bloques for a in aportes]
@@ -0,0 +1,180 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+# ==========================================
+# ⏱️ INSTRUMENTACIÓN POR ETAPAS
+# ==========================================
+def rss_pico_mb():
+    """Memoria residente máxima del proceso en toda su vida (MB), o None si no se puede medir.
+
+    En un trabajador reutilizado incluye lo que usaron los trabajos anteriores:
+    para una etapa usar PicoMemoria.
+    """
+    if resource is None: return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def rss_actual_mb():
+    """Memoria residente actual del proceso (MB), o None si no se puede medir (sin /proc)."""
+    try:
+        with open("/proc/self/statm") as f: paginas = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError): return None
+    return paginas * os.sysconf("SC_PAGE_SIZE") / 1048576
+
+
+class PicoMemoria:
+    """Pico de memoria residente mientras dura el bloque, muestreando cada `intervalo` s.
+
+    Al salir, `mb` queda con el máximo visto (o None si no se puede medir).
+    """
+
+    def __init__(self, intervalo=0.05):
+        self.intervalo = intervalo
+        self.mb = None
+        self._parar = threading.Event()
+        self._hilo = None
+
+    def _muestrear(self):
+        actual = rss_actual_mb()
+        if actual is not None: self.mb = max(self.mb or 0.0, actual)
+
+    def _bucle(self):
+        while not self._parar.wait(self.intervalo): self._muestrear()
+
+    def __enter__(self):
+        self._muestrear()
+        if self.mb is not None:
+            self._hilo = threading.Thread(target=self._bucle, name="pico-memoria", daemon=True)
+            self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        if self._hilo is not None: self._hilo.join()
+        self._muestrear()
+        if self.mb is not None: self.mb = round(self.mb, 1)
+        return False
+
+
+class Instrumentacion:
+    """Tiempo, filas y memoria pico de cada etapa de una corrida.
+
+    El pico de cada etapa es el de la memoria residente mientras corre
+    (PicoMemoria); si hay etapas a la vez en otros hilos, la incluye. El del
+    proceso entero va una sola vez en el reporte (rss_pico_proceso_mb).
+
+    `etapa(nombre)` es un context manager; dentro se puede anotar
+    registro["filas"]. `medir(nombre, funcion)` envuelve una función para
+    medirla desde otro hilo (las cargas en paralelo).
+
+    Con perfilar=True cada etapa además se corre bajo cProfile y
+    tracemalloc: se guarda un .prof por etapa, el top de asignaciones y el
+    reporte JSON en carpeta_perfiles.
+    """
+
+    def __init__(self, perfilar=False, carpeta_perfiles=None):
+        self.perfilar = perfilar
+        self.carpeta_perfiles = None
+        self.etapas = []
+        self._candado = threading.Lock()
+        self._inicio = time.perf_counter()
+        self._inicio_fecha = datetime.now()
+        self._tracemalloc_propio = False
+        if perfilar:
+            base = carpeta_perfiles or "perfiles"
+            self.carpeta_perfiles = os.path.join(base, self._inicio_fecha.strftime("%Y%m%d_%H%M%S_%f"))
+            os.makedirs(self.carpeta_perfiles, exist_ok=True)
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self._tracemalloc_propio = True
+
+    def _registrar(self, registro):
+        with self._candado: self.etapas.append(registro)
+
+    @contextmanager
+    def etapa(self, nombre, filas=None):
+        registro = {"etapa": nombre, "segundos": None, "filas": filas, "rss_pico_mb": None}
+        perfil = None
+        if self.perfilar:
+            tracemalloc.reset_peak()
+            perfil = cProfile.Profile()
+            perfil.enable()
+        pico = PicoMemoria()
+        inicio = time.perf_counter()
+        try:
+            with pico: yield registro
+        finally:
+            registro["segundos"] = round(time.perf_counter() - inicio, 4)
+            registro["rss_pico_mb"] = pico.mb
+            if perfil is not None:
+                perfil.disable()
+                registro["tracemalloc_pico_mb"] = round(tracemalloc.get_traced_memory()[1] / 1048576, 1)
+                ruta = os.path.join(self.carpeta_perfiles, f"{len(self.etapas):02d}_{nombre}.prof")
+                perfil.dump_stats(ruta)
+                registro["perfil"] = ruta
+            self._registrar(registro)
+
+    def medir(self, nombre, funcion):
+        # Para hilos: solo tiempo (cProfile y reset_peak son por proceso/hilo principal)
+        def envuelta(*args, **kwargs):
+            pico = PicoMemoria()
+            inicio = time.perf_counter()
+            try:
+                with pico: return funcion(*args, **kwargs)
+            finally:
+                self._registrar({"etapa": nombre, "segundos": round(time.perf_counter() - inicio, 4),
+                                 "filas": None, "rss_pico_mb": pico.mb, "hilo": threading.current_thread().name})
+        return envuelta
+
+    def registrar_externa(self, registro):
+        """Etapa medida en otro proceso (ver etapas.py): se agrega tal cual."""
+        self._registrar(dict(registro))
+
+    def reporte(self):
+        with self._candado: etapas = [dict(e) for e in self.etapas]
+        return {
+            "inicio": self._inicio_fecha.isoformat(timespec="seconds"),
+            "segundos_total": round(time.perf_counter() - self._inicio, 4),
+            "rss_pico_proceso_mb": rss_pico_mb(),
+            "etapas": etapas,
+            "carpeta_perfiles": self.carpeta_perfiles,
+        }
+
+    def resumen_texto(self):
+        lineas = []
+        for e in self.reporte()["etapas"]:
+            partes = [f"⏱️ {e['etapa']}: {e['segundos']:.2f} s"]
+            if e.get("filas") is not None: partes.append(f"{e['filas']} filas")
+            if e.get("celdas") is not None: partes.append(f"{e['celdas']} celdas")
+            if e.get("rss_pico_mb") is not None: partes.append(f"pico {e['rss_pico_mb']} MB")
+            if e.get("proceso"): partes.append("en paralelo")
+            lineas.append(" · ".join(partes))
+        return lineas
+
+    def cerrar(self):
+        """Guarda el reporte (y el top de asignaciones) si se está perfilando."""
+        reporte = self.reporte()
+        if self.perfilar:
+            if tracemalloc.is_tracing():
+                top = tracemalloc.take_snapshot().statistics("lineno")[:30]
+                with open(os.path.join(self.carpeta_perfiles, "tracemalloc_top.txt"), "w", encoding="utf-8") as f:
+                    f.write("\n".join(str(s) for s in top))
+                if self._tracemalloc_propio: tracemalloc.stop()
+            with open(os.path.join(self.carpeta_perfiles, "reporte.json"), "w", encoding="utf-8") as f:
+                json.dump(reporte, f, ensure_ascii=False, indent=2)
+        return reporte
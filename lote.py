@@ -0,0 +1,165 @@
+"""Procesamiento por lotes sin interfaz.
+
+Uso:
+    python lote.py "sucursales/*.xlsx" otro.xlsx --salida resultados --procesos 4
+
+Diccionario y tasas se cargan una sola vez en el proceso principal y se
+comparten con los trabajadores; cada libro se guarda como
+<nombre>_procesado.xlsx y al final se escribe resumen_lote.json.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+
+# ==========================================
+# 📦 RECURSOS COMPARTIDOS DEL LOTE
+# ==========================================
+# Recursos del proceso trabajador (se arman una vez en _iniciar_trabajador)
+_RECURSOS = None
+
+def cargar_recursos_lote(callback_log=print):
+    """Reglas del diccionario, histórico de tasas y tasa de hoy (una sola vez por lote)."""
+    import app
+    reglas_cuentas, reglas_areas, _ = app.cargar_diccionario()
+    historico = app.cargar_tasas_historicas(callback_log)
+    tasa_hoy = app.consultar_tasa_oficial_hoy(callback_log)
+    return {"reglas_cuentas": reglas_cuentas, "reglas_areas": reglas_areas,
+            "historico": historico, "tasa_hoy": tasa_hoy}
+
+def _iniciar_trabajador(datos):
+    global _RECURSOS
+    import app
+    _RECURSOS = {
+        "clasificador": app.ClasificadorProveedores(datos["reglas_cuentas"], datos["reglas_areas"]),
+        "calendario": app.CalendarioTasas(datos["historico"]),
+        "tasa_hoy": datos["tasa_hoy"],
+    }
+
+def _procesar_libro(ruta_entrada, destino):
+    from app import lógica_negocio
+    logs, reporte = [], {}
+    inicio = time.perf_counter()
+    try:
+        archivo, texto = lógica_negocio(ruta_entrada, logs.append, lambda p: None,
+                                        destino=destino, recursos=_RECURSOS, callback_reporte=reporte.update)
+    except Exception as e:
+        archivo, texto = False, f"❌ Error técnico: {str(e)}"
+    return {
+        "entrada": ruta_entrada,
+        "salida": archivo or None,
+        "ok": bool(archivo),
+        "segundos": round(time.perf_counter() - inicio, 3),
+        "mensajes": [m for m in texto.split("\n") if m],
+        "logs": logs,
+        "reporte": reporte,
+    }
+
+# ==========================================
+# 🗂️ ENTRADAS Y SALIDAS
+# ==========================================
+def expandir_entradas(patrones):
+    """Archivos .xlsx de una lista de rutas, carpetas o comodines (sin repetir)."""
+    rutas = []
+    for patron in patrones:
+        if os.path.isdir(patron):
+            encontrados = sorted(glob.glob(os.path.join(patron, "*.xlsx")))
+        else:
+            encontrados = sorted(glob.glob(patron)) or ([patron] if os.path.exists(patron) else [])
+        for ruta in encontrados:
+            nombre = os.path.basename(ruta)
+            # Archivos temporales de Excel abierto ("~$libro.xlsx")
+            if nombre.startswith("~$") or not nombre.lower().endswith(".xlsx"): continue
+            ruta = os.path.abspath(ruta)
+            if ruta not in rutas: rutas.append(ruta)
+    return rutas
+
+def nombres_salida(entradas, carpeta):
+    """<nombre>_procesado.xlsx por entrada; si dos libros se llaman igual se numeran."""
+    usados = set()
+    salidas = []
+    for ruta in entradas:
+        base = os.path.splitext(os.path.basename(ruta))[0] + "_procesado"
+        nombre, n = base, 2
+        while nombre.lower() in usados:
+            nombre = f"{base}_{n}"
+            n += 1
+        usados.add(nombre.lower())
+        salidas.append(os.path.join(carpeta, nombre + ".xlsx"))
+    return salidas
+
+# ==========================================
+# 🚚 EJECUCIÓN DEL LOTE
+# ==========================================
+def procesar_lote(entradas, carpeta_salida, procesos=None, callback_log=print):
+    """Procesa todos los libros en un pool de procesos y devuelve el resumen."""
+    os.makedirs(carpeta_salida, exist_ok=True)
+    inicio = time.perf_counter()
+    callback_log(f"🧠 Cargando diccionario y tasas para {len(entradas)} libro(s)...")
+    datos = cargar_recursos_lote(callback_log)
+    procesos = max(1, min(procesos or os.cpu_count() or 1, len(entradas) or 1))
+
+    resultados = []
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto,
+                             initializer=_iniciar_trabajador, initargs=(datos,)) as pool:
+        futuros = {pool.submit(_procesar_libro, entrada, salida): entrada
+                   for entrada, salida in zip(entradas, nombres_salida(entradas, carpeta_salida))}
+        for futuro in as_completed(futuros):
+            try: resultado = futuro.result()
+            except Exception as e:
+                resultado = {"entrada": futuros[futuro], "salida": None, "ok": False, "segundos": None,
+                             "mensajes": [f"❌ Error técnico: {str(e)}"], "logs": [], "reporte": {}}
+            estado = "✅" if resultado["ok"] else "❌"
+            callback_log(f"{estado} {os.path.basename(resultado['entrada'])} ({resultado['segundos']} s)")
+            resultados.append(resultado)
+
+    resultados.sort(key=lambda r: entradas.index(r["entrada"]))
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "procesos": procesos,
+        "libros": len(resultados),
+        "correctos": sum(r["ok"] for r in resultados),
+        "fallidos": sum(not r["ok"] for r in resultados),
+        "segundos_total": round(time.perf_counter() - inicio, 3),
+        "tasa_hoy": datos["tasa_hoy"],
+        "resultados": resultados,
+    }
+
+def imprimir_resumen(resumen):
+    print("\n" + "=" * 60)
+    print(f"📊 {resumen['correctos']}/{resumen['libros']} libros procesados en {resumen['segundos_total']} s "
+          f"({resumen['procesos']} procesos)")
+    for r in resumen["resultados"]:
+        print(f"\n{'✅' if r['ok'] else '❌'} {os.path.basename(r['entrada'])} -> {r['salida'] or '-'} ({r['segundos']} s)")
+        for m in r["mensajes"]: print(f"   {m}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Procesa varios libros financieros sin la interfaz web.")
+    parser.add_argument("entradas", nargs="+", help="archivos .xlsx, carpetas o comodines (\"sucursales/*.xlsx\")")
+    parser.add_argument("-s", "--salida", default="resultados_lote", help="carpeta de salida (por defecto: resultados_lote)")
+    parser.add_argument("-p", "--procesos", type=int, default=None, help="procesos en paralelo (por defecto: uno por núcleo)")
+    args = parser.parse_args(argv)
+
+    entradas = expandir_entradas(args.entradas)
+    if not entradas:
+        print("⚠️ No se encontraron archivos .xlsx", file=sys.stderr)
+        return 2
+
+    resumen = procesar_lote(entradas, args.salida, args.procesos)
+    ruta_resumen = os.path.join(args.salida, "resumen_lote.json")
+    with open(ruta_resumen, "w", encoding="utf-8") as f:
+        json.dump(resumen, f, ensure_ascii=False, indent=2)
+    imprimir_resumen(resumen)
+    print(f"\n💾 Resumen guardado en {ruta_resumen}")
+    return 0 if resumen["fallidos"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
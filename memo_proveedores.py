@@ -0,0 +1,136 @@
+import os
+import sqlite3
+from collections import Counter
+from contextlib import closing
+
+from normalizacion import normalizar_texto
+
+# Origen de cada dato del memo
+ORIGEN_REGLA = "regla"   # lo resolvió el diccionario
+ORIGEN_LIBRO = "libro"   # ya venía en M/O del libro (a mano o de corridas anteriores)
+
+
+# ==========================================
+# 🧠 MEMO PERSISTENTE DE PROVEEDORES
+# ==========================================
+class MemoProveedores:
+    """Proveedor (texto normalizado) -> (categoría, área), guardado en SQLite por versión del diccionario.
+
+    Se usa en lugar del ClasificadorProveedores (misma interfaz: clasificar y
+    version). Un proveedor ya visto se resuelve con un dict; solo lo nuevo pasa
+    por el autómata y el resultado se recuerda. Las filas que ya traen M/O
+    (clasificadas a mano o en corridas anteriores) se anotan con `sembrar` y,
+    al `guardar`, lo más repetido por proveedor se aprende solo donde el
+    diccionario no da resultado: una regla que resuelve nunca se pisa.
+
+    `version` cambia cuando cambia lo aprendido del libro (revision), así el
+    modo incremental y la caché de resultados no reutilizan datos viejos.
+    """
+
+    def __init__(self, ruta, clasificador):
+        self.ruta = ruta
+        self.clasificador = clasificador
+        self.version_diccionario = clasificador.version
+        self._entradas = {}  # proveedor -> [categoria, area, origen_categoria, origen_area]
+        self._semillas = {}  # proveedor -> (texto original, Counter de categorías, Counter de áreas) de esta corrida
+        self._modificadas = set()
+        self._corregidos = 0  # datos del libro reemplazados por una regla (cambian la versión al guardar)
+        self.consultas = 0
+        self.aciertos = 0
+        self.aprendidos = 0
+
+        carpeta = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(carpeta, exist_ok=True)
+        with closing(self._conectar()) as con, con:
+            con.execute("CREATE TABLE IF NOT EXISTS memo (version TEXT, proveedor TEXT, categoria TEXT, area TEXT, "
+                        "origen_categoria TEXT, origen_area TEXT, PRIMARY KEY (version, proveedor))")
+            con.execute("CREATE TABLE IF NOT EXISTS revisiones (version TEXT PRIMARY KEY, revision INTEGER NOT NULL)")
+            for proveedor, *datos in con.execute(
+                    "SELECT proveedor, categoria, area, origen_categoria, origen_area FROM memo WHERE version = ?",
+                    (self.version_diccionario,)):
+                self._entradas[proveedor] = datos
+            fila = con.execute("SELECT revision FROM revisiones WHERE version = ?", (self.version_diccionario,)).fetchone()
+        self.revision = fila[0] if fila else 0
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=30)
+
+    @property
+    def version(self):
+        return f"{self.version_diccionario}.{self.revision}" if self.revision else self.version_diccionario
+
+    def clasificar(self, prov):
+        self.consultas += 1
+        clave = normalizar_texto(prov)
+        entrada = self._entradas.get(clave)
+        if entrada is not None and entrada[2] == entrada[3] == ORIGEN_REGLA:
+            self.aciertos += 1
+            return entrada[0], entrada[1]
+        if entrada is None: entrada = self._entradas[clave] = [None, None, None, None]
+        # Lo aprendido del libro vale solo mientras el diccionario no resuelva ese dato
+        vigente = True
+        for i, valor in enumerate(self.clasificador.clasificar(prov)):
+            if entrada[i + 2] == ORIGEN_LIBRO and not valor: continue
+            if entrada[i + 2] == ORIGEN_LIBRO and entrada[i] != valor: self._corregidos += 1
+            if entrada[i + 2] != ORIGEN_REGLA or entrada[i] != valor:
+                entrada[i], entrada[i + 2] = valor, ORIGEN_REGLA
+                self._modificadas.add(clave)
+                vigente = False
+        if vigente: self.aciertos += 1
+        return entrada[0], entrada[1]
+
+    def sembrar(self, proveedor, categoria, area):
+        """Anota una fila del libro que ya trae categoría y/o área (se aprende al guardar)."""
+        _, categorias, areas = self._semillas.setdefault(normalizar_texto(proveedor), (proveedor, Counter(), Counter()))
+        for valor, contador in ((categoria, categorias), (area, areas)):
+            if not valor: continue
+            texto = str(valor).strip()
+            if texto and not texto.startswith("="): contador[texto] += 1
+
+    def guardar(self):
+        """Vuelca lo aprendido y lo resuelto en esta corrida; devuelve cuántos datos del libro cambiaron."""
+        cambios_libro, self._corregidos = self._corregidos, 0
+        for clave, (proveedor, *contadores) in self._semillas.items():
+            reglas = self.clasificador.clasificar(proveedor)
+            entrada = self._entradas.setdefault(clave, [None, None, None, None])
+            for i, contador in enumerate(contadores):
+                # Si el diccionario lo resuelve manda la regla (aunque el libro diga otra cosa)
+                valor, origen = (reglas[i], ORIGEN_REGLA) if reglas[i] else (_mas_repetido(contador), ORIGEN_LIBRO)
+                if valor is None or (entrada[i] == valor and entrada[i + 2] == origen): continue
+                if entrada[i] != valor and ORIGEN_LIBRO in (origen, entrada[i + 2]): cambios_libro += 1
+                entrada[i], entrada[i + 2] = valor, origen
+                self._modificadas.add(clave)
+        self._semillas.clear()
+        if not self._modificadas: return 0
+
+        filas = [(self.version_diccionario, clave, *self._entradas[clave]) for clave in self._modificadas]
+        with closing(self._conectar()) as con, con:
+            con.executemany("INSERT INTO memo (version, proveedor, categoria, area, origen_categoria, origen_area) "
+                            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(version, proveedor) DO UPDATE SET "
+                            "categoria = excluded.categoria, area = excluded.area, "
+                            "origen_categoria = excluded.origen_categoria, origen_area = excluded.origen_area", filas)
+            if cambios_libro:
+                con.execute("INSERT INTO revisiones (version, revision) VALUES (?, 1) "
+                            "ON CONFLICT(version) DO UPDATE SET revision = revision + 1", (self.version_diccionario,))
+                self.revision = con.execute("SELECT revision FROM revisiones WHERE version = ?",
+                                            (self.version_diccionario,)).fetchone()[0]
+        self._modificadas.clear()
+        self.aprendidos += cambios_libro
+        return cambios_libro
+
+    def estadisticas(self):
+        return {
+            "consultas": self.consultas,
+            "aciertos": self.aciertos,
+            "tasa_aciertos": round(self.aciertos / self.consultas, 4) if self.consultas else None,
+            "proveedores": len(self._entradas),
+            "aprendidos": self.aprendidos,
+        }
+
+
+def _mas_repetido(contador):
+    # Valor con más apariciones; si hay empate no se aprende nada (decide el diccionario)
+    comunes = contador.most_common(2)
+    if not comunes: return None
+    if len(comunes) > 1 and comunes[0][1] == comunes[1][1]: return None
+    return comunes[0][0]
@@ -0,0 +1,81 @@
+import re
+import sys
+import unicodedata
+from functools import lru_cache
+
+
+# ==========================================
+# 🔤 NORMALIZACIÓN DE TEXTOS Y MONTOS (COMPARTIDA)
+# ==========================================
+_RE_MILES = re.compile(r"\d{1,3}(\.\d{3})+")
+
+def _normalizar(texto):
+    texto = str(texto).upper().strip()
+    if texto.isascii(): return texto
+    return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn')
+
+@lru_cache(maxsize=65536, typed=True)
+def _normalizar_memo(texto):
+    # Interna el resultado: los mismos bancos/cuentas comparten un único objeto str
+    return sys.intern(_normalizar(texto))
+
+def normalizar_texto(texto):
+    """Mayúsculas, sin espacios en los extremos y sin acentos ("Área " -> "AREA")."""
+    if not texto: return ""
+    try: return _normalizar_memo(texto)
+    except TypeError: return _normalizar(texto)
+
+@lru_cache(maxsize=65536)
+def _monto_desde_texto(texto):
+    txt = texto.strip().upper().replace("BS", "").replace("USD", "").replace(" ", "")
+    es_neg = False
+    if "(" in txt and ")" in txt:
+        es_neg = True
+        txt = txt.replace("(", "").replace(")", "")
+    if "." in txt and "," in txt:
+        # 1.234,56 -> punto de miles y coma decimal
+        txt = txt.replace(".", "").replace(",", ".")
+    elif "," in txt:
+        txt = txt.replace(",", ".")
+    elif _RE_MILES.fullmatch(txt.lstrip("-")):
+        # 1.000 / 12.345.678 -> solo puntos de miles
+        txt = txt.replace(".", "")
+    if not txt or txt == "-": return 0
+    try: return -float(txt) if es_neg else float(txt)
+    except ValueError: return 0
+
+def limpiar_monto(valor):
+    """Monto en formato venezolano -> float.
+
+    Acepta números, "1.234,56", "(2.000,00)" (negativo), sufijos "BS"/"USD",
+    "1.000" (miles) y "12.5" (decimal). Lo que no se entiende vale 0.
+    Las reglas quedan fijas en estos ejemplos (`python -m doctest normalizacion.py`):
+
+    >>> limpiar_monto("1.234,56"), limpiar_monto("-1.234,56")
+    (1234.56, -1234.56)
+    >>> limpiar_monto("(1.234,56) BS")      # paréntesis = negativo, sin sufijo
+    -1234.56
+    >>> limpiar_monto("1,5 USD")
+    1.5
+    >>> limpiar_monto("1.000"), limpiar_monto("12.345.678")   # puntos en grupos de 3: miles
+    (1000.0, 12345678.0)
+    >>> limpiar_monto("12.5"), limpiar_monto("1.5")           # si no, el punto es decimal
+    (12.5, 1.5)
+    >>> limpiar_monto("-"), limpiar_monto(""), limpiar_monto(None), limpiar_monto("N/A")
+    (0, 0, 0, 0)
+    >>> limpiar_monto(1500), limpiar_monto(12.5)
+    (1500.0, 12.5)
+    """
+    if valor is None or valor == "": return 0
+    if isinstance(valor, (int, float)): return float(valor)
+    return _monto_desde_texto(str(valor))
+
+def limpiar_montos(valores):
+    """Versión por lotes: cada valor distinto se interpreta una sola vez."""
+    vistos = {}
+    resultado = []
+    for v in valores:
+        clave = (type(v), v)
+        if clave not in vistos: vistos[clave] = limpiar_monto(v)
+        resultado.append(vistos[clave])
+    return resultado
@@ -0,0 +1,322 @@
+import json
+import threading
+import time
+from datetime import date
+
+from fechas import LectorFechas
+from normalizacion import limpiar_monto, normalizar_texto
+
+
+# ==========================================
+# 🔌 PROVEEDORES DE TASAS
+# ==========================================
+class ErrorProveedor(Exception):
+    """Falla de un proveedor. reintentable=False si reintentar no la arregla (clave rechazada, datos inválidos)."""
+
+    def __init__(self, mensaje, reintentable=True):
+        super().__init__(mensaje)
+        self.reintentable = reintentable
+
+
+class SinDatos(ErrorProveedor):
+    """El proveedor respondió bien pero no tiene lo pedido (o no se llegó a consultarlo).
+
+    No es culpa del proveedor: la cadena sigue con el próximo sin contarlo en su circuito.
+    """
+
+    def __init__(self, mensaje):
+        super().__init__(mensaje, reintentable=False)
+
+
+class ProveedorTasas:
+    """Fuente de tasas (Bs por USD).
+
+    Cada proveedor define lo que sabe dar:
+    - historico(desde=None, timeout=None) -> {"YYYY-MM-DD": usd}
+    - hoy(timeout=None) -> usd de hoy (o ErrorProveedor)
+    Lo que no define queda en None y la cadena lo salta. Solo a los
+    `remoto` se les aplican reintentos y circuito.
+    """
+    nombre = "proveedor"
+    remoto = False
+    historico = None
+    hoy = None
+
+
+def _json_de(respuesta):
+    if respuesta.status_code == 429 or respuesta.status_code >= 500:
+        raise ErrorProveedor(f"HTTP {respuesta.status_code}")
+    if respuesta.status_code != 200:
+        raise ErrorProveedor(f"HTTP {respuesta.status_code}", reintentable=False)
+    try: return respuesta.json()
+    except ValueError: raise ErrorProveedor("respuesta que no es JSON", reintentable=False)
+
+
+class ApiDolarVzla(ProveedorTasas):
+    """Histórico oficial de api.dolarvzla.com (con clave)."""
+    nombre = "dolarvzla"
+    remoto = True
+
+    def __init__(self, url, clave, sesion):
+        self.url = url
+        self.clave = clave
+        self.sesion = sesion
+
+    def historico(self, desde=None, timeout=None):
+        params = {"from": desde} if desde else None
+        data = _json_de(self.sesion.get(self.url, headers={"x-dolarvzla-key": self.clave}, params=params, timeout=timeout))
+        if isinstance(data, dict) and "rates" in data: lista = data["rates"]
+        elif isinstance(data, list): lista = data
+        else: lista = []
+        tasas = {}
+        for item in lista:
+            fecha, precio = item.get("date"), item.get("usd")
+            if not fecha or not precio: continue
+            fecha = str(fecha)[:10]
+            # La API puede ignorar el filtro: descartamos lo ya guardado
+            if desde and fecha < desde: continue
+            tasas[fecha] = float(precio)
+        return tasas
+
+    def hoy(self, timeout=None):
+        fecha = date.today().isoformat()
+        tasa = self.historico(fecha, timeout).get(fecha)
+        if not tasa: raise SinDatos("todavía no publica la tasa de hoy")
+        return tasa
+
+
+class ApiDolarApi(ProveedorTasas):
+    """Dólar oficial del día de ve.dolarapi.com (campo 'promedio')."""
+    nombre = "dolarapi"
+    remoto = True
+
+    def __init__(self, url, sesion):
+        self.url = url
+        self.sesion = sesion
+
+    def hoy(self, timeout=None):
+        data = _json_de(self.sesion.get(self.url, timeout=timeout))
+        try: tasa = float(data["promedio"])
+        except (KeyError, TypeError, ValueError): raise ErrorProveedor("respuesta sin 'promedio'", reintentable=False)
+        if tasa <= 0: raise ErrorProveedor(f"tasa inválida ({tasa})", reintentable=False)
+        return tasa
+
+
+class AlmacenLocal(ProveedorTasas):
+    """Lo ya descargado en el almacén SQLite (ver almacen_tasas.py)."""
+    nombre = "almacén local"
+
+    def __init__(self, almacen):
+        self.almacen = almacen
+
+    def historico(self, desde=None, timeout=None):
+        tasas = self.almacen.todas()
+        if not tasas: raise SinDatos("almacén vacío")
+        return tasas
+
+    def hoy(self, timeout=None):
+        tasa = self.almacen.tasa(date.today().isoformat())
+        if not tasa: raise SinDatos("sin tasa de hoy guardada")
+        return tasa
+
+
+class HojaComportamientoTasa(ProveedorTasas):
+    """Historial que el propio libro guarda en COMPORTAMIENTO TASA (A fecha, B moneda, C tasa).
+
+    `filas` es una función que devuelve las filas (valores) de la hoja; se
+    llama una sola vez y solo si se llega a este proveedor.
+    """
+    nombre = "hoja COMPORTAMIENTO TASA"
+
+    def __init__(self, filas):
+        self._filas = filas
+        self._tasas = None
+        self._candado = threading.Lock()
+
+    def _leer(self):
+        with self._candado:
+            if self._tasas is None:
+                lector = LectorFechas("COMPORTAMIENTO TASA A")
+                tasas = {}
+                for fila in self._filas():
+                    if len(fila) < 3: continue
+                    if fila[1] and "USD" not in normalizar_texto(fila[1]): continue
+                    fecha, tasa = lector.iso(fila[0]), limpiar_monto(fila[2])
+                    if fecha and tasa > 0: tasas[fecha] = tasa
+                self._tasas = tasas
+            return self._tasas
+
+    def historico(self, desde=None, timeout=None):
+        tasas = self._leer()
+        if not tasas: raise SinDatos("la hoja no tiene tasas")
+        return dict(tasas)
+
+    def hoy(self, timeout=None):
+        tasa = self._leer().get(date.today().isoformat())
+        if not tasa: raise SinDatos("la hoja no tiene la tasa de hoy")
+        return tasa
+
+
+# ==========================================
+# 🔁 CIRCUITO Y CADENA DE RESPALDO
+# ==========================================
+class Circuito:
+    """Cortacircuito de un proveedor remoto.
+
+    Tras `fallos_max` consultas fallidas seguidas queda abierto durante
+    `enfriamiento_s` segundos y el proveedor se salta sin esperar timeouts.
+    Al vencer se deja pasar una sola consulta de prueba (la que reserva el
+    turno; si no termina, el turno vence tras otro enfriamiento): si falla se
+    vuelve a abrir. Con `estado` (un objeto con leer_meta/guardar_meta/
+    reemplazar_meta, p. ej. el almacén de tasas) el estado y el turno de
+    prueba se comparten entre procesos.
+    """
+
+    def __init__(self, nombre, fallos_max=2, enfriamiento_s=300, estado=None):
+        self.clave = f"circuito:{nombre}"
+        self.fallos_max = fallos_max
+        self.enfriamiento_s = enfriamiento_s
+        self.estado = estado
+        self.fallos = 0
+        self.abierto_hasta = 0.0
+        self.probando_hasta = 0.0
+        self._candado = threading.Lock()
+
+    def _cargar(self):
+        # Devuelve el estado compartido tal como estaba (para reservar el turno de prueba)
+        if self.estado is None: return None
+        try:
+            crudo = self.estado.leer_meta(self.clave)
+            datos = json.loads(crudo or "{}")
+        except Exception: return None
+        self.fallos = int(datos.get("fallos", 0))
+        self.abierto_hasta = float(datos.get("abierto_hasta", 0))
+        self.probando_hasta = float(datos.get("probando_hasta", 0))
+        return crudo
+
+    def _serializar(self):
+        return json.dumps({"fallos": self.fallos, "abierto_hasta": self.abierto_hasta, "probando_hasta": self.probando_hasta})
+
+    def _guardar(self):
+        if self.estado is None: return
+        try: self.estado.guardar_meta(self.clave, self._serializar())
+        except Exception: pass
+
+    def disponible(self):
+        with self._candado:
+            crudo = self._cargar()
+            ahora = time.time()
+            if not self.abierto_hasta: return True
+            if ahora < self.abierto_hasta or ahora < self.probando_hasta: return False
+            # Venció el enfriamiento: pasa solo quien reserve el turno de prueba
+            self.probando_hasta = ahora + self.enfriamiento_s
+            if self.estado is None: return True
+            try: return self.estado.reemplazar_meta(self.clave, crudo, self._serializar())
+            except Exception: return False
+
+    def exito(self):
+        with self._candado:
+            self._cargar()
+            if self.fallos or self.abierto_hasta or self.probando_hasta:
+                self.fallos, self.abierto_hasta, self.probando_hasta = 0, 0.0, 0.0
+                self._guardar()
+
+    def fallo(self):
+        with self._candado:
+            self._cargar()
+            self.fallos += 1
+            if self.fallos >= self.fallos_max:
+                self.abierto_hasta = time.time() + self.enfriamiento_s
+                self.probando_hasta = 0.0
+            self._guardar()
+
+    def liberar(self):
+        """La consulta no dice nada de la salud del proveedor (SinDatos): suelta el turno de prueba."""
+        with self._candado:
+            self._cargar()
+            if self.probando_hasta:
+                self.probando_hasta = 0.0
+                self._guardar()
+
+
+# Circuitos por proveedor, vivos mientras viva el proceso (además del estado compartido)
+_CIRCUITOS = {}
+_candado_circuitos = threading.Lock()
+
+def obtener_circuito(nombre, fallos_max, enfriamiento_s, estado=None):
+    with _candado_circuitos:
+        circuito = _CIRCUITOS.get(nombre)
+        if circuito is None:
+            circuito = _CIRCUITOS[nombre] = Circuito(nombre, fallos_max, enfriamiento_s, estado)
+        circuito.fallos_max, circuito.enfriamiento_s = fallos_max, enfriamiento_s
+        if estado is not None: circuito.estado = estado
+        return circuito
+
+
+class CadenaTasas:
+    """Proveedores en orden de preferencia: responde el primero que puede.
+
+    A los remotos se los consulta con `timeout` por intento, hasta `intentos`
+    veces con espera exponencial (espera_base, 2x, 4x...), y con su circuito.
+    `presupuesto_s` acota el tiempo total de red de cada consulta a la
+    cadena: pasado ese tiempo se sigue directo con los locales.
+    """
+
+    def __init__(self, proveedores, timeout=5, intentos=2, espera_base=0.5, fallos_max=2,
+                 enfriamiento_s=300, presupuesto_s=12, estado=None):
+        self.proveedores = list(proveedores)
+        self.timeout = timeout
+        self.intentos = max(1, intentos)
+        self.espera_base = espera_base
+        self.presupuesto_s = presupuesto_s
+        self._circuitos = {p.nombre: obtener_circuito(p.nombre, fallos_max, enfriamiento_s, estado)
+                           for p in self.proveedores if p.remoto}
+
+    def historico(self, callback_log, desde=None):
+        """(tasas, nombre del proveedor) o ({}, None) si ninguno respondió."""
+        tasas, nombre = self._resolver("historico", callback_log, desde)
+        return (tasas or {}), nombre
+
+    def hoy(self, callback_log):
+        """(tasa, nombre del proveedor) o (0, None) si ninguno respondió."""
+        tasa, nombre = self._resolver("hoy", callback_log)
+        return (tasa or 0), nombre
+
+    def _resolver(self, metodo, callback_log, *args):
+        limite = time.monotonic() + self.presupuesto_s
+        for proveedor in self.proveedores:
+            funcion = getattr(proveedor, metodo)
+            if funcion is None: continue
+            circuito = self._circuitos.get(proveedor.nombre)
+            if circuito is not None and not circuito.disponible():
+                callback_log(f"⏭️ {proveedor.nombre}: falló hace poco, se salta por ahora.")
+                continue
+            try:
+                valor = self._llamar(proveedor, funcion, args, limite)
+            except SinDatos as e:
+                # Respondió (o no se llegó a preguntarle): no cuenta como falla
+                if circuito is not None: circuito.liberar()
+                callback_log(f"⚠️ {proveedor.nombre}: {str(e)}")
+                continue
+            except Exception as e:
+                if circuito is not None: circuito.fallo()
+                callback_log(f"⚠️ {proveedor.nombre}: {str(e)}")
+                continue
+            if circuito is not None: circuito.exito()
+            return valor, proveedor.nombre
+        return None, None
+
+    def _llamar(self, proveedor, funcion, args, limite):
+        if not proveedor.remoto: return funcion(*args)
+        for intento in range(self.intentos):
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                if intento == 0: raise SinDatos("se agotó el tiempo para consultar tasas")
+                raise ErrorProveedor("se agotó el tiempo para consultar tasas")
+            try:
+                return funcion(*args, timeout=min(self.timeout, restante))
+            except ErrorProveedor as e:
+                if not e.reintentable or intento + 1 == self.intentos: raise
+            except Exception:
+                if intento + 1 == self.intentos: raise
+            time.sleep(max(0.0, min(self.espera_base * 2 ** intento, limite - time.monotonic())))
@@ -0,0 +1,190 @@
+import io
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+
+# ==========================================
+# 🧵 COLA DE TRABAJOS EN SEGUNDO PLANO
+# ==========================================
+EN_COLA = "en cola"
+EJECUTANDO = "ejecutando"
+TERMINADO = "terminado"
+FALLIDO = "fallido"
+
+# Cola de eventos del proceso trabajador y tamaño de su cola (se asignan en _iniciar_trabajador)
+_EVENTOS = None
+_TRABAJADORES = 0
+
+def _iniciar_trabajador(eventos, trabajadores):
+    global _EVENTOS, _TRABAJADORES
+    _EVENTOS = eventos
+    _TRABAJADORES = trabajadores
+
+def trabajadores_cola():
+    """Procesos de la ColaTrabajos que corre este proceso (0 si no es uno de sus trabajadores)."""
+    return _TRABAJADORES
+
+def _ejecutar_trabajo(id_trabajo, contenido):
+    """Corre lógica_negocio en el proceso trabajador y reenvía logs/progreso al servidor.
+
+    Entrada y salida viajan en memoria: devuelve (bytes del resultado o None,
+    texto, logs, reporte, tasas usadas). Los eventos son para seguir el
+    avance en vivo; los logs y el reporte completos vuelven con el resultado,
+    porque la cola de eventos puede entregar los últimos después de él. Las
+    tasas usadas salen del reporte (ver app.tasas_de_corrida): None si la
+    corrida no tuvo la tasa de hoy de una API.
+    """
+    from app import lógica_negocio, tasas_de_corrida
+
+    logs, reportes = [], []
+    def emitir(tipo, valor):
+        _EVENTOS.put((id_trabajo, tipo, valor))
+    def log(msg):
+        logs.append(msg)
+        emitir("log", msg)
+    def reporte(r):
+        reportes.append(r)
+        emitir("reporte", r)
+
+    emitir("estado", EJECUTANDO)
+    salida = io.BytesIO()
+    try:
+        archivo, texto = lógica_negocio(io.BytesIO(contenido), log, lambda p: emitir("progreso", p),
+                                        destino=salida, callback_reporte=reporte)
+    except Exception as e:
+        archivo, texto = False, f"❌ Error técnico: {str(e)}"
+    resultado = salida.getvalue() if archivo else None
+    reporte_final = reportes[-1] if reportes else None
+    return resultado, texto, logs, reporte_final, tasas_de_corrida(reporte_final)
+
+
+class Trabajo:
+    def __init__(self, id_trabajo, nombre):
+        self.id = id_trabajo
+        self.nombre = nombre
+        self.estado = EN_COLA
+        self.progreso = 0.0
+        self.logs = []
+        self.resultado = None  # bytes del .xlsx procesado
+        self.texto = ""
+        self.reporte = None  # tiempos/memoria por etapa (ver instrumentacion.py)
+        self.desde_cache = False
+        self.creado = time.time()
+        self.terminado = None
+
+    @property
+    def finalizado(self):
+        return self.estado in (TERMINADO, FALLIDO)
+
+
+class ColaTrabajos:
+    """Cola de automatizaciones con un pool acotado de procesos.
+
+    El libro y el resultado viajan en memoria (nada se escribe en disco), así
+    varias ejecuciones a la vez no pisan el mismo archivo. Los trabajadores
+    mandan logs y progreso por una cola de eventos que un hilo del servidor
+    vuelca sobre cada Trabajo; la interfaz solo consulta ese estado.
+
+    Con `cache` (CacheResultados) un libro ya procesado con el mismo
+    diccionario y tasas se responde al instante.
+    """
+
+    def __init__(self, max_procesos=None, retencion_horas=2, cache=None):
+        self.max_procesos = max_procesos or os.cpu_count() or 1
+        self.retencion_horas = retencion_horas
+        self.cache = cache
+        # "spawn": el servidor de Streamlit tiene hilos vivos y no conviene hacer fork
+        contexto = multiprocessing.get_context("spawn")
+        self._eventos = contexto.Queue()
+        self._pool = ProcessPoolExecutor(max_workers=self.max_procesos, mp_context=contexto,
+                                         initializer=_iniciar_trabajador, initargs=(self._eventos, self.max_procesos))
+        self._trabajos = {}
+        self._en_curso = {}  # clave de caché -> id del trabajo que ya la está calculando
+        self._candado = threading.Lock()
+        threading.Thread(target=self._recibir_eventos, name="eventos-trabajos", daemon=True).start()
+
+    def enviar(self, contenido, nombre="archivo.xlsx", clave=None, clave_con_tasas=None):
+        """Encola un libro (bytes) y devuelve el id del trabajo.
+
+        clave (ver cache_resultados.clave_resultado): si ya hay un resultado
+        guardado se devuelve un trabajo terminado, y si el mismo libro ya está
+        en cola o ejecutándose se reutiliza ese trabajo.
+        clave_con_tasas (opcional): tasas -> clave; el resultado se guarda con
+        la de las tasas que usó el trabajo (pudo actualizarlas), no con `clave`,
+        y no se guarda si el trabajo no devuelve tasas (corrió sin la de hoy).
+        """
+        self._limpiar_vencidos()
+        trabajo = Trabajo(uuid.uuid4().hex[:12], nombre)
+        cacheado = self.cache.obtener(clave) if self.cache is not None and clave else None
+        if cacheado:
+            trabajo.resultado, trabajo.texto, trabajo.reporte = cacheado["resultado"], cacheado["texto"], cacheado["reporte"]
+            trabajo.logs = cacheado["logs"] + ["⚡ Resultado tomado de la caché (mismo libro, diccionario y tasas)"]
+            trabajo.estado, trabajo.progreso, trabajo.desde_cache = TERMINADO, 1.0, True
+            trabajo.terminado = time.time()
+            with self._candado: self._trabajos[trabajo.id] = trabajo
+            return trabajo.id
+
+        with self._candado:
+            if clave in self._en_curso: return self._en_curso[clave]
+            self._trabajos[trabajo.id] = trabajo
+            if clave: self._en_curso[clave] = trabajo.id
+        futuro = self._pool.submit(_ejecutar_trabajo, trabajo.id, contenido)
+        futuro.add_done_callback(lambda f: self._finalizar(trabajo, f, clave, clave_con_tasas))
+        return trabajo.id
+
+    def obtener(self, id_trabajo):
+        with self._candado: return self._trabajos.get(id_trabajo)
+
+    def resumen(self):
+        """Cantidad de trabajos por estado."""
+        with self._candado:
+            conteo = {EN_COLA: 0, EJECUTANDO: 0, TERMINADO: 0, FALLIDO: 0}
+            for t in self._trabajos.values(): conteo[t.estado] += 1
+        return conteo
+
+    def cerrar(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        self._eventos.put(None)
+
+    def _recibir_eventos(self):
+        while True:
+            try: evento = self._eventos.get()
+            except (EOFError, OSError): return
+            if evento is None: return
+            id_trabajo, tipo, valor = evento
+            with self._candado:
+                trabajo = self._trabajos.get(id_trabajo)
+                # Terminado, ya tiene los logs y el reporte definitivos (vienen con el resultado)
+                if trabajo is None or trabajo.finalizado: continue
+                if tipo == "log": trabajo.logs.append(valor)
+                elif tipo == "reporte": trabajo.reporte = valor
+                elif tipo == "progreso": trabajo.progreso = float(valor)
+                elif tipo == "estado": trabajo.estado = valor
+
+    def _finalizar(self, trabajo, futuro, clave=None, clave_con_tasas=None):
+        try: resultado, texto, logs, reporte, fecha_tasas = futuro.result()
+        except Exception as e: resultado, texto, logs, reporte, fecha_tasas = None, f"❌ Error técnico: {str(e)}", None, None, None
+        with self._candado:
+            trabajo.resultado = resultado
+            trabajo.texto = texto
+            if logs is not None: trabajo.logs = logs
+            if reporte is not None: trabajo.reporte = reporte
+            trabajo.estado = TERMINADO if resultado is not None else FALLIDO
+            if resultado is not None: trabajo.progreso = 1.0
+            trabajo.terminado = time.time()
+            self._en_curso.pop(clave, None)
+            logs, reporte = list(trabajo.logs), trabajo.reporte
+        if clave_con_tasas: clave = clave_con_tasas(fecha_tasas) if fecha_tasas else None
+        if resultado is not None and clave and self.cache is not None:
+            self.cache.guardar(clave, resultado, texto, reporte, logs)
+
+    def _limpiar_vencidos(self):
+        if self.retencion_horas <= 0: return
+        limite = time.time() - self.retencion_horas * 3600
+        with self._candado:
+            vencidos = [t for t in self._trabajos.values() if t.finalizado and t.terminado < limite]
+            for t in vencidos: del self._trabajos[t.id]